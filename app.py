@@ -7,18 +7,35 @@ import logging
 import threading
 import datetime
 import re
+import hashlib
+import shutil
 import requests as http_requests
 from pathlib import Path
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from flask import Flask, request, jsonify, redirect, Response, g
+from flask import Flask, request, jsonify, Response, g, has_app_context, make_response
 from flask_cors import CORS
 from functools import wraps
 from collections import deque
+from urllib.parse import quote, unquote_plus, urlsplit
+from html import escape
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
 import uuid
 from datetime import datetime as dt
-from bs4 import BeautifulSoup
+import jinja2
 from dotenv import load_dotenv
+import outbound
+import metrics as telemetry  # `metrics` is used throughout for POP metric dicts
+import profiling
+import scoring
+import backfills
+import migrations
+import dbpool
+import storage
+import ingest
+import sendqueue
+import sequences
+import tracking_links
+import webhooks
 
 # Load .env for local dev
 env_path = Path(__file__).resolve().parent.parent / ".env"
@@ -28,119 +45,191 @@ if env_path.exists():
 app = Flask(__name__)
 CORS(app)
 logging.basicConfig(level=logging.INFO)
+outbound.observers.append(telemetry.observe_upstream)
 
 # --- Shared Config ---
 API_KEY = os.environ.get("API_KEY")  # Email relay key
 RESEND_API_KEY = os.environ.get("RESEND_API_KEY")
+RESEND_BASE = os.environ.get("RESEND_BASE", "https://api.resend.com")
 FROM_ADDRESS = os.environ.get("FROM_ADDRESS", "milo@seodesignlab.com")
-TRACKER_KEY = os.environ.get("TRACKER_KEY", "sdl-email-2026")
+TRACKER_KEY = os.environ.get("TRACKER_KEY", "sdl-email-2026")  # HMAC secret for signed tracking links
+TRACKING_BASE_URL = os.environ.get("TRACKING_BASE_URL", "")  # public origin for tracked links; default: the request's host; follow-ups need it set to be tracked
+LEGACY_TRACKING = os.environ.get("LEGACY_TRACKING", "0") == "1"  # honor unsigned /t/open?id= links, and /t/click?url= to a stored link or allowed host
+LEGACY_CLICK_HOSTS = tuple(h.strip().lower() for h in os.environ.get("LEGACY_CLICK_HOSTS", "").split(",") if h.strip())  # hosts (and their subdomains) old /t/click links may redirect to; they predate stored links
+LINK_CACHE_SIZE = int(os.environ.get("LINK_CACHE_SIZE", "10000"))  # emails whose link tables each worker keeps in memory
+CAMPAIGN_MAX_RECIPIENTS = int(os.environ.get("CAMPAIGN_MAX_RECIPIENTS", "10000"))  # per /send_batch call
+CAMPAIGN_BATCH_SIZE = int(os.environ.get("CAMPAIGN_BATCH_SIZE", "100"))  # emails per Resend batch call (Resend max: 100)
+SEND_QUEUE_WORKERS = int(os.environ.get("SEND_QUEUE_WORKERS", "2"))  # concurrent Resend batch calls per worker
+RESEND_WEBHOOK_SECRET = os.environ.get("RESEND_WEBHOOK_SECRET", "")  # whsec_... signing secret; unset: webhooks refused
+WEBHOOK_TOLERANCE = int(os.environ.get("WEBHOOK_TOLERANCE", "300"))  # max age (s) of a webhook's signed timestamp
+SUPPRESSION_REFRESH = float(os.environ.get("SUPPRESSION_REFRESH", "60"))  # reload bounced/complained addresses this often
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", "86400"))  # how long a /send Idempotency-Key is remembered
+IDEMPOTENCY_STALE = float(os.environ.get("IDEMPOTENCY_STALE", "120"))  # in-flight claim older than this was abandoned
+SEQUENCES_ENABLED = os.environ.get("SEQUENCES_ENABLED", "1") == "1"  # run the follow-up scheduler in this deployment
+SEQUENCE_BATCH = int(os.environ.get("SEQUENCE_BATCH", "500"))  # due enrollments decided per scheduler tick
+SEQUENCE_IDLE = float(os.environ.get("SEQUENCE_IDLE", "30"))  # max seconds between scheduler ticks
+FUNNEL_REFRESH = float(os.environ.get("FUNNEL_REFRESH", "60"))  # /api/funnel refreshes its aggregate when older than this
+HEALTH_CACHE_TTL = float(os.environ.get("HEALTH_CACHE_TTL", "5"))  # seconds a readiness result is reused per worker
+HEALTH_TIMEOUT = float(os.environ.get("HEALTH_TIMEOUT", "2"))  # readiness fails when its checks take longer
+HEALTH_MIN_FREE_MB = float(os.environ.get("HEALTH_MIN_FREE_MB", "256"))  # readiness fails below this much free disk
 
 # Prospector config
 PROSPECTOR_KEY = os.environ.get("PROSPECTOR_KEY", "sdl-prospector-2026")
 DATAFORSEO_LOGIN = os.environ.get("DATAFORSEO_LOGIN", "")
 DATAFORSEO_PASSWORD = os.environ.get("DATAFORSEO_PASSWORD", "")
+DATAFORSEO_BASE = os.environ.get("DATAFORSEO_BASE", "https://api.dataforseo.com/v3")
 OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY", "")
+OPENROUTER_BASE = os.environ.get("OPENROUTER_BASE", "https://openrouter.ai/api/v1")
+PITCH_MODEL = os.environ.get("PITCH_MODEL", "anthropic/claude-3-haiku")
+PITCH_CONCURRENCY = int(os.environ.get("PITCH_CONCURRENCY", "4"))  # max parallel OpenRouter calls per batch
+PITCH_TOKENS_PER_MIN = int(os.environ.get("PITCH_TOKENS_PER_MIN", "40000"))  # shared token budget across batches
+PITCH_BATCH_MAX = int(os.environ.get("PITCH_BATCH_MAX", "200"))
+PITCH_BATCH_DEADLINE = float(os.environ.get("PITCH_BATCH_DEADLINE", "90"))  # seconds; unfinished pitches come back "deferred"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")  # /metrics and /health/deep take "Authorization: Bearer <token>" or X-API-Key
 POP_API_KEY = os.environ.get("POP_API_KEY", "ADD_ON_0cee5c62d39a7736")
-POP_BASE = "https://app.pageoptimizer.pro/api"
+POP_BASE = os.environ.get("POP_BASE", "https://app.pageoptimizer.pro/api")
+POP_POLL_INTERVAL = float(os.environ.get("POP_POLL_INTERVAL", "3"))  # seconds between task result polls
+POP_POLL_TIMEOUT = float(os.environ.get("POP_POLL_TIMEOUT", "600"))  # give up on one POP task after this long
+POP_RETRY_DELAY = float(os.environ.get("POP_RETRY_DELAY", "10"))  # wait before retrying a failed create-report
+POP_AUDIT_WAIT = float(os.environ.get("POP_AUDIT_WAIT", "20"))  # /api/pop_audit answers 202 with a job_id after this long
 
 # DB paths - use /data on Render (persistent disk), else local
 DB_DIR = "/data" if os.path.isdir("/data") else os.path.dirname(os.path.abspath(__file__))
 TRACKING_DB_PATH = os.environ.get("DB_PATH", os.path.join(DB_DIR, "tracking.db"))
-PROSPECTS_DB_PATH = os.path.join(DB_DIR, "prospects.db")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(DB_DIR, "profiles"))
+PROSPECTS_DB_PATH = os.environ.get("PROSPECTS_DB_PATH", os.path.join(DB_DIR, "prospects.db"))
+PROSPECTS_READ_POOL = int(os.environ.get("PROSPECTS_READ_POOL", "8"))  # read-only connections per worker
+DB_BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", "15"))  # seconds to wait for another writer's lock
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite")  # "postgres" shares state across instances
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+PG_POOL_MAX = int(os.environ.get("PG_POOL_MAX", "10"))  # connections per worker process
+EVENT_FLUSH_INTERVAL = float(os.environ.get("EVENT_FLUSH_INTERVAL", "0.5"))  # max delay before a tracked event is written
+EVENT_BATCH_MAX = int(os.environ.get("EVENT_BATCH_MAX", "500"))  # flush early once this many events are waiting
 
 
 # ============================================================
 # EMAIL TRACKING DB
 # ============================================================
 
+def connect_db(path, name, readonly=False, shared=False):
+    """Open a SQLite connection whose statements are timed into /metrics.
+
+    Inside a profiled request the connection also traces every statement,
+    unless it is `shared` (pooled or owned by a writer thread, so it outlives
+    the request). Read-only connections cannot take the write lock.
+    """
+    session = None if shared else profiling.current()
+    target, kwargs = (f"file:{path}?mode=ro", {"uri": True}) if readonly else (path, {})
+    kwargs["timeout"] = DB_BUSY_TIMEOUT
+    if shared:
+        kwargs["check_same_thread"] = False
+    if session is None:
+        db = sqlite3.connect(target, factory=telemetry.InstrumentedConnection, **kwargs)
+    else:
+        db = sqlite3.connect(target, factory=profiling.ProfiledConnection, **kwargs)
+        db.session = session
+        db.set_trace_callback(session.on_sql)
+    if readonly:
+        db.execute("PRAGMA query_only=1")
+    db.db_name = name
+    return db
+
+
 def get_tracking_db():
-    db = sqlite3.connect(TRACKING_DB_PATH)
+    db = connect_db(TRACKING_DB_PATH, "tracking")
     db.row_factory = sqlite3.Row
-    db.execute('''CREATE TABLE IF NOT EXISTS emails (
-        id TEXT PRIMARY KEY,
-        subject TEXT,
-        recipient TEXT,
-        recipient_name TEXT,
-        client TEXT,
-        sent_at TEXT,
-        resend_id TEXT
-    )''')
-    db.execute('''CREATE TABLE IF NOT EXISTS events (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email_id TEXT,
-        event_type TEXT,
-        url TEXT,
-        ip TEXT,
-        user_agent TEXT,
-        timestamp TEXT
-    )''')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_events_email ON events(email_id)')
-    db.commit()
     return db
 
 
+def init_tracking_db():
+    conn = connect_db(TRACKING_DB_PATH, "tracking")
+    migrations.migrate(conn, migrations.TRACKING)
+    conn.close()
+
+
 # ============================================================
 # PROSPECTS DB
 # ============================================================
 
+# prospects.db runs in WAL mode. SQLiteStorage reads through get_prospects_db()
+# (read-only, pooled) and writes through write_prospects(), which hands the work
+# to this process's single writer thread; see dbpool.py.
+
+def _open_prospects(readonly, shared):
+    db = connect_db(PROSPECTS_DB_PATH, "prospects", readonly=readonly, shared=shared)
+    db.row_factory = sqlite3.Row
+    if not readonly:
+        db.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+    return db
+
+prospects_reads = dbpool.ReadPool(lambda: _open_prospects(readonly=True, shared=True), PROSPECTS_READ_POOL)
+prospects_writer = dbpool.Writer(lambda: _open_prospects(readonly=False, shared=True), "prospects")
+
+
+def write_prospects(fn, *args):
+    """Run fn(db, *args) on the prospects writer and return its result; fn must not commit."""
+    return prospects_writer.run(fn, *args)
+
+
 def get_prospects_db():
+    """Read-only prospects connection for this request."""
     if "prospects_db" not in g:
-        g.prospects_db = sqlite3.connect(PROSPECTS_DB_PATH)
-        g.prospects_db.row_factory = sqlite3.Row
+        if profiling.current():
+            g.prospects_db = _open_prospects(readonly=True, shared=False)  # traced; not returned to the pool
+        else:
+            g.prospects_db = prospects_reads.acquire()
+            g.prospects_db_pooled = True
     return g.prospects_db
 
 @app.teardown_appcontext
 def close_prospects_db(exc):
     db = g.pop("prospects_db", None)
-    if db:
+    if db is None:
+        return
+    if g.pop("prospects_db_pooled", False):
+        prospects_reads.release(db)
+    else:
         db.close()
 
 def init_prospects_db():
-    conn = sqlite3.connect(PROSPECTS_DB_PATH)
-    conn.executescript("""
-    CREATE TABLE IF NOT EXISTS prospects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        business_name TEXT,
-        website TEXT UNIQUE,
-        phone TEXT,
-        address TEXT,
-        city TEXT,
-        state TEXT,
-        niche TEXT,
-        rating REAL,
-        reviews INTEGER,
-        seo_score INTEGER DEFAULT 0,
-        prospect_score INTEGER DEFAULT 0,
-        prospect_status TEXT DEFAULT 'new',
-        issues TEXT,
-        has_ssl INTEGER DEFAULT 0,
-        pitch_subject TEXT,
-        pitch_body TEXT,
-        pitch_date TEXT,
-        sent_date TEXT,
-        contact_method TEXT,
-        response_date TEXT,
-        pop_report_data TEXT,
-        pop_audit_date TEXT,
-        pop_score INTEGER,
-        pop_word_count_current INTEGER DEFAULT 0,
-        pop_word_count_target INTEGER DEFAULT 0,
-        search_query TEXT,
-        created_at TEXT DEFAULT (datetime('now')),
-        updated_at TEXT DEFAULT (datetime('now'))
-    );
-    CREATE TABLE IF NOT EXISTS searches (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        query TEXT,
-        niche TEXT,
-        location TEXT,
-        result_count INTEGER,
-        created_at TEXT DEFAULT (datetime('now'))
-    );
-    """)
+    conn = connect_db(PROSPECTS_DB_PATH, "prospects")
+    dbpool.enable_wal(conn)
+    migrations.migrate(conn, migrations.PROSPECTS)
     conn.close()
 
-init_prospects_db()
+
+@contextmanager
+def read_prospects():
+    if has_app_context():
+        yield get_prospects_db()
+    else:
+        with prospects_reads.connection() as db:
+            yield db
+
+
+# ============================================================
+# STORAGE
+# ============================================================
+
+# Handlers use `store` (storage.py) for prospects, searches, emails and events.
+# Under gunicorn the app is preloaded (gunicorn.conf.py), so migrations run once
+# in the master. Workers fork after that. The subsystems have no initializers of
+# their own; their objects are built at import and are cheap, and what is
+# per-process starts in the worker on first use:
+#   relay       campaign_queue sender threads, on the first batch or sequence send
+#   tracking    event_buffer flusher, on the first tracked hit
+#   webhooks    webhook_buffer flusher, on the first Resend event
+#   prospector  prospects_writer thread and read pool; bs4 on the first /api/analyze
+#   POP         one thread per audit, when it is started
+#   proposals   nothing of its own
+# Each upstream's HTTP session (outbound.upstream) is created on its first call.
+# Follow-up sequences are the exception: start_background_jobs() starts them.
+if STORAGE_BACKEND == "postgres":
+    store = storage.PostgresStorage(DATABASE_URL, max_size=PG_POOL_MAX)
+else:
+    init_tracking_db()
+    init_prospects_db()
+    store = storage.SQLiteStorage(read_prospects, write_prospects, get_tracking_db, prospects_path=PROSPECTS_DB_PATH)
 
 
 # ============================================================
@@ -156,9 +245,11 @@ PIXEL_GIF = bytes([
     0x01,0x00,0x3b
 ])
 
-# Rate limiting - 10 emails per minute
+# Rate limiting - 10 emails per minute (per worker) by default. /send and sequence steps
+# take one slot per email; /send_batch takes one per request, and its queued sends are
+# paced by Resend itself (429 -> the queue waits Retry-After) and SEND_QUEUE_WORKERS.
 send_times = deque()
-RATE_LIMIT = 10
+RATE_LIMIT = int(os.environ.get("SEND_RATE_LIMIT", "10"))
 RATE_WINDOW = 60
 
 def now_str():
@@ -181,6 +272,79 @@ def require_api_key(f):
     return decorated
 
 
+def require_ops_auth(f):
+    """Auth for /metrics and /health/deep: the METRICS_TOKEN bearer if one is set, or the relay API key."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        bearer_ok = METRICS_TOKEN and request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"
+        key_ok = API_KEY and request.headers.get("X-API-Key") == API_KEY
+        if not (bearer_ok or key_ok):
+            return jsonify({"error": "Unauthorized"}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+
+idempotency_purged_at = 0.0
+
+
+def idempotent(f):
+    """Answer a repeated Idempotency-Key (or, without one, a repeated JSON tracking_id)
+    with the first request's stored 2xx response instead of running `f` again.
+
+    Keys live in tracking.db, so every worker sees them. A repeat that arrives
+    while the first request is still running gets 409; one with a different body
+    gets 422. Non-2xx outcomes release the key so the client can retry.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        global idempotency_purged_at
+        key = request.headers.get("Idempotency-Key", "").strip()
+        if not key:
+            data = request.get_json(silent=True)
+            key = f"tracking_id:{data['tracking_id']}" if isinstance(data, dict) and data.get("tracking_id") else ""
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"error": "Idempotency-Key too long (max 255)"}), 400
+        key = f"{request.path}:{key}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()[:32]
+        now = time.time()
+        try:
+            if now - idempotency_purged_at > 300:
+                idempotency_purged_at = now
+                store.purge_requests(now - IDEMPOTENCY_TTL)
+            seen = store.claim_request(key, fingerprint, now, IDEMPOTENCY_TTL, IDEMPOTENCY_STALE)
+        except Exception as e:
+            app.logger.error(f"Idempotency store unavailable, handling request without it: {e}")
+            return f(*args, **kwargs)
+        if seen is not None:
+            if seen["fingerprint"] != fingerprint:
+                telemetry.IDEMPOTENT_REPEATS.labels("conflict").inc()
+                return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+            if not seen["status"]:
+                telemetry.IDEMPOTENT_REPEATS.labels("in_progress").inc()
+                return jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409, {"Retry-After": "5"}
+            telemetry.IDEMPOTENT_REPEATS.labels("replayed").inc()
+            return Response(seen["response"], status=seen["status"], mimetype="application/json",
+                            headers={"Idempotent-Replayed": "true"})
+
+        g.idempotency_key = key
+        try:
+            resp = make_response(f(*args, **kwargs))
+        except Exception:
+            store.release_request(key)
+            raise
+        try:
+            if 200 <= resp.status_code < 300:
+                store.finish_request(key, resp.status_code, resp.get_data(as_text=True))
+            else:
+                store.release_request(key)
+        except Exception as e:
+            app.logger.error(f"Idempotency key {key} not recorded: {e}")
+        return resp
+    return decorated
+
+
 def require_prospector_key(f):
     """Auth for prospector endpoints."""
     @wraps(f)
@@ -205,15 +369,69 @@ def check_rate_limit():
     return True
 
 
+def free_send_slots():
+    """Sends the rate limit would allow right now (the caller appends to send_times as it uses them)."""
+    now = time.time()
+    while send_times and send_times[0] < now - RATE_WINDOW:
+        send_times.popleft()
+    return max(0, RATE_LIMIT - len(send_times))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get("request_start")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        telemetry.HTTP_LATENCY.labels(route).observe(time.perf_counter() - start)
+        telemetry.HTTP_REQUESTS.labels(route, request.method, response.status_code).inc()
+    return response
+
+
+def profile_requested():
+    """`X-Profile: <prospector key>` header, or `?profile=1` (or `inline`) plus the prospector key."""
+    token = request.headers.get("X-Profile")
+    if token:
+        return token == PROSPECTOR_KEY
+    if "profile" in request.args:
+        return PROSPECTOR_KEY in (request.args.get("key"), request.headers.get("X-API-Key"))
+    return False
+
+
+@app.before_request
+def start_profile():
+    if ("profile" in request.args or "X-Profile" in request.headers) and profile_requested():
+        args = "&".join(f"{k}={v}" for k, v in request.args.items(multi=True) if k != "key")
+        g.profile = profiling.start(f"{request.method} {request.path}" + (f"?{args}" if args else ""))
+
+
+@app.after_request
+def finish_profile(response):
+    session = g.pop("profile", None)
+    if session is None:
+        return response
+    data = profiling.store(profiling.stop(session), PROFILE_DIR)
+    if request.args.get("profile") == "inline":
+        return jsonify({"status_code": response.status_code, "profile": data})
+    response.headers["X-Profile-Id"] = session.id
+    return response
+
+
 # ============================================================
 # EMAIL RELAY ENDPOINTS
 # ============================================================
 
 @app.route("/send", methods=["POST"])
 @require_api_key
+@idempotent
 def send_email():
     if not check_rate_limit():
-        return jsonify({"error": "Rate limit exceeded (10/min)"}), 429
+        telemetry.RATE_LIMITED.labels("send").inc()
+        return jsonify({"error": f"Rate limit exceeded ({RATE_LIMIT}/min)"}), 429
 
     data = request.get_json()
     if not data:
@@ -231,6 +449,22 @@ def send_email():
         return jsonify({"error": "'to' field is required"}), 400
     if not body and not html:
         return jsonify({"error": "'body' or 'html' required"}), 400
+    try:
+        blocked = suppressions.suppressed([to, cc, bcc])
+    except Exception as e:
+        app.logger.error(f"Suppression list unavailable: {e}")
+        return jsonify({"error": "Suppression list unavailable, retry later"}), 503
+    if blocked:
+        return jsonify({"error": "Recipient suppressed after a hard bounce or complaint", "suppressed": blocked}), 422
+
+    # With a tracking_id, links and the open pixel are rewritten to signed tracking URLs
+    tracking_id = data.get("tracking_id")
+    links = None
+    if tracking_id and html:
+        base = escape(tracking_base())
+        html, links = tracking_links.rewrite_html(
+            html, lambda n: f"{base}/t/c/{signer.click_token(tracking_id, n)}",
+            f"{base}/t/o/{signer.open_token(tracking_id)}")
 
     try:
         payload = {
@@ -248,12 +482,16 @@ def send_email():
         if bcc:
             payload["bcc"] = [a.strip() for a in bcc.split(",")] if isinstance(bcc, str) else bcc
 
-        resp = http_requests.post(
-            "https://api.resend.com/emails",
-            headers={
-                "Authorization": f"Bearer {RESEND_API_KEY}",
-                "Content-Type": "application/json",
-            },
+        headers = {
+            "Authorization": f"Bearer {RESEND_API_KEY}",
+            "Content-Type": "application/json",
+        }
+        if g.get("idempotency_key"):
+            # Resend dedupes too, covering a send whose response we never got
+            headers["Idempotency-Key"] = hashlib.sha256(g.idempotency_key.encode()).hexdigest()
+        resp = outbound.post(
+            "resend", f"{RESEND_BASE}/emails",
+            headers=headers,
             json=payload,
             timeout=30,
         )
@@ -263,25 +501,28 @@ def send_email():
             resend_id = result.get("id", "")
             app.logger.info(f"Email sent to={to} subject={subject} id={resend_id}")
 
-            tracking_id = data.get("tracking_id")
             if tracking_id:
                 try:
-                    db = get_tracking_db()
-                    db.execute(
-                        "INSERT OR REPLACE INTO emails (id, subject, recipient, recipient_name, client, sent_at, resend_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                        (tracking_id, subject, to if isinstance(to, str) else ",".join(to), data.get("recipient_name", ""), data.get("client", ""), dt.utcnow().isoformat(), resend_id)
-                    )
-                    db.commit()
-                    db.close()
+                    store.register_email({
+                        "id": tracking_id, "subject": subject, "recipient": to if isinstance(to, str) else ",".join(to),
+                        "recipient_name": data.get("recipient_name", ""), "client": data.get("client", ""),
+                        "sent_at": dt.utcnow().isoformat(), "resend_id": resend_id,
+                        "prospect_id": data.get("prospect_id")}, links=links)
+                    if links:
+                        link_cache.put(tracking_id, links)
                 except Exception as e:
                     app.logger.error(f"Auto-register tracking error: {e}")
 
-            return jsonify({"success": True, "message": f"Email sent to {to}", "id": resend_id, "tracking_id": tracking_id})
+            return jsonify({"success": True, "message": f"Email sent to {to}", "id": resend_id, "tracking_id": tracking_id,
+                            "tracked_links": len(links) if links is not None else 0})
         else:
             error = resp.json() if resp.headers.get("content-type", "").startswith("application/json") else {"message": resp.text}
             app.logger.error(f"Resend error: {resp.status_code} {error}")
             return jsonify({"error": error.get("message", str(error)), "status_code": resp.status_code}), 502
 
+    except outbound.CircuitOpenError as e:
+        app.logger.error(f"Send skipped: {e}")
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         app.logger.error(f"Send failed: {e}")
         return jsonify({"error": str(e)}), 500
@@ -291,58 +532,144 @@ def send_email():
 # EMAIL TRACKING ENDPOINTS
 # ============================================================
 
-@app.route("/t/open", methods=["GET"])
-def track_open():
-    email_id = request.args.get("id", "")
-    if email_id:
-        try:
-            db = get_tracking_db()
-            db.execute(
-                "INSERT INTO events (email_id, event_type, ip, user_agent, timestamp) VALUES (?, ?, ?, ?, ?)",
-                (email_id, "open", request.remote_addr or "", request.headers.get("User-Agent", ""), dt.utcnow().isoformat())
-            )
-            db.commit()
-            db.close()
-        except Exception as e:
-            app.logger.error(f"Track open error: {e}")
-    return Response(PIXEL_GIF, mimetype="image/gif", headers={"Cache-Control": "no-cache, no-store, must-revalidate"})
+# Tracking hits skip Flask entirely: tracking_fast_path() answers them straight
+# from the WSGI environ (no request context, CORS, hooks or teardown) and queues
+# the event on event_buffer, which writes batches in the background. Signed
+# /t/o/ and /t/c/ tokens are checked before anything else (tracking_links.py).
+event_buffer = ingest.EventBuffer(store.record_events, interval=EVENT_FLUSH_INTERVAL, batch_max=EVENT_BATCH_MAX)
+signer = tracking_links.Signer(TRACKER_KEY)
+link_cache = tracking_links.LinkCache(store.email_links, size=LINK_CACHE_SIZE)
+
+PIXEL_HEADERS = [("Content-Type", "image/gif"), ("Content-Length", str(len(PIXEL_GIF))),
+                 ("Cache-Control", "no-cache, no-store, must-revalidate")]
+NOT_FOUND = ("404 NOT FOUND", [("Content-Length", "0")], b"")
+REDIRECT_SAFE = "/:?#[]@!$&'()*+,;=%~"  # kept as-is in Location; anything else (spaces, CR/LF, non-ASCII) is escaped
+
+
+def tracking_params(query):
+    """First `id` and `url` values from a raw query string; everything else is ignored."""
+    params = {}
+    for pair in query.split("&"):
+        key, _, value = pair.partition("=")
+        if (key == "id" or key == "url") and key not in params:
+            params[key] = unquote_plus(value)
+    return params
+
+
+def tracking_base():
+    return TRACKING_BASE_URL or request.host_url.rstrip("/")
+
+
+def tracked_urls(email_id, links, base):
+    """Signed pixel URL and click URLs (in link order) for an email."""
+    return (f"{base}/t/o/{signer.open_token(email_id)}",
+            [f"{base}/t/c/{signer.click_token(email_id, n)}" for n in range(len(links))])
+
+
+def redirect_to(url):
+    return "302 FOUND", [("Location", quote(url, safe=REDIRECT_SAFE)), ("Content-Length", "0")], b""
+
+
+def track_hit(route, environ):
+    """Answer one GET/HEAD tracking hit: (metric route, (status, headers, body), event or None)."""
+    if route.startswith("/t/o/"):
+        email_id = signer.verify_open(tracking_links.path_token(route, "/t/o/"))
+        if email_id is None:
+            telemetry.TRACKING_REJECTED.labels("/t/o/<token>").inc()
+            return "/t/o/<token>", ("200 OK", PIXEL_HEADERS, PIXEL_GIF), None  # still a pixel; nothing recorded
+        return "/t/o/<token>", ("200 OK", PIXEL_HEADERS, PIXEL_GIF), (email_id, "open", None)
+    if route.startswith("/t/c/"):
+        hit = signer.verify_click(tracking_links.path_token(route, "/t/c/"))
+        if hit is None:
+            telemetry.TRACKING_REJECTED.labels("/t/c/<token>").inc()
+            return "/t/c/<token>", NOT_FOUND, None
+        email_id, n = hit
+        links = link_cache.get(email_id)
+        if n >= len(links):
+            return "/t/c/<token>", NOT_FOUND, None
+        return "/t/c/<token>", redirect_to(links[n]), (email_id, "click", links[n])
+
+    # Unsigned links from emails sent before tokens existed
+    params = tracking_params(environ.get("QUERY_STRING", ""))
+    email_id, url = params.get("id", ""), params.get("url", "")
+    if not LEGACY_TRACKING:
+        telemetry.TRACKING_REJECTED.labels(route).inc()
+        return route, ("200 OK", PIXEL_HEADERS, PIXEL_GIF) if route == "/t/open" else NOT_FOUND, None
+    if route == "/t/open":
+        return route, ("200 OK", PIXEL_HEADERS, PIXEL_GIF), (email_id, "open", None) if email_id else None
+    if not url:
+        return route, ("400 BAD REQUEST", [("Content-Type", "text/plain; charset=utf-8"), ("Content-Length", "11")], b"Missing url"), None
+    # Only to a link registered for that email or to an allowed host, so the route is no open redirect
+    if not legacy_click_allowed(email_id, url):
+        telemetry.TRACKING_REJECTED.labels(route).inc()
+        return route, NOT_FOUND, None
+    return route, redirect_to(url), (email_id, "click", url) if email_id else None
 
 
-@app.route("/t/click", methods=["GET"])
-def track_click():
-    email_id = request.args.get("id", "")
-    url = request.args.get("url", "")
-    if not url:
-        return "Missing url", 400
-    if email_id:
-        try:
-            db = get_tracking_db()
-            db.execute(
-                "INSERT INTO events (email_id, event_type, url, ip, user_agent, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-                (email_id, "click", url, request.remote_addr or "", request.headers.get("User-Agent", ""), dt.utcnow().isoformat())
-            )
-            db.commit()
-            db.close()
-        except Exception as e:
-            app.logger.error(f"Track click error: {e}")
-    return redirect(url)
+def legacy_click_allowed(email_id, url):
+    """Whether an unsigned /t/click may redirect to `url`.
+
+    Emails sent before links were stored have no rows in `links`, so their
+    targets are checked against LEGACY_CLICK_HOSTS instead. With no hosts
+    configured, those old links get a 404.
+    """
+    if email_id and url in link_cache.get(email_id):
+        return True
+    if "\\" in url or any(ord(c) < 32 for c in url):
+        return False  # browsers read a backslash as "/" and drop tabs and newlines, so the host could differ
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        return False
+    return parts.scheme in ("http", "https") and any(host == h or host.endswith("." + h) for h in LEGACY_CLICK_HOSTS)
+
+
+def tracking_fast_path(wsgi_app):
+    """Wrap the Flask WSGI app so tracking hits never reach it."""
+    def dispatch(environ, start_response):
+        route = environ.get("PATH_INFO", "")
+        if not (route.startswith("/t/o/") or route.startswith("/t/c/") or route == "/t/open" or route == "/t/click"):
+            return wsgi_app(environ, start_response)
+        started = time.perf_counter()
+        method = environ.get("REQUEST_METHOD", "GET")
+        if method != "GET" and method != "HEAD":
+            label = route if route in ("/t/open", "/t/click") else route[:5] + "<token>"
+            (status, headers, body), event = ("405 METHOD NOT ALLOWED", [("Allow", "GET, HEAD"), ("Content-Length", "0")], b""), None
+        else:
+            label, (status, headers, body), event = track_hit(route, environ)
+        if event:
+            event_buffer.add(event + (environ.get("REMOTE_ADDR", ""), environ.get("HTTP_USER_AGENT", ""), dt.utcnow().isoformat()))
+        start_response(status, headers)
+        telemetry.HTTP_LATENCY.labels(label).observe(time.perf_counter() - started)
+        telemetry.HTTP_REQUESTS.labels(label, method, status[:3]).inc()
+        return [body] if method != "HEAD" else []
+    return dispatch
+
+
+app.wsgi_app = tracking_fast_path(app.wsgi_app)
 
 
 @app.route("/t/register", methods=["POST"])
 @require_api_key
 def register_email():
+    """Register an email for tracking. With `links` (target URLs), returns the signed pixel and click URLs to use."""
     data = request.get_json()
     if not data or not data.get("id"):
         return jsonify({"error": "Missing email id"}), 400
+    links = data.get("links")
+    if links is not None and (not isinstance(links, list) or not all(isinstance(u, str) and u for u in links)):
+        return jsonify({"error": "'links' must be a list of URLs"}), 400
     try:
-        db = get_tracking_db()
-        db.execute(
-            "INSERT OR REPLACE INTO emails (id, subject, recipient, recipient_name, client, sent_at, resend_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (data["id"], data.get("subject", ""), data.get("recipient", ""), data.get("recipient_name", ""), data.get("client", ""), data.get("sent_at", dt.utcnow().isoformat()), data.get("resend_id", ""))
-        )
-        db.commit()
-        db.close()
-        return jsonify({"ok": True, "id": data["id"]})
+        store.register_email({
+            "id": data["id"], "subject": data.get("subject", ""), "recipient": data.get("recipient", ""),
+            "recipient_name": data.get("recipient_name", ""), "client": data.get("client", ""),
+            "sent_at": data.get("sent_at", dt.utcnow().isoformat()), "resend_id": data.get("resend_id", ""),
+            "prospect_id": data.get("prospect_id")}, links=links)
+        pixel_url, link_urls = tracked_urls(data["id"], links or [], tracking_base())
+        if links is not None:
+            link_cache.put(data["id"], links)
+        return jsonify({"ok": True, "id": data["id"], "pixel_url": pixel_url, "links": link_urls})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -351,22 +678,8 @@ def register_email():
 @require_api_key
 def analytics():
     try:
-        db = get_tracking_db()
-        rows = db.execute('''
-            SELECT e.*,
-                (SELECT COUNT(*) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'open') as opens,
-                (SELECT COUNT(DISTINCT ip) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'open') as unique_opens,
-                (SELECT COUNT(*) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'click') as clicks,
-                (SELECT MIN(timestamp) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'open') as first_open,
-                (SELECT MAX(timestamp) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'open') as last_open
-            FROM emails e ORDER BY e.sent_at DESC
-        ''').fetchall()
-        emails = [dict(row) for row in rows]
-
-        total_sent = db.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
-        total_opened = db.execute("SELECT COUNT(DISTINCT email_id) FROM events WHERE event_type = 'open'").fetchone()[0]
-        total_clicks = db.execute("SELECT COUNT(*) FROM events WHERE event_type = 'click'").fetchone()[0]
-        db.close()
+        emails, totals = store.email_analytics()
+        total_sent, total_opened, total_clicks = totals["total_sent"], totals["total_opened"], totals["total_clicks"]
 
         return jsonify({
             "total_sent": total_sent,
@@ -383,16 +696,414 @@ def analytics():
 @require_api_key
 def email_detail(email_id):
     try:
-        db = get_tracking_db()
-        email = db.execute("SELECT * FROM emails WHERE id = ?", (email_id,)).fetchone()
-        events = db.execute("SELECT * FROM events WHERE email_id = ? ORDER BY timestamp DESC", (email_id,)).fetchall()
-        db.close()
-        return jsonify({
-            "email": dict(email) if email else None,
-            "events": [dict(e) for e in events]
-        })
+        email, events = store.email_detail(email_id)
+        return jsonify({"email": email, "events": events})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ============================================================
+# CAMPAIGNS
+# ============================================================
+# /send_batch renders one template per recipient, registers every email (and
+# its tracked links) in one transaction and returns; campaign_queue
+# (sendqueue.py) then sends them through Resend's batch endpoint in the
+# background. GET /campaigns/<id> reports progress from tracking.db.
+
+campaign_html = jinja2.Environment(autoescape=True, undefined=jinja2.StrictUndefined)
+campaign_text = jinja2.Environment(autoescape=False, undefined=jinja2.StrictUndefined)  # subject and plain text
+
+
+def retry_after(resp, default=1.0):
+    try:
+        return max(float(resp.headers.get("Retry-After", default)), 0.0)
+    except ValueError:
+        return default
+
+
+def send_resend_batch(payloads, key):
+    """One Resend batch call; returns the new email ids in payload order."""
+    try:
+        resp = outbound.post(
+            "resend", f"{RESEND_BASE}/emails/batch",
+            headers={
+                "Authorization": f"Bearer {RESEND_API_KEY}",
+                "Content-Type": "application/json",
+                "Idempotency-Key": key,
+            },
+            json=payloads,
+            timeout=30,
+        )
+    except outbound.CircuitOpenError as e:
+        raise sendqueue.Retry(e.retry_in, str(e))
+    if resp.status_code == 429:
+        raise sendqueue.Retry(retry_after(resp), "Resend rate limit")
+    if resp.status_code not in (200, 201):
+        raise RuntimeError(f"Resend batch error {resp.status_code}: {resp.text[:200]}")
+    return [item.get("id", "") for item in resp.json().get("data", [])]
+
+
+def record_campaign_outcomes(rows):
+    store.mark_emails(rows)
+    for status, *_ in rows:
+        telemetry.CAMPAIGN_EMAILS.labels(status).inc()
+
+
+campaign_queue = sendqueue.SendQueue(send_resend_batch, record_campaign_outcomes,
+                                     batch_size=CAMPAIGN_BATCH_SIZE, workers=SEND_QUEUE_WORKERS)
+
+
+def campaign_request():
+    """(campaign, recipients) from a JSON body with a "recipients" list, or from an
+    NDJSON stream: the campaign on the first line, then one recipient per line."""
+    if request.mimetype == "application/x-ndjson":
+        lines = (line for line in request.stream if line.strip())
+        first = next(lines, None)
+        return (json.loads(first) if first else None), (json.loads(line) for line in lines)
+    campaign = request.get_json(silent=True)
+    return campaign, iter(campaign.get("recipients") or [] if isinstance(campaign, dict) else [])
+
+
+@app.route("/send_batch", methods=["POST"])
+@require_api_key
+def send_batch():
+    """Queue one templated email per recipient. Each recipient's fields are its
+    template variables ({{ name }}, {{ company }}, ...); "to" is required.
+
+    The request takes one SEND_RATE_LIMIT slot, not one per recipient: that
+    limit is sized for single sends. The campaign's emails are throttled only
+    by Resend's rate limit, which campaign_queue honours, and by
+    CAMPAIGN_MAX_RECIPIENTS per request."""
+    if not check_rate_limit():
+        telemetry.RATE_LIMITED.labels("send").inc()
+        return jsonify({"error": f"Rate limit exceeded ({RATE_LIMIT}/min)"}), 429
+
+    try:
+        spec, recipients = campaign_request()
+    except ValueError:
+        return jsonify({"error": "Invalid JSON on the first line"}), 400
+    if not isinstance(spec, dict):
+        return jsonify({"error": "JSON body required"}), 400
+    if not spec.get("html") and not spec.get("text"):
+        return jsonify({"error": "'html' or 'text' template required"}), 400
+    try:
+        subject_t = campaign_text.from_string(spec.get("subject", ""))
+        html_t = campaign_html.from_string(spec["html"]) if spec.get("html") else None
+        text_t = campaign_text.from_string(spec["text"]) if spec.get("text") else None
+    except jinja2.TemplateSyntaxError as e:
+        return jsonify({"error": f"Template error on line {e.lineno}: {e.message}"}), 400
+
+    campaign_id = f"cmp_{uuid.uuid4().hex[:16]}"
+    from_addr = spec.get("from", FROM_ADDRESS)
+    track = spec.get("track", True) and html_t is not None
+    base = escape(tracking_base())
+    emails, links, messages, rejected = [], {}, [], []
+    i = -1
+    try:
+        for i, r in enumerate(recipients):
+            if i >= CAMPAIGN_MAX_RECIPIENTS:
+                return jsonify({"error": f"Too many recipients (max {CAMPAIGN_MAX_RECIPIENTS})"}), 413
+            try:
+                to = r.get("to") if isinstance(r, dict) else None
+                if not isinstance(to, str) or "@" not in to:
+                    raise ValueError("'to' must be an email address")
+                if suppressions.suppressed([to]):
+                    raise ValueError("suppressed after a hard bounce or complaint")
+                email_id = f"{campaign_id}-{i}"
+                payload = {"from": from_addr, "to": [to.strip()], "subject": subject_t.render(r)}
+                if html_t:
+                    html = html_t.render(r)
+                    if track:
+                        html, links[email_id] = tracking_links.rewrite_html(
+                            html, lambda n: f"{base}/t/c/{signer.click_token(email_id, n)}",
+                            f"{base}/t/o/{signer.open_token(email_id)}")
+                    payload["html"] = html
+                if text_t:
+                    payload["text"] = text_t.render(r)
+            except (ValueError, jinja2.TemplateError) as e:
+                rejected.append({"index": i, "error": str(e)})
+                continue
+            emails.append({"id": email_id, "subject": payload["subject"], "recipient": to.strip(),
+                           "recipient_name": r.get("name", ""), "client": spec.get("client", ""),
+                           "campaign_id": campaign_id, "status": "queued", "prospect_id": r.get("prospect_id")})
+            messages.append((email_id, payload))
+    except ValueError:
+        return jsonify({"error": "Invalid JSON for a recipient", "index": i + 1}), 400
+
+    if not messages:
+        return jsonify({"error": "No valid recipients", "rejected": rejected[:100]}), 400
+    try:
+        store.create_campaign({"id": campaign_id, "subject": spec.get("subject", ""), "from_addr": from_addr,
+                               "client": spec.get("client", ""), "created_at": dt.utcnow().isoformat(),
+                               "total": len(messages)}, emails, links)
+    except Exception as e:
+        app.logger.error(f"Campaign registration failed: {e}")
+        return jsonify({"error": str(e)}), 500
+    campaign_queue.submit(campaign_id, messages)
+    app.logger.info(f"Campaign {campaign_id} queued {len(messages)} emails ({len(rejected)} rejected)")
+    return jsonify({"campaign_id": campaign_id, "queued": len(messages), "rejected": rejected[:100],
+                    "rejected_count": len(rejected), "progress_url": f"/campaigns/{campaign_id}"}), 202
+
+
+@app.route("/campaigns/<campaign_id>", methods=["GET"])
+@require_api_key
+def campaign_status(campaign_id):
+    try:
+        campaign = store.campaign_progress(campaign_id)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if not campaign:
+        return jsonify({"error": "Campaign not found"}), 404
+    counts = campaign.pop("counts")
+    queued = counts.get("queued", 0)
+    return jsonify(dict(campaign, queued=queued, sent=counts.get("sent", 0), failed=counts.get("failed", 0),
+                        done=queued == 0))
+
+
+# ============================================================
+# RESEND WEBHOOKS
+# ============================================================
+# Delivery, bounce, complaint, open and click events from Resend (webhooks.py).
+# Verified events are queued on webhook_buffer and written in batches, like
+# tracking hits. Hard bounces and complaints also suppress the address, in the
+# suppressions table, which every worker reloads every SUPPRESSION_REFRESH seconds.
+
+webhook_buffer = ingest.EventBuffer(store.record_resend_events, interval=EVENT_FLUSH_INTERVAL,
+                                    batch_max=EVENT_BATCH_MAX, name="webhooks")
+webhook_ids = webhooks.RecentIds()
+suppressions = webhooks.Suppressions(store.suppressed_recipients, refresh=SUPPRESSION_REFRESH)
+
+
+@app.route("/webhooks/resend", methods=["POST"])
+def resend_webhook():
+    if not RESEND_WEBHOOK_SECRET:
+        return jsonify({"error": "RESEND_WEBHOOK_SECRET not configured"}), 503
+    body = request.get_data()
+    try:
+        webhooks.verify(RESEND_WEBHOOK_SECRET, request.headers, body, tolerance=WEBHOOK_TOLERANCE)
+        event = json.loads(body)
+    except webhooks.SignatureError as e:
+        telemetry.WEBHOOK_EVENTS.labels("rejected").inc()
+        return jsonify({"error": str(e)}), 401
+    except ValueError:
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    msg_id = request.headers["svix-id"]
+    if not webhook_ids.add(msg_id):
+        telemetry.WEBHOOK_EVENTS.labels("duplicate").inc()
+        return jsonify({"ok": True, "duplicate": True})
+    row = webhooks.event_row(event) if isinstance(event, dict) else None
+    if row is None:
+        telemetry.WEBHOOK_EVENTS.labels("ignored").inc()
+        return jsonify({"ok": True, "ignored": True})
+    if row[1] in webhooks.SUPPRESSING:
+        # Stored before answering, by address: the email may have been sent without a tracking id
+        blocked = webhooks.addresses(event["data"].get("to") or [])
+        try:
+            store.suppress([(a, row[1], row[5] or dt.utcnow().isoformat()) for a in blocked])
+        except Exception as e:
+            app.logger.error(f"Suppression not stored, Resend will retry: {e}")
+            webhook_ids.discard(msg_id)
+            return jsonify({"error": "Suppression not stored, retry later"}), 503
+        suppressions.add(blocked)
+    if not webhook_buffer.add(row):
+        webhook_ids.discard(msg_id)  # so Resend's retry isn't taken for a duplicate
+        return jsonify({"error": "Ingestion backlog full, retry later"}), 503
+    telemetry.WEBHOOK_EVENTS.labels(row[1]).inc()
+    return jsonify({"ok": True})
+
+
+# ============================================================
+# FOLLOW-UP SEQUENCES
+# ============================================================
+# sequences.py: enrollments are due at a time, and a scheduler tick decides
+# a batch of them at once. It sends through campaign_queue, within the /send
+# rate limit. Follow-ups share that per-worker budget with /send and
+# /send_batch, and only the lease holder sends them.
+
+step_templates = {}  # (sequence id, step) -> compiled (subject, html, text)
+
+
+def compiled_step(sequence_id, n, step):
+    key = (sequence_id, n)
+    if key not in step_templates:
+        step_templates[key] = (campaign_text.from_string(step["subject"]),
+                               campaign_html.from_string(step["html"]) if step.get("html") else None,
+                               campaign_text.from_string(step["text"]) if step.get("text") else None)
+    return step_templates[key]
+
+
+def run_sequences(now):
+    """One scheduler tick: decide up to SEQUENCE_BATCH due enrollments and queue their emails.
+    Returns when to tick again."""
+    due, next_due = store.due_enrollments(now, SEQUENCE_BATCH)
+    if not due:
+        return next_due
+    slots = free_send_slots()
+    defs = {sid: (row, json.loads(row["steps"])) for sid, row in store.get_sequences(list({e["sequence_id"] for e in due})).items()}
+    engagement = store.engagement([e["last_email_id"] for e in due if e["last_email_id"]])
+    prospects = store.prospect_contacts([e["prospect_id"] for e in due if e["prospect_id"]])
+    blocked = set(suppressions.suppressed([e["recipient"] for e in due]))
+    base = escape(TRACKING_BASE_URL)
+    updates, emails, links, messages = [], [], {}, []
+    deferred = False
+    for e in due:
+        seq, steps = defs.get(e["sequence_id"], (None, []))
+        if e["step"] >= len(steps):
+            updates.append((e["step"], "done", None, e["last_email_id"], e["last_sent_at"], e["id"]))
+            continue
+        step = steps[e["step"]]
+        prospect = prospects.get(e["prospect_id"]) or {}
+        verdict = sequences.decide(e, step, engagement.get(e["last_email_id"], sequences.NO_ENGAGEMENT),
+                                   bool(prospect.get("response_date")), e["recipient"].lower() in blocked)
+        last_email_id, last_sent_at = e["last_email_id"], e["last_sent_at"]
+        if verdict == "send":
+            if len(messages) >= slots:
+                deferred = True  # stays due until the rate limit has room
+                continue
+            email_id = f"{e['sequence_id']}-{e['id']}-{e['step']}"
+            context = dict(prospect, **json.loads(e["vars"] or "{}"), to=e["recipient"])
+            try:
+                subject_t, html_t, text_t = compiled_step(e["sequence_id"], e["step"], step)
+                payload = {"from": seq["from_addr"] or FROM_ADDRESS, "to": [e["recipient"]], "subject": subject_t.render(context)}
+                if html_t and base:
+                    payload["html"], links[email_id] = tracking_links.rewrite_html(
+                        html_t.render(context), lambda n: f"{base}/t/c/{signer.click_token(email_id, n)}",
+                        f"{base}/t/o/{signer.open_token(email_id)}")
+                elif html_t:
+                    payload["html"] = html_t.render(context)  # no public origin: Resend's own events only
+                if text_t:
+                    payload["text"] = text_t.render(context)
+            except jinja2.TemplateError as ex:
+                app.logger.error(f"Sequence {e['sequence_id']} step {e['step']} for enrollment {e['id']}: {ex}")
+                links.pop(email_id, None)
+                updates.append((e["step"], "failed", None, last_email_id, last_sent_at, e["id"]))
+                continue
+            last_email_id, last_sent_at = email_id, dt.utcnow().isoformat()
+            emails.append({"id": email_id, "subject": payload["subject"], "recipient": e["recipient"],
+                           "recipient_name": context.get("name", ""), "client": context.get("client", ""),
+                           "campaign_id": e["sequence_id"], "status": "queued", "prospect_id": e["prospect_id"]})
+            messages.append((email_id, payload))
+        nxt = e["step"] + 1
+        if verdict == "stop":
+            updates.append((e["step"], "stopped", None, last_email_id, last_sent_at, e["id"]))
+        elif nxt >= len(steps):
+            updates.append((nxt, "done", None, last_email_id, last_sent_at, e["id"]))
+        else:
+            updates.append((nxt, "active", now + steps[nxt].get("after_days", 0) * 86400, last_email_id, last_sent_at, e["id"]))
+
+    store.advance_enrollments(updates, emails, links)
+    if messages:
+        send_times.extend([time.time()] * len(messages))
+        campaign_queue.submit(f"seq-{uuid.uuid4().hex[:12]}", messages)
+    for verdict in ("stopped", "done", "failed"):
+        n = sum(1 for u in updates if u[1] == verdict)
+        if n:
+            telemetry.SEQUENCE_ENROLLMENTS.labels(verdict).inc(n)
+    telemetry.SEQUENCE_ENROLLMENTS.labels("sent").inc(len(messages))
+    if deferred:
+        return send_times[0] + RATE_WINDOW if send_times else now + 1
+    return now if len(due) == SEQUENCE_BATCH else next_due
+
+
+sequence_runner = sequences.Runner(run_sequences, lambda owner, now, ttl: store.take_lease("sequences", owner, now, ttl),
+                                   idle=SEQUENCE_IDLE)
+
+
+def start_background_jobs():
+    """Per-process background work; gunicorn starts it in each worker after the fork.
+
+    The other background threads (the event and webhook flushers, the campaign
+    senders, the prospects writer) start on first use instead. Either way they
+    start in the worker: a thread started in the preloading master would not
+    survive the fork into the workers."""
+    if SEQUENCES_ENABLED:
+        sequence_runner.start()
+
+
+def drain_background_jobs(timeout):
+    """Wait up to `timeout` seconds for this process's in-memory work: running POP
+    audits and queued campaign sends. gunicorn calls it as a worker exits (after
+    max_requests, or on shutdown); returns whether everything finished."""
+    deadline = time.monotonic() + timeout
+    while True:
+        running = sum(1 for job in list(pop_jobs.values()) if job["status"] == "running")
+        queued = campaign_queue.depth()
+        if not running and not queued:
+            return True
+        if time.monotonic() >= deadline:
+            app.logger.warning(f"Worker exiting with {running} POP audits running and {queued} campaign sends queued")
+            return False
+        time.sleep(0.5)
+
+
+@app.route("/sequences", methods=["POST"])
+@require_api_key
+def create_sequence():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON body required"}), 400
+    steps = data.get("steps")
+    try:
+        sequences.validate_steps(steps)
+        for step in steps:
+            campaign_text.from_string(step["subject"])
+            campaign_html.from_string(step.get("html") or "")
+            campaign_text.from_string(step.get("text") or "")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except jinja2.TemplateSyntaxError as e:
+        return jsonify({"error": f"Template error on line {e.lineno}: {e.message}"}), 400
+    sequence_id = f"seq_{uuid.uuid4().hex[:16]}"
+    try:
+        store.create_sequence({"id": sequence_id, "name": data.get("name", ""), "steps": json.dumps(steps),
+                               "from_addr": data.get("from"), "created_at": dt.utcnow().isoformat()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"id": sequence_id, "steps": len(steps)}), 201
+
+
+@app.route("/sequences/<sequence_id>/enroll", methods=["POST"])
+@require_api_key
+def enroll_in_sequence(sequence_id):
+    """Start recipients on a sequence: {"recipients": [{"to", "prospect_id"?, ...template vars}]}."""
+    data = request.get_json(silent=True)
+    recipients = data.get("recipients") if isinstance(data, dict) else None
+    if not isinstance(recipients, list) or not recipients:
+        return jsonify({"error": "'recipients' list required"}), 400
+    sequence = store.get_sequences([sequence_id]).get(sequence_id)
+    if not sequence:
+        return jsonify({"error": "Sequence not found"}), 404
+    first_due = time.time() + json.loads(sequence["steps"])[0].get("after_days", 0) * 86400
+    now = dt.utcnow().isoformat()
+    rows, rejected = [], []
+    for i, r in enumerate(recipients):
+        to = r.get("to") if isinstance(r, dict) else None
+        if not isinstance(to, str) or "@" not in to:
+            rejected.append({"index": i, "error": "'to' must be an email address"})
+            continue
+        pid = r.get("prospect_id")
+        variables = {k: v for k, v in r.items() if k not in ("to", "prospect_id")}
+        rows.append((sequence_id, to.strip(), pid, json.dumps(variables), first_due, now))
+    try:
+        enrolled = store.enroll(rows) if rows else 0
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    sequence_runner.wake()
+    return jsonify({"enrolled": enrolled, "already_enrolled": len(rows) - enrolled, "rejected": rejected[:100]})
+
+
+@app.route("/sequences/<sequence_id>", methods=["GET"])
+@require_api_key
+def sequence_status(sequence_id):
+    try:
+        sequence = store.sequence_progress(sequence_id)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    if not sequence:
+        return jsonify({"error": "Sequence not found"}), 404
+    sequence["steps"] = json.loads(sequence["steps"])
+    return jsonify(sequence)
 
 
 # ============================================================
@@ -412,8 +1123,8 @@ def prospect_search():
     payload = [{"keyword": keyword, "language_code": "en", "location_name": "United States", "depth": limit}]
 
     try:
-        resp = http_requests.post(
-            "https://api.dataforseo.com/v3/serp/google/maps/live/advanced",
+        resp = outbound.post(
+            "dataforseo", f"{DATAFORSEO_BASE}/serp/google/maps/live/advanced",
             json=payload,
             auth=(DATAFORSEO_LOGIN, DATAFORSEO_PASSWORD),
             timeout=60
@@ -427,8 +1138,7 @@ def prospect_search():
         return jsonify({"success": True, "query": keyword, "count": 0, "prospects": [], "raw_status": data.get("status_message", "no results")})
 
     items = tasks[0]["result"][0].get("items", [])
-    db = get_prospects_db()
-    prospects = []
+    found = []
 
     for item in items:
         if item.get("type") != "maps_search":
@@ -445,23 +1155,9 @@ def prospect_search():
 
         city = location.split(",")[0].strip() if "," in location else location
         state = location.split(",")[1].strip() if "," in location else ""
+        found.append((biz, website, phone, address, city, state, niche, rating, reviews, keyword, now_str(), now_str()))
 
-        try:
-            db.execute("""INSERT OR IGNORE INTO prospects 
-                (business_name, website, phone, address, city, state, niche, rating, reviews, search_query, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (biz, website, phone, address, city, state, niche, rating, reviews, keyword, now_str(), now_str()))
-        except Exception:
-            pass
-
-        row = db.execute("SELECT * FROM prospects WHERE website = ?", (website,)).fetchone()
-        if row:
-            prospects.append(row_to_dict(row))
-
-    db.commit()
-    db.execute("INSERT INTO searches (query, niche, location, result_count, created_at) VALUES (?, ?, ?, ?, ?)",
-               (keyword, niche, location, len(prospects), now_str()))
-    db.commit()
+    prospects = store.save_search(found, keyword, niche, location, now_str())
 
     return jsonify({"success": True, "query": keyword, "count": len(prospects), "prospects": prospects})
 
@@ -473,8 +1169,7 @@ def prospect_analyze():
     if not pid:
         return jsonify({"error": "prospect_id required"}), 400
 
-    db = get_prospects_db()
-    prospect = row_to_dict(db.execute("SELECT * FROM prospects WHERE id = ?", (pid,)).fetchone())
+    prospect = store.get_prospect(pid)
     if not prospect:
         return jsonify({"error": "Prospect not found"}), 404
 
@@ -487,13 +1182,14 @@ def prospect_analyze():
     seo_score = 100
 
     try:
-        resp = http_requests.get(url, timeout=15, allow_redirects=True, headers={"User-Agent": "Mozilla/5.0"})
+        resp = outbound.get("sites", url, timeout=15, allow_redirects=True, headers={"User-Agent": "Mozilla/5.0"})
         final_url = resp.url
         has_ssl = final_url.startswith("https://")
         if not has_ssl:
             issues.append("No SSL/HTTPS")
             seo_score -= 15
 
+        from bs4 import BeautifulSoup  # deferred: only /api/analyze parses pages, and bs4 adds ~40ms to startup
         soup = BeautifulSoup(resp.text, "html.parser")
 
         title = soup.find("title")
@@ -542,10 +1238,8 @@ def prospect_analyze():
     else:
         status = "cold"
 
-    db.execute("""UPDATE prospects SET seo_score=?, prospect_score=?, prospect_status=?, 
-        issues=?, has_ssl=?, updated_at=? WHERE id=?""",
-        (seo_score, prospect_score, status, json.dumps(issues), int(has_ssl), now_str(), pid))
-    db.commit()
+    store.update_prospect(pid, seo_score=seo_score, prospect_score=prospect_score, prospect_status=status,
+                          issues=json.dumps(issues), has_ssl=int(has_ssl), updated_at=now_str())
 
     return jsonify({
         "url": url, "seo_score": seo_score, "prospect_score": prospect_score,
@@ -556,9 +1250,10 @@ def prospect_analyze():
 # --- Async POP Audit Job System ---
 pop_jobs = {}  # job_id -> {"status": "running"|"complete"|"error", "result": {...}, "started": timestamp, "progress": str}
 
-def _poll_pop_task(task_id, step_name="task", max_attempts=360, poll_interval=5):
+@telemetry.POP_STEP_LATENCY.labels("polling").time()
+def _poll_pop_task(task_id, step_name="task", max_attempts=None, poll_interval=None):
     """
-    Poll POP API task until complete.
+    Poll POP API task until complete (every POP_POLL_INTERVAL seconds, for up to POP_POLL_TIMEOUT by default).
     Returns the final result or raises exception on timeout/failure.
     
     POP API status values:
@@ -566,9 +1261,11 @@ def _poll_pop_task(task_id, step_name="task", max_attempts=360, poll_interval=5)
     - "SUCCESS" = complete
     - "FAILURE" = failed
     """
+    poll_interval = poll_interval or POP_POLL_INTERVAL
+    max_attempts = max_attempts or max(1, int(POP_POLL_TIMEOUT / poll_interval))
     for attempt in range(max_attempts):
         try:
-            r = http_requests.get(f"{POP_BASE}/task/{task_id}/results/", timeout=60)
+            r = outbound.get("pop", f"{POP_BASE}/task/{task_id}/results/", timeout=60)
             r.raise_for_status()
             data = r.json()
             
@@ -610,18 +1307,96 @@ def _poll_pop_task(task_id, step_name="task", max_attempts=360, poll_interval=5)
     raise TimeoutError(f"POP {step_name} timed out after {max_attempts * poll_interval} seconds")
 
 
+def extract_pop_metrics(final_report):
+    """Metrics and unified score from a finished POP create-report payload.
+
+    Returns (metrics, pop_score, status).
+    """
+    # Navigate the nested structure
+    report_wrapper = final_report.get("data", final_report)
+    report = report_wrapper.get("report", report_wrapper)
+    
+    # Word counts (handle both nested and flat structures)
+    word_count = report.get("wordCount", {})
+    if isinstance(word_count, dict):
+        word_count_current = word_count.get("current", 0)
+        word_count_target = word_count.get("target", word_count.get("recommendation", 0))
+        word_count_avg = word_count.get("competitorAvg", word_count.get("average", word_count.get("avg", 0)))
+    else:
+        word_count_current = word_count
+        word_count_target = report.get("recommendedWordCount", 0)
+        word_count_avg = report.get("averageWordCount", 0)
+
+    # Competitors
+    competitor_info = report.get("competitorInfo", {})
+    competitors = competitor_info.get("competitors", [])
+    competitor_count = len(competitors)
+
+    # Tag counts (POP returns a list)
+    tag_counts = report.get("tagCounts", [])
+    if isinstance(tag_counts, dict):
+        tag_counts = list(tag_counts.values()) if tag_counts else []
+
+    # Terms and missing terms
+    terms = report.get("terms", [])
+    missing_terms = [t.get("term", t.get("phrase", "")) for t in terms if t.get("count", 0) == 0][:20]
+
+    # Page score from cleanedContentBrief
+    cleaned_brief = report.get("cleanedContentBrief", {})
+    page_score_data = cleaned_brief.get("pageScore", {})
+    page_score = 0
+    if isinstance(page_score_data, dict):
+        page_score = page_score_data.get("pageScore", 0)
+    elif isinstance(page_score_data, (int, float)):
+        page_score = page_score_data
+
+    pop_score, status, reasons = scoring.score_one(page_score, word_count_current, word_count_target, len(missing_terms))
+
+    metrics = {
+        "word_count_current": word_count_current,
+        "word_count_target": word_count_target,
+        "word_count_avg": word_count_avg,
+        "page_score": round(page_score, 1),
+        "competitor_count": competitor_count,
+        "tag_counts": tag_counts,
+        "missing_terms": missing_terms,
+        "missing_terms_count": len(missing_terms),
+        "reasons": reasons
+    }
+
+    return metrics, pop_score, status
+
+
+def save_pop_audit(pid, metrics, pop_score, status, report_data):
+    """Store a finished audit together with its precomputed report view."""
+    audit_date = now_str()
+    pop_data = {"metrics": metrics, "report_data": report_data}
+    fields = {
+        "pop_report_data": json.dumps(pop_data), "pop_audit_date": audit_date, "pop_score": pop_score,
+        "prospect_score": pop_score, "prospect_status": status,
+        "pop_word_count_current": metrics["word_count_current"], "pop_word_count_target": metrics["word_count_target"],
+        "pop_page_score": metrics["page_score"], "pop_missing_terms": metrics["missing_terms_count"],
+        "pop_score_version": scoring.CURRENT_VERSION, "updated_at": audit_date,
+    }
+    prospect = store.get_prospect(pid)
+    view = None
+    if prospect:
+        prospect.update(fields)
+        doc, etag = render_report_view(prospect, pop_data)
+        view = (audit_date, etag, doc)
+    store.save_pop_audit(pid, fields, view)
+
+
 def _run_pop_audit_job(job_id, pid):
     """Background worker for POP audit - runs full 3-step flow"""
     app.logger.info(f"Starting POP audit job {job_id} for prospect {pid}")
+    telemetry.POP_JOBS_RUNNING.inc()
     
     try:
         # Update job status with progress
         pop_jobs[job_id]["progress"] = "Fetching prospect data..."
         
-        db = sqlite3.connect(PROSPECTS_DB_PATH)
-        db.row_factory = sqlite3.Row
-        prospect = dict(db.execute("SELECT * FROM prospects WHERE id = ?", (pid,)).fetchone())
-        db.close()
+        prospect = store.get_prospect(pid)
 
         url = prospect["website"]
         if not url.startswith("http"):
@@ -636,13 +1411,14 @@ def _run_pop_audit_job(job_id, pid):
         # ==================== STEP 1: Get Terms ====================
         pop_jobs[job_id]["progress"] = "Step 1/3: Getting search terms from POP..."
         
-        terms_resp = http_requests.post(f"{POP_BASE}/expose/get-terms/", json={
-            "apiKey": POP_API_KEY,
-            "keyword": keyword,
-            "locationName": "United States",
-            "targetLanguage": "english",
-            "targetUrl": url
-        }, timeout=120)
+        with telemetry.POP_STEP_LATENCY.labels("get-terms").time():
+            terms_resp = outbound.post("pop", f"{POP_BASE}/expose/get-terms/", json={
+                "apiKey": POP_API_KEY,
+                "keyword": keyword,
+                "locationName": "United States",
+                "targetLanguage": "english",
+                "targetUrl": url
+            }, timeout=120)
         terms_resp.raise_for_status()
         terms_data = terms_resp.json()
         
@@ -661,7 +1437,7 @@ def _run_pop_audit_job(job_id, pid):
         else:
             # Poll for terms results (can take ~3 minutes)
             pop_jobs[job_id]["progress"] = f"Step 1/3: Polling for terms (task {task_id[:8]}...)"
-            terms_result = _poll_pop_task(task_id, "get-terms", max_attempts=200, poll_interval=3)
+            terms_result = _poll_pop_task(task_id, "get-terms")
 
         app.logger.info(f"POP audit {job_id}: terms result received")
         
@@ -695,7 +1471,8 @@ def _run_pop_audit_job(job_id, pid):
         
         for attempt in range(max_retries):
             try:
-                report_resp = http_requests.post(f"{POP_BASE}/expose/create-report/", json=report_payload, timeout=180)
+                with telemetry.POP_STEP_LATENCY.labels("create-report").time():
+                    report_resp = outbound.post("pop", f"{POP_BASE}/expose/create-report/", json=report_payload, timeout=180)
                 report_resp.raise_for_status()
                 report_data = report_resp.json()
                 
@@ -710,20 +1487,22 @@ def _run_pop_audit_job(job_id, pid):
                     }
                     last_error = json.dumps(error_details)
                     if attempt < max_retries - 1:
-                        app.logger.warning(f"POP audit {job_id}: create-report failed, retrying in 10s... Error: {last_error}")
+                        app.logger.warning(f"POP audit {job_id}: create-report failed, retrying in {POP_RETRY_DELAY:g}s... Error: {last_error}")
                         pop_jobs[job_id]["progress"] = f"Step 2/3: Retrying create-report (attempt {attempt+2}/{max_retries})..."
-                        time.sleep(10)
+                        time.sleep(POP_RETRY_DELAY)
                         continue
                     else:
                         raise Exception(f"POP create-report failed after {max_retries} attempts: {last_error}")
                 else:
                     # Success or other non-failure status
                     break
+            except outbound.CircuitOpenError:
+                raise
             except Exception as e:
                 if attempt < max_retries - 1:
                     app.logger.warning(f"POP audit {job_id}: create-report error, retrying... {e}")
                     pop_jobs[job_id]["progress"] = f"Step 2/3: Retrying create-report (attempt {attempt+2}/{max_retries})..."
-                    time.sleep(10)
+                    time.sleep(POP_RETRY_DELAY)
                 else:
                     raise
         
@@ -735,7 +1514,7 @@ def _run_pop_audit_job(job_id, pid):
         if report_task_id:
             # Poll for report results (can take another ~3 minutes)
             pop_jobs[job_id]["progress"] = f"Step 3/3: Polling for report (task {report_task_id[:8]}...)"
-            final_report = _poll_pop_task(report_task_id, "create-report", max_attempts=200, poll_interval=3)
+            final_report = _poll_pop_task(report_task_id, "create-report")
         else:
             # Direct response
             final_report = report_data
@@ -743,105 +1522,17 @@ def _run_pop_audit_job(job_id, pid):
         app.logger.info(f"POP audit {job_id}: final report received")
         
         # ==================== Extract Metrics ====================
-        # Navigate the nested structure
-        report_wrapper = final_report.get("data", final_report)
-        report = report_wrapper.get("report", report_wrapper)
-        
-        # Word counts (handle both nested and flat structures)
-        word_count = report.get("wordCount", {})
-        if isinstance(word_count, dict):
-            word_count_current = word_count.get("current", 0)
-            word_count_target = word_count.get("target", word_count.get("recommendation", 0))
-            word_count_avg = word_count.get("competitorAvg", word_count.get("average", word_count.get("avg", 0)))
-        else:
-            word_count_current = word_count
-            word_count_target = report.get("recommendedWordCount", 0)
-            word_count_avg = report.get("averageWordCount", 0)
-
-        # Competitors
-        competitor_info = report.get("competitorInfo", {})
-        competitors = competitor_info.get("competitors", [])
-        competitor_count = len(competitors)
-
-        # Tag counts (POP returns a list)
-        tag_counts = report.get("tagCounts", [])
-        if isinstance(tag_counts, dict):
-            tag_counts = list(tag_counts.values()) if tag_counts else []
-
-        # Terms and missing terms
-        terms = report.get("terms", [])
-        missing_terms = [t.get("term", t.get("phrase", "")) for t in terms if t.get("count", 0) == 0][:20]
-
-        # Page score from cleanedContentBrief
-        cleaned_brief = report.get("cleanedContentBrief", {})
-        page_score_data = cleaned_brief.get("pageScore", {})
-        page_score = 0
-        if isinstance(page_score_data, dict):
-            page_score = page_score_data.get("pageScore", 0)
-        elif isinstance(page_score_data, (int, float)):
-            page_score = page_score_data
-
-        # Calculate prospect score
-        pop_score = 50  # Base score
-        reasons = []
-        
-        if word_count_target > 0 and word_count_current > 0:
-            wc_percent = (word_count_current / word_count_target) * 100
-            if wc_percent < 30:
-                pop_score += 30
-                reasons.append(f"Severe content gap ({word_count_current} vs {word_count_target} words)")
-            elif wc_percent < 50:
-                pop_score += 20
-                reasons.append(f"Major content gap ({word_count_current} vs {word_count_target} words)")
-            elif wc_percent < 70:
-                pop_score += 10
-                reasons.append(f"Content below target ({word_count_current} vs {word_count_target} words)")
-
-        if len(missing_terms) >= 15:
-            pop_score += 15
-            reasons.append(f"Missing {len(missing_terms)}+ LSI terms")
-        elif len(missing_terms) >= 10:
-            pop_score += 10
-            reasons.append(f"Missing {len(missing_terms)} LSI terms")
-        elif len(missing_terms) >= 5:
-            pop_score += 5
-            reasons.append(f"Missing {len(missing_terms)} LSI terms")
-
-        pop_score = min(100, pop_score)
-
-        if pop_score >= 80:
-            status = "hot"
-        elif pop_score >= 60:
-            status = "warm"
-        else:
-            status = "cold"
-
-        metrics = {
-            "word_count_current": word_count_current,
-            "word_count_target": word_count_target,
-            "word_count_avg": word_count_avg,
-            "page_score": round(page_score, 1),
-            "competitor_count": competitor_count,
-            "tag_counts": tag_counts,
-            "missing_terms": missing_terms,
-            "missing_terms_count": len(missing_terms),
-            "reasons": reasons
-        }
+        metrics, pop_score, status = extract_pop_metrics(final_report)
 
         app.logger.info(f"POP audit {job_id}: metrics extracted - score={pop_score}, status={status}")
 
         # ==================== Save to DB ====================
         pop_jobs[job_id]["progress"] = "Saving results..."
         
-        db2 = sqlite3.connect(PROSPECTS_DB_PATH)
-        db2.execute("""UPDATE prospects SET pop_report_data=?, pop_audit_date=?, pop_score=?,
-            prospect_score=?, prospect_status=?, pop_word_count_current=?, pop_word_count_target=?, updated_at=? WHERE id=?""",
-            (json.dumps({"metrics": metrics, "report_data": final_report}), now_str(), pop_score, pop_score, status, 
-             word_count_current, word_count_target, now_str(), pid))
-        db2.commit()
-        db2.close()
+        save_pop_audit(pid, metrics, pop_score, status, final_report)
 
         app.logger.info(f"POP audit {job_id}: completed successfully")
+        telemetry.POP_JOBS.labels("complete").inc()
         
         pop_jobs[job_id] = {
             "status": "complete", 
@@ -854,7 +1545,31 @@ def _run_pop_audit_job(job_id, pid):
 
     except Exception as e:
         app.logger.error(f"POP audit {job_id} failed: {e}")
+        telemetry.POP_JOBS.labels("error").inc()
         pop_jobs[job_id] = {"status": "error", "error": str(e), "progress": "Failed"}
+    finally:
+        telemetry.POP_JOBS_RUNNING.dec()
+
+
+def start_pop_audit_job(pid):
+    """Register a POP audit job and run it on a daemon thread; returns (job_id, event set when it ends)."""
+    job_id = str(uuid.uuid4())[:8]
+    done = threading.Event()
+    pop_jobs[job_id] = {
+        "status": "running", 
+        "started": time.time(),
+        "progress": "Initializing POP audit...",
+        "prospect_id": pid
+    }
+
+    def run():
+        try:
+            _run_pop_audit_job(job_id, pid)
+        finally:
+            done.set()
+
+    threading.Thread(target=run, name=f"pop-audit-{job_id}", daemon=True).start()
+    return job_id, done
 
 
 @app.route("/api/pop_audit_start", methods=["POST", "GET"])
@@ -865,20 +1580,11 @@ def pop_audit_start():
     if not pid:
         return jsonify({"error": "prospect_id required"}), 400
 
-    db = get_prospects_db()
-    prospect = row_to_dict(db.execute("SELECT * FROM prospects WHERE id = ?", (pid,)).fetchone())
+    prospect = store.get_prospect(pid)
     if not prospect:
         return jsonify({"error": "Prospect not found"}), 404
 
-    job_id = str(uuid.uuid4())[:8]
-    pop_jobs[job_id] = {
-        "status": "running", 
-        "started": time.time(),
-        "progress": "Initializing POP audit...",
-        "prospect_id": int(pid)
-    }
-    t = threading.Thread(target=_run_pop_audit_job, args=(job_id, int(pid)), daemon=True)
-    t.start()
+    job_id, _ = start_pop_audit_job(int(pid))
 
     return jsonify({
         "success": True, 
@@ -919,221 +1625,126 @@ def pop_audit_status():
 @app.route("/api/pop_audit", methods=["POST", "GET"])
 @require_prospector_key
 def pop_audit():
+    """Run a POP audit, answering inline if it ends within POP_AUDIT_WAIT seconds.
+
+    An audit takes minutes, so it runs as a /api/pop_audit_start job rather than
+    on the request thread. One still running after the wait gets a 202 with its
+    job_id, to poll at /api/pop_audit_status.
+    """
     pid = request.args.get("prospect_id") or (request.json.get("prospect_id") if request.is_json else None)
     if not pid:
         return jsonify({"error": "prospect_id required"}), 400
 
-    db = get_prospects_db()
-    prospect = row_to_dict(db.execute("SELECT * FROM prospects WHERE id = ?", (pid,)).fetchone())
+    prospect = store.get_prospect(pid)
     if not prospect:
         return jsonify({"error": "Prospect not found"}), 404
 
-    url = prospect["website"]
-    if not url.startswith("http"):
-        url = "https://" + url
+    job_id, done = start_pop_audit_job(int(pid))
+    if done.wait(POP_AUDIT_WAIT):
+        job = pop_jobs[job_id]
+        if job["status"] == "complete":
+            return jsonify(job["result"])
+        return jsonify({"error": job.get("error", "Unknown error"), "job_id": job_id}), 500
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "running",
+        "status_url": f"/api/pop_audit_status?job_id={job_id}",
+        "message": f"POP audit still running after {POP_AUDIT_WAIT:g}s. Poll the status_url for results."
+    }), 202
 
-    keyword = f"{prospect.get('niche', '')} {prospect.get('city', '')}".strip()
-    if not keyword:
-        keyword = prospect.get("business_name", "business")
 
-    # Step 1: Get terms
-    try:
-        terms_resp = http_requests.post(f"{POP_BASE}/expose/get-terms/", json={
-            "apiKey": POP_API_KEY,
-            "keyword": keyword,
-            "locationName": "United States",
-            "targetLanguage": "english",
-            "targetUrl": url
-        }, timeout=60)
-        terms_data = terms_resp.json()
-    except Exception as e:
-        return jsonify({"error": f"POP get-terms failed: {e}"}), 500
+def connect_prospects_db():
+    return connect_db(PROSPECTS_DB_PATH, "prospects")
 
-    task_id = terms_data.get("taskId") or terms_data.get("task_id")
-    if not task_id:
-        return jsonify({"error": "No taskId from POP", "raw": terms_data}), 500
 
-    # Poll for terms results
-    terms_result = None
-    for _ in range(200):
-        time.sleep(3)
-        try:
-            r = http_requests.get(f"{POP_BASE}/task/{task_id}/results/", timeout=30)
-            rd = r.json()
-            if rd.get("status") in ("complete", "SUCCESS") or rd.get("data"):
-                terms_result = rd
-                break
-        except Exception:
-            continue
+def require_sqlite_storage(f):
+    """Backfills walk the prospects.db file directly (backfills.py)."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if store.name != "sqlite":
+            return jsonify({"error": f"Not available on the {store.name} storage backend"}), 501
+        return f(*args, **kwargs)
+    return decorated
 
-    if not terms_result:
-        return jsonify({"error": "POP terms timed out"}), 504
 
-    # Step 2: Create report
-    prepare_id = terms_result.get("prepareId") or terms_result.get("data", {}).get("prepareId") or task_id
-    variations = terms_result.get("variations") or terms_result.get("data", {}).get("variations", [])
-    lsa_phrases = terms_result.get("lsaPhrases") or terms_result.get("data", {}).get("lsaPhrases", [])
+def start_backfill(name, params=None):
+    restart = request.args.get("restart") in ("1", "true")
+    started, status = backfills.start(connect_prospects_db, name, params, restart=restart)
+    return jsonify({"success": True, "started": started, "backfill": status,
+                    "message": None if started else "Already running in another worker"}), 202
 
-    try:
-        report_resp = http_requests.post(f"{POP_BASE}/expose/create-report/", json={
-            "apiKey": POP_API_KEY,
-            "prepareId": prepare_id,
-            "variations": variations,
-            "lsaPhrases": lsa_phrases
-        }, timeout=60)
-        report_data = report_resp.json()
-    except Exception as e:
-        return jsonify({"error": f"POP create-report failed: {e}"}), 500
 
-    report_task_id = report_data.get("taskId") or report_data.get("task_id")
-    if report_task_id:
-        for _ in range(200):
-            time.sleep(3)
-            try:
-                r = http_requests.get(f"{POP_BASE}/task/{report_task_id}/results/", timeout=30)
-                rd = r.json()
-                if rd.get("status") in ("complete", "SUCCESS") or rd.get("report"):
-                    report_data = rd
-                    break
-            except Exception:
-                continue
+@app.route("/api/backfill_pop_scores", methods=["POST"])
+@require_prospector_key
+@require_sqlite_storage
+def backfill_pop_scores():
+    """Rescore every audited prospect in the background (optional ?version=, ?restart=1)."""
+    version = int(request.args.get("version") or scoring.CURRENT_VERSION)
+    if version not in scoring.RULES:
+        return jsonify({"error": f"Unknown scoring version {version}", "versions": sorted(scoring.RULES)}), 400
+    return start_backfill("pop_scores", {"version": version})
 
-    # Extract metrics
-    report = report_data.get("report", report_data.get("data", {}).get("report", report_data))
-    word_count_current = report.get("wordCount", 0)
-    word_count_target = report.get("recommendedWordCount", 0)
-    word_count_avg = report.get("averageWordCount", 0)
-    competitor_count = len(report.get("competitorInfo", {}).get("competitors", []))
-    tag_counts = report.get("tagCounts", [])
-    if isinstance(tag_counts, dict):
-        tag_counts = list(tag_counts.values()) if tag_counts else []
-    terms = report.get("terms", [])
-    missing_terms = [t["term"] for t in terms if t.get("count", 0) == 0][:10]
-
-    pop_score = 50
-    if word_count_target > 0:
-        if word_count_current < word_count_target * 0.5:
-            pop_score += 20
-        elif word_count_current < word_count_target:
-            pop_score += 10
-    if len(missing_terms) > 10:
-        pop_score += 25
-    elif len(missing_terms) > 5:
-        pop_score += 15
-    pop_score = min(100, pop_score)
-
-    if pop_score >= 80:
-        status = "hot"
-    elif pop_score >= 60:
-        status = "warm"
-    else:
-        status = "cold"
 
-    metrics = {
-        "word_count_current": word_count_current,
-        "word_count_target": word_count_target,
-        "word_count_avg": word_count_avg,
-        "competitor_count": competitor_count,
-        "tag_counts": tag_counts,
-        "missing_terms": missing_terms,
-        "missing_terms_count": len(missing_terms)
-    }
+@app.route("/api/backfill_status")
+@require_prospector_key
+@require_sqlite_storage
+def backfill_status():
+    name = request.args.get("name")
+    if name and name not in backfills.BACKFILLS:
+        return jsonify({"error": f"Unknown backfill {name}"}), 404
+    return jsonify({"success": True, "backfills": backfills.status(connect_prospects_db, name)})
 
-    # Save (use separate connection to avoid Flask g issues in long-running request)
-    db2 = sqlite3.connect(PROSPECTS_DB_PATH)
-    db2.execute("""UPDATE prospects SET pop_report_data=?, pop_audit_date=?, pop_score=?,
-        prospect_score=?, prospect_status=?, updated_at=? WHERE id=?""",
-        (json.dumps({"metrics": metrics, "report_data": report_data}), now_str(), pop_score, pop_score, status, now_str(), pid))
-    db2.commit()
-    db2.close()
 
-    return jsonify({"success": True, "metrics": metrics, "scoring": {"pop_score": pop_score, "status": status}})
+@app.route("/api/backfill_cancel", methods=["POST"])
+@require_prospector_key
+@require_sqlite_storage
+def backfill_cancel():
+    name = request.args.get("name")
+    if name not in backfills.BACKFILLS:
+        return jsonify({"error": "name required", "names": sorted(backfills.BACKFILLS)}), 400
+    return jsonify({"success": True, "backfill": backfills.cancel(connect_prospects_db, name)})
 
 
-@app.route('/api/backfill_pop_scores', methods=['POST'])
-def backfill_pop_scores():
-    key = request.args.get('key')
-    if key != PROSPECTOR_KEY:
-        return jsonify({"error": "unauthorized"}), 401
-    
-    try:
-        return _do_backfill()
-    except Exception as e:
-        import traceback
-        return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
+# --- AI Pitch Generation ---
 
-def _do_backfill():
-    db = sqlite3.connect(PROSPECTS_DB_PATH)
-    db.row_factory = sqlite3.Row
-    # Get all prospects with pop_report_data
-    rows = db.execute("SELECT id, pop_report_data, pop_score FROM prospects WHERE pop_report_data IS NOT NULL").fetchall()
-    
-    fixed = []
-    for row in rows:
-        try:
-            data = json.loads(row['pop_report_data'])
-            metrics = data.get('metrics', {})
-            
-            page_score = metrics.get('page_score', 0)
-            wc_current = metrics.get('word_count_current', 0)
-            wc_target = metrics.get('word_count_target', 0)
-            
-            # Recalculate pop_score using same logic as pop_audit endpoint
-            new_score = 50
-            if page_score >= 40:
-                new_score += 30
-            elif page_score >= 25:
-                new_score += 20
-            elif page_score >= 10:
-                new_score += 10
-            
-            word_gap_pct = ((wc_target - wc_current) / wc_target * 100) if wc_target > 0 else 0
-            if word_gap_pct > 50:
-                new_score += 15
-            elif word_gap_pct > 25:
-                new_score += 10
-            elif word_gap_pct > 0:
-                new_score += 5
-            new_score = min(100, new_score)
-            
-            # Determine status
-            if new_score >= 80:
-                status = 'hot'
-            elif new_score >= 60:
-                status = 'warm'
-            else:
-                status = 'cold'
-            
-            old_score = row['pop_score']
-            
-            if old_score != new_score:
-                db.execute("UPDATE prospects SET pop_score=?, prospect_status=? WHERE id=?", 
-                           (new_score, status, row['id']))
-                fixed.append({"id": row['id'], "old_score": old_score, "new_score": new_score, "status": status, "page_score": page_score})
-        except Exception as e:
-            fixed.append({"id": row['id'], "error": str(e)})
-    
-    try:
-        db.commit()
-    except Exception as e:
-        db.close()
-        return jsonify({"error": f"commit failed: {str(e)}"}), 500
-    db.close()
-    return jsonify({"success": True, "fixed": len([f for f in fixed if 'new_score' in f]), "details": fixed})
+class TokenBudget:
+    """Token bucket shared by all pitch calls in this worker (tokens/minute)."""
 
+    def __init__(self, tokens_per_min):
+        self.capacity = float(tokens_per_min)
+        self.tokens = float(tokens_per_min)
+        self.rate = tokens_per_min / 60.0
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
 
-@app.route("/api/pitch")
-@require_prospector_key
-def prospect_pitch():
-    pid = request.args.get("prospect_id")
-    if not pid:
-        return jsonify({"error": "prospect_id required"}), 400
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
 
-    db = get_prospects_db()
-    prospect = row_to_dict(db.execute("SELECT * FROM prospects WHERE id = ?", (pid,)).fetchone())
-    if not prospect:
-        return jsonify({"error": "Prospect not found"}), 404
+    def acquire(self, n):
+        n = min(n, self.capacity)
+        with self.cond:
+            self._refill()
+            while self.tokens < n:
+                self.cond.wait((n - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= n
 
+    def settle(self, reserved, actual):
+        """Charge (or refund) the difference once real usage is known."""
+        with self.cond:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + reserved - actual)
+            self.cond.notify_all()
+
+
+pitch_budget = TokenBudget(PITCH_TOKENS_PER_MIN)
+
+
+def build_pitch_prompt(prospect):
+    """Render the outreach prompt. Returns (prompt, used_pop)."""
     used_pop = False
     pop_context = ""
     if prospect.get("pop_report_data"):
@@ -1177,77 +1788,302 @@ Rules:
 - Format: First line is the subject line, then a blank line, then the body
 - Sign off as the SEO Design Lab team
 """
+    return prompt, used_pop
+
+
+def pitch_cache_key(prompt):
+    # The prompt already renders business, niche, issues and POP metrics,
+    # so hashing it (plus the model) covers every input that affects the output.
+    return hashlib.sha256(f"{PITCH_MODEL}\n{prompt}".encode("utf-8")).hexdigest()
+
 
+def estimate_tokens(prompt):
+    return len(prompt) // 4 + 400  # prompt + ~150 word completion
+
+
+def call_openrouter(prompt, timeout=30):
+    """Single chat completion. Returns (content, total_tokens)."""
+    resp = outbound.post("openrouter", f"{OPENROUTER_BASE}/chat/completions", json={
+        "model": PITCH_MODEL,
+        "messages": [{"role": "user", "content": prompt}]
+    }, headers={
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }, timeout=timeout)
+    ai = resp.json()
+    content = ai["choices"][0]["message"]["content"]
+    tokens = (ai.get("usage") or {}).get("total_tokens") or estimate_tokens(prompt)
+    return content, tokens
+
+
+def parse_pitch(content):
+    lines = content.strip().split("\n", 1)
+    subject = lines[0].replace("Subject:", "").replace("Subject Line:", "").strip()
+    body = lines[1].strip() if len(lines) > 1 else content
+    return subject, body
+
+
+def generate_pitch(prompt):
+    """Budgeted OpenRouter call, safe to run from a worker thread."""
+    reserved = estimate_tokens(prompt)
+    pitch_budget.acquire(reserved)
+    try:
+        content, tokens = call_openrouter(prompt)
+    except Exception:
+        pitch_budget.settle(reserved, 0)
+        raise
+    pitch_budget.settle(reserved, tokens)
+    subject, body = parse_pitch(content)
+    return subject, body, tokens
+
+
+def save_pitch(pid, prompt_hash, subject, body, tokens):
+    store.save_pitches([(pid, prompt_hash, subject, body, tokens)], PITCH_MODEL, now_str())
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_pitch(pid, prompt, used_pop):
+    """Proxy an OpenRouter streaming completion as SSE events.
+
+    Emits `subject` as soon as the first line is complete, `token` for every
+    delta, then `done` once the pitch has been persisted (or `error`).
+    """
+    reserved = estimate_tokens(prompt)
+    pitch_budget.acquire(reserved)
+    content = ""
+    subject_sent = False
+    tokens = 0
+    resp = None
     try:
-        resp = http_requests.post("https://openrouter.ai/api/v1/chat/completions", json={
-            "model": "anthropic/claude-3-haiku",
-            "messages": [{"role": "user", "content": prompt}]
+        resp = outbound.post("openrouter", f"{OPENROUTER_BASE}/chat/completions", json={
+            "model": PITCH_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
         }, headers={
             "Authorization": f"Bearer {OPENROUTER_API_KEY}",
             "Content-Type": "application/json"
-        }, timeout=30)
-        ai = resp.json()
-        content = ai["choices"][0]["message"]["content"]
+        }, timeout=30, stream=True)
+        resp.raise_for_status()
+        resp.encoding = "utf-8"  # text/event-stream has no charset; requests would assume latin-1
+        for line in resp.iter_lines(decode_unicode=True):
+            # SSE comments (": OPENROUTER PROCESSING") and blank keep-alives are skipped
+            if not line or not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            chunk = json.loads(payload)
+            if chunk.get("usage"):
+                tokens = chunk["usage"].get("total_tokens", tokens)
+            choices = chunk.get("choices") or []
+            delta = (choices[0].get("delta") or {}).get("content") if choices else None
+            if not delta:
+                continue
+            content += delta
+            yield sse("token", {"text": delta})
+            if not subject_sent and "\n" in content.lstrip():
+                subject_sent = True
+                yield sse("subject", {"subject": parse_pitch(content)[0]})
     except Exception as e:
-        return jsonify({"error": f"AI pitch failed: {e}"}), 500
+        yield sse("error", {"error": f"AI pitch failed: {e}"})
+        return
+    finally:
+        # Also runs when the client disconnects (GeneratorExit at a yield)
+        if resp is not None:
+            resp.close()
+        # Without a usage chunk, charge the prompt and whatever was streamed
+        pitch_budget.settle(reserved, tokens or ((len(prompt) + len(content)) // 4 if content else 0))
+
+    subject, body = parse_pitch(content)
+    if not subject_sent:
+        yield sse("subject", {"subject": subject})
+    save_pitch(pid, pitch_cache_key(prompt), subject, body, tokens)
+    yield sse("done", {"success": True, "subject": subject, "pitch": body, "used_pop_data": used_pop})
 
-    lines = content.strip().split("\n", 1)
-    subject = lines[0].replace("Subject:", "").replace("Subject Line:", "").strip()
-    body = lines[1].strip() if len(lines) > 1 else content
 
-    db.execute("UPDATE prospects SET pitch_subject=?, pitch_body=?, pitch_date=?, updated_at=? WHERE id=?",
-               (subject, body, now_str(), now_str(), pid))
-    db.commit()
+@app.route("/api/pitch")
+@require_prospector_key
+def prospect_pitch():
+    pid = request.args.get("prospect_id")
+    if not pid:
+        return jsonify({"error": "prospect_id required"}), 400
+
+    prospect = store.get_prospect(pid)
+    if not prospect:
+        return jsonify({"error": "Prospect not found"}), 404
+
+    prompt, used_pop = build_pitch_prompt(prospect)
+
+    if request.args.get("stream") in ("1", "true"):
+        return Response(stream_pitch(pid, prompt, used_pop), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    try:
+        subject, body, tokens = generate_pitch(prompt)
+    except Exception as e:
+        return jsonify({"error": f"AI pitch failed: {e}"}), 500
+
+    save_pitch(pid, pitch_cache_key(prompt), subject, body, tokens)
 
     return jsonify({"success": True, "subject": subject, "pitch": body, "used_pop_data": used_pop})
 
 
+@app.route("/api/pitch_batch", methods=["POST"])
+@require_prospector_key
+def prospect_pitch_batch():
+    """Generate pitches for many prospects concurrently.
+
+    Prospects whose rendered prompt is unchanged are served from pitch_cache
+    without calling OpenRouter; pass "refresh": true to regenerate anyway.
+    Pitches not generated within PITCH_BATCH_DEADLINE come back "deferred",
+    so a large batch can't hold a worker past gunicorn's timeout.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON body required"}), 400
+    ids = data.get("prospect_ids", [])
+    # Ids as JSON numbers or digit strings; anything else is the caller's mistake, not a 500
+    if not isinstance(ids, list) or not all(type(i) is int or isinstance(i, str) and i.isdigit() for i in ids):
+        return jsonify({"error": "prospect_ids must be a list of integers"}), 400
+    ids = [int(i) for i in ids]
+    if not ids:
+        return jsonify({"error": "prospect_ids array required"}), 400
+    if len(ids) > PITCH_BATCH_MAX:
+        return jsonify({"error": f"At most {PITCH_BATCH_MAX} prospects per batch"}), 400
+    concurrency = data.get("concurrency", PITCH_CONCURRENCY)
+    if type(concurrency) is not int:
+        return jsonify({"error": "concurrency must be an integer"}), 400
+    concurrency = max(1, min(concurrency, PITCH_CONCURRENCY))
+    refresh = bool(data.get("refresh"))
+
+    prospects = store.get_prospects(ids)
+
+    results = {}
+    pending = {}  # pid -> (prompt, prompt_hash, used_pop)
+    for pid in ids:
+        if pid not in prospects:
+            results[pid] = {"prospect_id": pid, "success": False, "error": "Prospect not found"}
+            continue
+        prompt, used_pop = build_pitch_prompt(prospects[pid])
+        pending[pid] = (prompt, pitch_cache_key(prompt), used_pop)
+
+    stale = []  # cache hits whose prospect row still has an older pitch
+    if pending and not refresh:
+        hashes = list({h for _, h, _ in pending.values()})
+        cached = store.cached_pitches(hashes)
+        for pid, (prompt, h, used_pop) in list(pending.items()):
+            hit = cached.get(h)
+            if not hit:
+                continue
+            p = prospects[pid]
+            if p.get("pitch_subject") != hit["subject"] or p.get("pitch_body") != hit["body"]:
+                stale.append((pid, hit["subject"], hit["body"]))
+            results[pid] = {"prospect_id": pid, "success": True, "cached": True, "subject": hit["subject"],
+                            "pitch": hit["body"], "used_pop_data": used_pop}
+            del pending[pid]
+
+    writes = []  # saved in one transaction once all pitches are in
+    generated = deferred = 0
+    if pending:
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            futures = {pid: pool.submit(generate_pitch, prompt) for pid, (prompt, _, _) in pending.items()}
+            deadline = time.monotonic() + PITCH_BATCH_DEADLINE
+            for pid, fut in futures.items():
+                _, h, used_pop = pending[pid]
+                try:
+                    subject, body, tokens = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeout:
+                    # Calls already made are saved when they finish, so a resend finds them cached
+                    fut.add_done_callback(lambda f, pid=pid, h=h: f.cancelled() or f.exception()
+                                          or save_pitch(pid, h, *f.result()))
+                    results[pid] = {"prospect_id": pid, "success": False, "deferred": True,
+                                    "error": f"Not generated within {PITCH_BATCH_DEADLINE:g}s; resend to continue"}
+                    deferred += 1
+                    continue
+                except Exception as e:
+                    results[pid] = {"prospect_id": pid, "success": False, "error": f"AI pitch failed: {e}"}
+                    continue
+                writes.append((pid, h, subject, body, tokens))
+                generated += 1
+                results[pid] = {"prospect_id": pid, "success": True, "cached": False, "subject": subject,
+                                "pitch": body, "used_pop_data": used_pop}
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    store.save_pitches(writes, PITCH_MODEL, now_str(), reused=stale)
+
+    ordered = [results[pid] for pid in ids]
+    return jsonify({
+        "success": True, "count": len(ordered), "generated": generated,
+        "cached": sum(1 for r in ordered if r.get("cached")),
+        "failed": sum(1 for r in ordered if not r["success"]), "deferred": deferred,
+        "results": ordered
+    })
+
+
 @app.route("/api/list")
 @require_prospector_key
 def list_prospects():
     status = request.args.get("status", "all")
-    db = get_prospects_db()
-    if status and status != "all":
-        rows = db.execute("""SELECT * FROM prospects WHERE prospect_status = ? 
-            ORDER BY pop_audit_date DESC, prospect_score DESC""", (status,)).fetchall()
-    else:
-        rows = db.execute("""SELECT * FROM prospects 
-            ORDER BY CASE WHEN pop_audit_date IS NULL THEN 1 ELSE 0 END, pop_audit_date DESC, prospect_score DESC""").fetchall()
-    return jsonify({"success": True, "count": len(rows), "prospects": [row_to_dict(r) for r in rows]})
+    rows = store.list_prospects(status if status and status != "all" else None)
+    return jsonify({"success": True, "count": len(rows), "prospects": rows})
 
 
 @app.route("/api/stats")
 @require_prospector_key
 def prospect_stats():
-    db = get_prospects_db()
-    total = db.execute("SELECT COUNT(*) FROM prospects").fetchone()[0]
-    by_status = {}
-    for row in db.execute("SELECT prospect_status, COUNT(*) as c FROM prospects GROUP BY prospect_status"):
-        by_status[row["prospect_status"]] = row["c"]
-    by_niche = {}
-    for row in db.execute("SELECT niche, COUNT(*) as c FROM prospects WHERE niche IS NOT NULL GROUP BY niche ORDER BY c DESC LIMIT 10"):
-        by_niche[row["niche"]] = row["c"]
-    recent = [row_to_dict(r) for r in db.execute("SELECT * FROM searches ORDER BY created_at DESC LIMIT 5").fetchall()]
-    sent = db.execute("SELECT COUNT(*) FROM prospects WHERE sent_date IS NOT NULL").fetchone()[0]
-    responded = db.execute("SELECT COUNT(*) FROM prospects WHERE response_date IS NOT NULL").fetchone()[0]
-    pop_count = db.execute("SELECT COUNT(*) FROM prospects WHERE pop_audit_date IS NOT NULL").fetchone()[0]
+    summary = store.prospect_summary()
+    sent, responded = summary["sent"], summary["responded"]
     rate = round(responded / sent * 100, 1) if sent > 0 else 0
 
     return jsonify({
-        "success": True, "total": total, "by_status": by_status, "by_niche": by_niche,
-        "recent_searches": recent, "sent": sent, "responded": responded,
-        "response_rate": rate, "pop_audits": pop_count
+        "success": True, "total": summary["total"], "by_status": summary["by_status"], "by_niche": summary["by_niche"],
+        "recent_searches": summary["recent_searches"], "sent": sent, "responded": responded,
+        "response_rate": rate, "pop_audits": summary["pop_audits"]
     })
 
 
+funnel_refreshed_at = 0.0
+
+
+@app.route("/api/funnel")
+@require_prospector_key
+def prospect_funnel():
+    """Searched → analyzed → audited → pitched → opened → clicked → responded, from the
+    funnel aggregate. ?by=niche|city|niche,city adds a breakdown; ?niche= and ?city= filter;
+    ?refresh=1 brings the aggregate up to date first."""
+    global funnel_refreshed_at
+    by = tuple(k for k in (request.args.get("by") or "").split(",") if k)
+    if any(k not in ("niche", "city") for k in by):
+        return jsonify({"error": "'by' must be niche, city or niche,city"}), 400
+    now = time.time()
+    if request.args.get("refresh") == "1" or now - funnel_refreshed_at > FUNNEL_REFRESH:
+        funnel_refreshed_at = now
+        try:
+            store.refresh_funnel()
+        except Exception as e:
+            app.logger.error(f"Funnel refresh failed: {e}")  # serve the last aggregate
+    totals, groups, refreshed_at = store.funnel(by, request.args.get("niche"), request.args.get("city"))
+
+    def rates(row):
+        # Percent of searched prospects that reached each stage (stages can be skipped, e.g. pitched unaudited)
+        return {stage: round(row[stage] / row["searched"] * 100, 1) if row["searched"] else 0
+                for stage in storage.FUNNEL_STAGES[1:]}
+
+    return jsonify({"success": True, "stages": storage.FUNNEL_STAGES, "totals": totals, "rates": rates(totals),
+                    "breakdown": [dict(g, rates=rates(g)) for g in groups], "refreshed_at": refreshed_at})
+
+
 @app.route("/api/mark_sent", methods=["POST", "GET"])
 @require_prospector_key
 def mark_sent():
     pid = request.args.get("prospect_id")
     method = request.args.get("contact_method", "email")
-    db = get_prospects_db()
-    db.execute("UPDATE prospects SET sent_date=?, contact_method=?, updated_at=? WHERE id=?", (now_str(), method, now_str(), pid))
-    db.commit()
+    store.update_prospect(pid, sent_date=now_str(), contact_method=method, updated_at=now_str())
     return jsonify({"success": True})
 
 
@@ -1255,9 +2091,7 @@ def mark_sent():
 @require_prospector_key
 def mark_response():
     pid = request.args.get("prospect_id")
-    db = get_prospects_db()
-    db.execute("UPDATE prospects SET response_date=?, updated_at=? WHERE id=?", (now_str(), now_str(), pid))
-    db.commit()
+    store.update_prospect(pid, response_date=now_str(), updated_at=now_str())
     return jsonify({"success": True})
 
 
@@ -1265,9 +2099,7 @@ def mark_response():
 @require_prospector_key
 def undo_sent():
     pid = request.args.get("prospect_id")
-    db = get_prospects_db()
-    db.execute("UPDATE prospects SET sent_date=NULL, contact_method=NULL, updated_at=? WHERE id=?", (now_str(), pid))
-    db.commit()
+    store.update_prospect(pid, sent_date=None, contact_method=None, updated_at=now_str())
     return jsonify({"success": True})
 
 
@@ -1275,22 +2107,16 @@ def undo_sent():
 @require_prospector_key
 def undo_response():
     pid = request.args.get("prospect_id")
-    db = get_prospects_db()
-    db.execute("UPDATE prospects SET response_date=NULL, updated_at=? WHERE id=?", (now_str(), pid))
-    db.commit()
+    store.update_prospect(pid, response_date=None, updated_at=now_str())
     return jsonify({"success": True})
 
 
 @app.route("/api/text")
 @require_prospector_key
 def text_summary():
-    db = get_prospects_db()
-    total = db.execute("SELECT COUNT(*) FROM prospects").fetchone()[0]
-    hot = db.execute("SELECT COUNT(*) FROM prospects WHERE prospect_status='hot'").fetchone()[0]
-    warm = db.execute("SELECT COUNT(*) FROM prospects WHERE prospect_status='warm'").fetchone()[0]
-    sent = db.execute("SELECT COUNT(*) FROM prospects WHERE sent_date IS NOT NULL").fetchone()[0]
-    responded = db.execute("SELECT COUNT(*) FROM prospects WHERE response_date IS NOT NULL").fetchone()[0]
-    pop = db.execute("SELECT COUNT(*) FROM prospects WHERE pop_audit_date IS NOT NULL").fetchone()[0]
+    summary = store.prospect_summary()
+    total, sent, responded, pop = summary["total"], summary["sent"], summary["responded"], summary["pop_audits"]
+    hot, warm = summary["by_status"].get("hot", 0), summary["by_status"].get("warm", 0)
 
     text = f"""📊 Smart Prospector Pipeline
 ━━━━━━━━━━━━━━━━━━━━
@@ -1303,25 +2129,13 @@ Total Prospects: {total}
     return jsonify({"success": True, "text": text})
 
 
-@app.route("/api/get_pop_report")
-@require_prospector_key
-def get_pop_report():
-    pid = request.args.get("prospect_id")
-    if not pid:
-        return jsonify({"error": "prospect_id required"}), 400
-    db = get_prospects_db()
-    prospect = row_to_dict(db.execute("SELECT id, business_name, website, pop_report_data, pop_audit_date, pop_score, pop_word_count_current, pop_word_count_target FROM prospects WHERE id = ?", (pid,)).fetchone())
-    if not prospect:
-        return jsonify({"error": "Prospect not found"}), 404
-    
-    pop_data = None
-    if prospect.get("pop_report_data"):
-        try:
-            pop_data = json.loads(prospect["pop_report_data"])
-        except Exception:
-            pop_data = prospect["pop_report_data"]
-    
-    # Extract processed metrics for the frontend modal
+def build_report_view(prospect, pop_data):
+    """Derive the report modal payload from a parsed pop_report_data document.
+
+    `prospect` needs business_name, website, pop_audit_date and the
+    pop_word_count_* columns. The result excludes prospect_id and pop_score,
+    which are spliced in at read time (see get_pop_report).
+    """
     metrics = None
     keyword = prospect.get("business_name", "")
     website = prospect.get("website", "")
@@ -1358,6 +2172,7 @@ def get_pop_report():
             wc_target = pre_metrics.get("word_count_target", 0) or word_count.get("target", 0) or prospect.get("pop_word_count_target", 0)
             wc_avg = pre_metrics.get("word_count_avg", 0) or word_count.get("competitorAvg", word_count.get("avg", 0))
 
+            missing_terms = list(pre_metrics.get("missing_terms", []))
             metrics = {
                 "page_score": round(page_score, 1) if page_score else 0,
                 "word_count_current": wc_current,
@@ -1375,20 +2190,22 @@ def get_pop_report():
                 "competitors": report.get("competitors", []),
                 "schema_types": report.get("schemaTypes", []),
                 "ai_schema_types": report.get("aiGenSchemaTypes", []),
-                "missing_terms": pre_metrics.get("missing_terms", []),
+                "missing_terms": missing_terms,
                 "target_schema": report.get("schemaTypes", []) or report.get("aiGenSchemaTypes", [])
             }
             
             # Extract all content brief terms
             if cb and cb.get("p"):
+                missing_seen = set(missing_terms)
                 for item in cb["p"]:
                     t = item.get("term", {})
                     brief = item.get("contentBrief", {})
                     current = brief.get("current", 0)
                     target_min = brief.get("targetMin", brief.get("target", 0))
                     target_max = brief.get("targetMax", target_min)
+                    phrase = t.get("phrase", "")
                     metrics["terms"].append({
-                        "phrase": t.get("phrase", ""),
+                        "phrase": phrase,
                         "current": current,
                         "target_min": target_min,
                         "target_max": target_max,
@@ -1396,19 +2213,57 @@ def get_pop_report():
                         "weight": t.get("weight", 0),
                         "met": current >= target_min if target_min > 0 else (current > 0)
                     })
-                    if current < target_min and target_min > 0 and t.get("phrase") not in metrics["missing_terms"]:
-                        metrics["missing_terms"].append(t.get("phrase", ""))
+                    if current < target_min and target_min > 0 and phrase not in missing_seen:
+                        missing_seen.add(phrase)
+                        missing_terms.append(phrase)
     
-    return jsonify({
-        "success": True, "prospect_id": pid,
-        "pop_audit_date": prospect.get("pop_audit_date"), "pop_score": prospect.get("pop_score"),
+    return {
+        "success": True,
+        "pop_audit_date": prospect.get("pop_audit_date"),
         "metrics": metrics, "keyword": keyword, "website": website,
         "audit_date": prospect.get("pop_audit_date")
-    })
+    }
+
+
+def render_report_view(prospect, pop_data):
+    """Serialize the report view for storage. Returns (view JSON, etag)."""
+    view = json.dumps(build_report_view(prospect, pop_data), separators=(",", ":"))
+    return view, hashlib.sha1(view.encode("utf-8")).hexdigest()[:16]
+
+
+@app.route("/api/get_pop_report")
+@require_prospector_key
+def get_pop_report():
+    """Serve the precomputed report view; built on first read after an audit."""
+    pid = request.args.get("prospect_id")
+    if not pid:
+        return jsonify({"error": "prospect_id required"}), 400
+    prospect = store.report_view(pid)
+    if not prospect:
+        return jsonify({"error": "Prospect not found"}), 404
+
+    view, etag = prospect["view"], prospect["etag"]
+    if view is None or prospect["view_date"] != prospect["pop_audit_date"]:
+        pop_data = None
+        if prospect["has_report"]:
+            raw = store.report_blob(pid)
+            try:
+                pop_data = json.loads(raw)
+            except Exception:
+                pop_data = raw
+        view, etag = render_report_view(prospect, pop_data)
+        store.put_report_view(prospect["id"], prospect["pop_audit_date"], etag, view)
+
+    # pop_score can change through rescoring without a new audit, so it is not part of the stored view
+    etag = f'"{etag}-{prospect["pop_score"]}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        return Response(status=304, headers={"ETag": etag})
+    body = f'{view[:-1]},"prospect_id":{json.dumps(pid)},"pop_score":{json.dumps(prospect["pop_score"])}}}'
+    return Response(body, mimetype="application/json", headers={"ETag": etag, "Cache-Control": "private, no-cache"})
 
 
 # ============================================================
-# HEALTH CHECK
+# BULK IMPORT
 # ============================================================
 
 @app.route("/api/bulk_import", methods=["POST"])
@@ -1419,35 +2274,9 @@ def bulk_import():
     if not data or not data.get("prospects"):
         return jsonify({"error": "prospects array required"}), 400
 
-    prospects = data["prospects"]
-    db = sqlite3.connect(PROSPECTS_DB_PATH)
-    imported = 0
-    skipped = 0
-
-    for p in prospects:
-        try:
-            db.execute("""INSERT OR REPLACE INTO prospects 
-                (id, business_name, website, phone, address, city, state, niche, rating, reviews,
-                 seo_score, prospect_score, prospect_status, issues, has_ssl,
-                 pitch_subject, pitch_body, pitch_date, sent_date, contact_method,
-                 response_date, pop_report_data, pop_audit_date, pop_score,
-                 search_query, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (p.get("id"), p.get("business_name"), p.get("website"), p.get("phone"),
-                 p.get("address"), p.get("city"), p.get("state"), p.get("niche"),
-                 p.get("rating"), p.get("reviews"), p.get("seo_score", 0),
-                 p.get("prospect_score", 0), p.get("prospect_status", "new"),
-                 p.get("issues"), p.get("has_ssl", 0),
-                 p.get("pitch_subject"), p.get("pitch_body"), p.get("pitch_date"),
-                 p.get("sent_date"), p.get("contact_method"), p.get("response_date"),
-                 p.get("pop_report_data"), p.get("pop_audit_date"), p.get("pop_score"),
-                 p.get("search_query"), p.get("created_at"), p.get("updated_at")))
-            imported += 1
-        except Exception as e:
-            skipped += 1
-
-    db.commit()
-    db.close()
+    imported, skipped = store.import_prospects(data["prospects"])
+    if imported:
+        store.reset_funnel()  # imported rows keep their own updated_at, so only a rebuild is sure to count them
     return jsonify({"success": True, "imported": imported, "skipped": skipped})
 
 
@@ -1459,17 +2288,7 @@ def bulk_import_searches():
     if not data or not data.get("searches"):
         return jsonify({"error": "searches array required"}), 400
 
-    db = sqlite3.connect(PROSPECTS_DB_PATH)
-    imported = 0
-    for s in data["searches"]:
-        try:
-            db.execute("INSERT OR REPLACE INTO searches (id, query, niche, location, result_count, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (s.get("id"), s.get("query"), s.get("niche"), s.get("location"), s.get("result_count"), s.get("created_at")))
-            imported += 1
-        except Exception:
-            pass
-    db.commit()
-    db.close()
+    imported = store.import_searches(data["searches"])
     return jsonify({"success": True, "imported": imported})
 
 
@@ -1502,8 +2321,8 @@ def dataforseo_api(endpoint, payload):
     if not DATAFORSEO_LOGIN or not DATAFORSEO_PASSWORD:
         return {}
     try:
-        r = http_requests.post(
-            f"https://api.dataforseo.com/v3/{endpoint}",
+        r = outbound.post(
+            "dataforseo", f"{DATAFORSEO_BASE}/{endpoint}",
             json=payload, auth=(DATAFORSEO_LOGIN, DATAFORSEO_PASSWORD), timeout=60
         )
         d = r.json()
@@ -1565,8 +2384,7 @@ def api_generate_proposal():
     # Get prospect data - either from DB or from request body
     prospect_id = data.get("prospect_id")
     if prospect_id:
-        db = get_prospects_db()
-        row = row_to_dict(db.execute("SELECT * FROM prospects WHERE id = ?", (prospect_id,)).fetchone())
+        row = store.get_prospect(prospect_id)
         if not row:
             return jsonify({"error": "Prospect not found"}), 404
         prospect = {
@@ -1610,52 +2428,158 @@ def api_generate_proposal():
 
 @app.route("/api/backfill_word_counts", methods=["POST"])
 @require_prospector_key
+@require_sqlite_storage
 def backfill_word_counts():
-    """Extract word counts from existing POP report JSON into dedicated columns."""
-    db = get_prospects_db()
-    # Add columns if missing
-    cols = [c[1] for c in db.execute("PRAGMA table_info(prospects)").fetchall()]
-    if "pop_word_count_current" not in cols:
-        db.execute("ALTER TABLE prospects ADD COLUMN pop_word_count_current INTEGER DEFAULT 0")
-    if "pop_word_count_target" not in cols:
-        db.execute("ALTER TABLE prospects ADD COLUMN pop_word_count_target INTEGER DEFAULT 0")
-    db.commit()
-    
-    rows = db.execute("SELECT id, pop_report_data FROM prospects WHERE pop_report_data IS NOT NULL AND pop_report_data != ''").fetchall()
-    updated = 0
-    for row in rows:
-        pid, raw = row
-        try:
-            data = json.loads(raw)
-            report = data.get("report_data", {}).get("report", data.get("report", {}))
-            wc = report.get("wordCount", {})
-            current = wc.get("current", 0)
-            target = wc.get("target", 0)
-            if current > 0 or target > 0:
-                db.execute("UPDATE prospects SET pop_word_count_current=?, pop_word_count_target=? WHERE id=?", (current, target, pid))
-                updated += 1
-        except Exception:
-            continue
-    db.commit()
-    return jsonify({"success": True, "updated": updated, "total_with_pop": len(rows)})
+    """Extract word counts from existing POP report JSON into dedicated columns (in the background)."""
+    return start_backfill("word_counts")
+
+
+# ============================================================
+# HEALTH CHECK
+# ============================================================
+# /health (and /health/live) is the liveness probe: no I/O, it only shows the
+# worker is serving. /health/ready runs readiness_checks() at most once per
+# HEALTH_CACHE_TTL per worker, on one background thread, so a probe storm or a
+# hung database costs one check, not one per probe. /health/deep adds row
+# estimates from metadata and background job state, for people, not probes, so
+# it always wants credentials: the metrics bearer token or the relay API key.
+
+process_started = time.time()
+health_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="health")
+health_lock = threading.Lock()
+health_result = None
+health_checked_at = 0.0
+health_pending = None
+STATUS_ORDER = ("ok", "degraded", "fail")
+
+
+def readiness_checks():
+    """{"status": worst of the checks, "checks": {...}}; "degraded" still serves traffic."""
+    checks = {}
+    start = time.perf_counter()
+    try:
+        store.check_writable()
+        checks["database"] = {"status": "ok", "backend": store.name, "ms": round((time.perf_counter() - start) * 1000, 1)}
+    except Exception as e:
+        checks["database"] = {"status": "fail", "backend": store.name, "error": str(e)}
+
+    # A buffer close to full is about to drop events; its writes are failing or falling behind
+    buffers = {"events": event_buffer, "webhooks": webhook_buffer}
+    depths = {name: b.depth() for name, b in buffers.items()}
+    depths["campaign_sends"] = campaign_queue.depth()
+    if store.name == "sqlite":
+        depths["prospects_writes"] = prospects_writer.depth()
+    backed_up = [name for name, b in buffers.items() if depths[name] >= b.max_pending * 0.9]
+    checks["queues"] = {"status": "degraded" if backed_up else "ok", "depths": depths, "backed_up": backed_up}
+
+    # An open breaker affects every instance alike, so it degrades rather than fails readiness
+    breakers = outbound.breaker_states()
+    tripped = sorted(name for name, b in breakers.items() if b["state"] != "closed")
+    checks["upstreams"] = {"status": "degraded" if tripped else "ok", "open": tripped, "breakers": breakers}
+
+    try:
+        disk = shutil.disk_usage(DB_DIR)
+        free_mb = disk.free / 2 ** 20
+        checks["disk"] = {"status": "fail" if free_mb < HEALTH_MIN_FREE_MB else "ok", "path": DB_DIR,
+                          "free_mb": round(free_mb), "used_pct": round(disk.used / disk.total * 100, 1)}
+    except OSError as e:
+        checks["disk"] = {"status": "fail", "path": DB_DIR, "error": str(e)}
+
+    status = max((c["status"] for c in checks.values()), key=STATUS_ORDER.index)
+    return {"status": status, "checked_at": now_str(), "checks": checks}
+
+
+def readiness():
+    """The last readiness result if fresh, else a new one (shared by concurrent callers)."""
+    global health_result, health_checked_at, health_pending
+    with health_lock:
+        if health_result and time.monotonic() - health_checked_at < HEALTH_CACHE_TTL:
+            return health_result
+        if health_pending is None:
+            health_pending = health_pool.submit(readiness_checks)
+        pending = health_pending
+    try:
+        result = pending.result(timeout=HEALTH_TIMEOUT)
+    except FutureTimeout:
+        # Still running; later probes wait on the same check instead of queueing new ones
+        return {"status": "fail", "checked_at": now_str(),
+                "checks": {"timeout": {"status": "fail", "error": f"checks took over {HEALTH_TIMEOUT:g}s"}}}
+    with health_lock:
+        if health_pending is pending:
+            health_pending = None
+            health_result, health_checked_at = result, time.monotonic()
+    return result
 
 
 @app.route("/health", methods=["GET"])
+@app.route("/health/live", methods=["GET"])
 def health():
-    try:
-        conn = sqlite3.connect(PROSPECTS_DB_PATH)
-        prospects_count = conn.execute("SELECT COUNT(*) FROM prospects").fetchone()[0]
-        conn.close()
-    except Exception:
-        prospects_count = 0
     return jsonify({
         "status": "ok",
         "services": ["email-relay", "email-tracking", "smart-prospector"],
         "provider": "resend",
         "tracking": True,
-        "prospects_count": prospects_count
     })
 
 
+@app.route("/health/ready", methods=["GET"])
+def health_ready():
+    result = readiness()
+    return jsonify(result), 503 if result["status"] == "fail" else 200
+
+
+@app.route("/health/deep", methods=["GET"])
+@require_ops_auth
+def health_deep():
+    result = dict(readiness())
+    try:
+        result["storage"] = store.table_estimates()
+    except Exception as e:
+        result["storage"] = {"error": str(e)}
+    result["process"] = {
+        "pid": os.getpid(), "uptime_s": round(time.time() - process_started),
+        "events": {"flushed": event_buffer.flushed, "dropped": event_buffer.dropped},
+        "webhooks": {"flushed": webhook_buffer.flushed, "dropped": webhook_buffer.dropped},
+        "campaign_sends": {"sent": campaign_queue.sent, "failed": campaign_queue.failed},
+        "sequences": {"enabled": SEQUENCES_ENABLED, "leader": sequence_runner.leader, "ticks": sequence_runner.ticks},
+        "upstream_latency": outbound.latency_histograms(),
+    }
+    return jsonify(result)
+
+
+@app.route("/api/profiles")
+@require_prospector_key
+def list_profiles():
+    summaries = []
+    if os.path.isdir(PROFILE_DIR):
+        names = sorted((p for p in os.listdir(PROFILE_DIR) if p.endswith(".json")),
+                       key=lambda p: os.path.getmtime(os.path.join(PROFILE_DIR, p)), reverse=True)
+        for name in names:
+            data = profiling.load(PROFILE_DIR, name[:-5])
+            if data:
+                summaries.append({k: data[k] for k in ("id", "request", "wall_ms", "samples", "sql_count", "sql_ms")})
+    return jsonify({"success": True, "profiles": summaries})
+
+
+@app.route("/api/profiles/<profile_id>")
+@require_prospector_key
+def get_profile(profile_id):
+    folded = request.args.get("format") == "folded"
+    data = profiling.load(PROFILE_DIR, profile_id, folded=folded)
+    if data is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if folded:
+        return Response(data, mimetype="text/plain")
+    return jsonify(data)
+
+
+@app.route("/metrics", methods=["GET"])
+@require_ops_auth
+def prometheus_metrics():
+    body, content_type = telemetry.render()
+    return Response(body, content_type=content_type)
+
+
 if __name__ == "__main__":
+    start_background_jobs()
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
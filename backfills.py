@@ -0,0 +1,175 @@
+"""Incremental, resumable data backfills over the prospects table.
+
+Each backfill walks prospects in keyset-paginated chunks (``id > last_id
+ORDER BY id LIMIT n``), commits its work and its checkpoint together after
+every chunk, and sleeps between chunks so live requests get the write lock
+regularly. Progress lives in the ``backfill_runs`` table (prospects
+migration 5), so a run that is interrupted (deploy, worker restart)
+resumes from its last chunk, and a finished run picks up only rows added
+since.
+
+A lease (owner + heartbeat) keeps two gunicorn workers from running the same
+backfill at once; a lease older than LEASE_SECONDS is considered abandoned.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from datetime import datetime as dt
+
+import scoring
+
+CHUNK_SIZE = int(os.environ.get("BACKFILL_CHUNK_SIZE", "200"))
+# Fraction of wall time a backfill may spend working; 0.25 sleeps 3x each chunk's duration
+DUTY_CYCLE = float(os.environ.get("BACKFILL_DUTY_CYCLE", "0.25"))
+MIN_SLEEP = 0.05
+LEASE_SECONDS = 60
+
+BACKFILLS = {}
+
+
+def backfill(name, columns, where):
+    """Register fn(db, rows, params) -> rows updated, run over `SELECT id, <columns> ... WHERE <where>`."""
+    def register(fn):
+        BACKFILLS[name] = {"columns": columns, "where": where, "process": fn}
+        return fn
+    return register
+
+
+def _now():
+    return dt.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# ============================================================
+# BACKFILLS
+# ============================================================
+
+@backfill("word_counts", columns="pop_report_data",
+          where="pop_report_data IS NOT NULL AND pop_report_data != ''")
+def backfill_word_counts(db, rows, params):
+    """Copy wordCount current/target from raw POP reports into dedicated columns."""
+    updates = []
+    for pid, raw in rows:
+        try:
+            data = json.loads(raw)
+            report = data.get("report_data", {}).get("report", data.get("report", {}))
+            wc = report.get("wordCount", {})
+            current = wc.get("current", 0)
+            target = wc.get("target", 0)
+        except Exception:
+            continue
+        if current > 0 or target > 0:
+            updates.append((current, target, pid))
+    db.executemany("UPDATE prospects SET pop_word_count_current=?, pop_word_count_target=? WHERE id=?", updates)
+    return len(updates)
+
+
+@backfill("pop_scores", columns=scoring.RESCORE_COLUMNS,
+          where="pop_report_data IS NOT NULL AND pop_report_data != ''")
+def backfill_pop_scores(db, rows, params):
+    """Extract scoring columns where missing and rescore with the requested rule version."""
+    return len(scoring.rescore_rows(db, rows, params.get("version")))
+
+
+# ============================================================
+# RUNNER
+# ============================================================
+
+def _remaining(db, spec, last_id):
+    return db.execute(f"SELECT COUNT(*) FROM prospects WHERE id > ? AND ({spec['where']})", (last_id,)).fetchone()[0]
+
+
+def start(connect, name, params=None, restart=False):
+    """Claim the lease for `name` and run it on a background thread.
+
+    `connect` opens a new prospects DB connection. A run whose params differ
+    from the checkpointed ones starts over. Returns (started, status dict).
+    """
+    spec = BACKFILLS[name]
+    params = params or {}
+    owner = uuid.uuid4().hex[:12]
+    db = connect()
+    try:
+        db.execute("INSERT OR IGNORE INTO backfill_runs (name, status, params, last_id) VALUES (?, 'pending', ?, 0)",
+                   (name, json.dumps(params)))
+        current = db.execute("SELECT params, last_id, processed FROM backfill_runs WHERE name = ?", (name,)).fetchone()
+        if restart or json.loads(current[0] or "{}") != params:
+            last_id, processed = 0, 0
+        else:
+            last_id, processed = current[1], current[2]
+        claimed = db.execute("""UPDATE backfill_runs SET status='running', owner=?, heartbeat=?, params=?,
+                last_id=?, processed=?, updated=CASE WHEN ? = 0 THEN 0 ELSE updated END, total=?,
+                error=NULL, started_at=?, updated_at=?, finished_at=NULL
+            WHERE name=? AND (status != 'running' OR heartbeat < ?)""",
+            (owner, time.time(), json.dumps(params), last_id, processed, last_id,
+             processed + _remaining(db, spec, last_id), _now(), _now(), name, time.time() - LEASE_SECONDS)).rowcount
+        db.commit()
+    finally:
+        db.close()
+    if claimed:
+        threading.Thread(target=_run, args=(connect, name, owner), name=f"backfill-{name}", daemon=True).start()
+    return bool(claimed), status(connect, name)
+
+
+def _run(connect, name, owner):
+    spec = BACKFILLS[name]
+    db = connect()
+    try:
+        while True:
+            row = db.execute("SELECT status, owner, last_id, params FROM backfill_runs WHERE name = ?", (name,)).fetchone()
+            if row is None or row[0] != "running" or row[1] != owner:
+                return  # cancelled, or the lease was taken over
+            last_id, params = row[2], json.loads(row[3] or "{}")
+            started = time.monotonic()
+            rows = db.execute(f"""SELECT id, {spec['columns']} FROM prospects
+                WHERE id > ? AND ({spec['where']}) ORDER BY id LIMIT ?""", (last_id, CHUNK_SIZE)).fetchall()
+            if not rows:
+                db.execute("""UPDATE backfill_runs SET status='complete', heartbeat=?, updated_at=?, finished_at=?
+                    WHERE name=? AND owner=?""", (time.time(), _now(), _now(), name, owner))
+                db.commit()
+                return
+            updated = spec["process"](db, rows, params)
+            db.execute("""UPDATE backfill_runs SET last_id=?, processed=processed+?, updated=updated+?,
+                heartbeat=?, updated_at=? WHERE name=? AND owner=?""",
+                (rows[-1][0], len(rows), updated, time.time(), _now(), name, owner))
+            db.commit()  # chunk and checkpoint land together
+            elapsed = time.monotonic() - started
+            time.sleep(max(MIN_SLEEP, elapsed * (1 - DUTY_CYCLE) / DUTY_CYCLE))
+    except Exception as e:
+        db.rollback()
+        db.execute("UPDATE backfill_runs SET status='error', error=?, updated_at=? WHERE name=? AND owner=?",
+                   (str(e), _now(), name, owner))
+        db.commit()
+    finally:
+        db.close()
+
+
+def cancel(connect, name):
+    db = connect()
+    try:
+        db.execute("UPDATE backfill_runs SET status='paused', updated_at=? WHERE name=? AND status='running'", (_now(), name))
+        db.commit()
+    finally:
+        db.close()
+    return status(connect, name)
+
+
+def status(connect, name=None):
+    db = connect()
+    try:
+        sql = "SELECT * FROM backfill_runs" + (" WHERE name = ?" if name else "") + " ORDER BY name"
+        cur = db.execute(sql, (name,) if name else ())
+        cols = [c[0] for c in cur.description]
+        runs = []
+        for values in cur.fetchall():
+            run = dict(zip(cols, values))
+            run["params"] = json.loads(run["params"] or "{}")
+            run["progress_pct"] = round(run["processed"] / run["total"] * 100, 1) if run["total"] else 100.0
+            run.pop("owner")
+            runs.append(run)
+    finally:
+        db.close()
+    if name:
+        return runs[0] if runs else {"name": name, "status": "never_run"}
+    return runs
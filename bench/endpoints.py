@@ -0,0 +1,310 @@
+"""Throughput and latency of the main endpoints against local upstream stubs.
+
+Starts stub servers for Resend, DataForSEO, POP and OpenRouter in this
+process (see stub_servers.py), seeds throwaway databases at production-ish
+scale, launches the app under gunicorn with the Procfile's worker/thread
+layout, then drives each scenario over real HTTP for a fixed time:
+
+- "t_open": the tracking pixel, spread over the seeded emails.
+- "send": /send with a tracking_id (Resend call plus email registration),
+  with the per-worker send rate limit lifted.
+- "api_list" / "api_list_hot": the dashboard list, unfiltered and by status.
+- "t_analytics": per-email analytics over the seeded events table.
+- "api_search": DataForSEO maps ingestion; every request is a new
+  keyword, so each one inserts `--search-limit` prospects.
+- "pop_jobs": `--pop-jobs` audits started at once through
+  /api/pop_audit_start and polled to completion; reports per-job
+  completion time and jobs/s.
+
+Results are written as JSON keyed by scenario, with the commit they ran
+against, so two runs can be diffed:
+
+    python bench/endpoints.py --seconds 10 --out /tmp/before.json
+    python bench/endpoints.py --only t_open send --events 100000
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime as dt
+
+import requests
+
+from prospects_concurrency import fake_report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import migrations  # noqa: E402
+import stub_servers  # noqa: E402
+
+API_KEY = "bench-relay-key"
+PROSPECTOR_KEY = "bench-prospector-key"
+NICHES = ["plumbing", "roofing", "dental", "hvac", "landscaping", "law"]
+STATUSES = ["hot"] + ["warm", "cold", "new"] * 6  # ~5% hot
+SCENARIOS = ["t_open", "send", "api_list", "api_list_hot", "t_analytics", "api_search", "pop_jobs"]
+
+
+# ============================================================
+# SETUP
+# ============================================================
+
+def seed(tmp, args):
+    """Create both databases with the app's schema and fill them. Returns the seeded email ids."""
+    prospects = sqlite3.connect(os.path.join(tmp, "prospects.db"))
+    migrations.migrate(prospects, migrations.PROSPECTS)
+    report = fake_report()
+    rows = ((f"Biz {i}", f"site{i}.example", f"+1555{i:07d}", random.choice(NICHES), "Austin", "TX",
+             STATUSES[i % len(STATUSES)], i % 100,
+             report if i % 10 == 0 else None, "2026-01-01 00:00:00" if i % 10 == 0 else None,
+             i % 100 if i % 10 == 0 else None) for i in range(1, args.prospects + 1))
+    prospects.executemany("""INSERT INTO prospects (business_name, website, phone, niche, city, state,
+        prospect_status, prospect_score, pop_report_data, pop_audit_date, pop_score)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    prospects.commit()
+    prospects.close()
+
+    tracking = sqlite3.connect(os.path.join(tmp, "tracking.db"))
+    migrations.migrate(tracking, migrations.TRACKING[:1])  # tables only; indexes are built after the load
+    email_ids = [f"seed-{i:06d}" for i in range(args.emails)]
+    tracking.executemany("INSERT INTO emails (id, subject, recipient, client, sent_at, resend_id) VALUES (?, ?, ?, ?, ?, ?)",
+                         ((eid, "Quick wins", f"owner{i}@example.com", "bench", f"2026-01-{1 + i % 28:02d}T09:00:00", eid)
+                          for i, eid in enumerate(email_ids)))
+    events = ((random.choice(email_ids), "click" if i % 10 == 0 else "open",
+               "https://example.com/" if i % 10 == 0 else None, f"10.0.{i % 256}.{i % 200}", "Mozilla/5.0",
+               f"2026-01-{1 + i % 28:02d}T{i % 24:02d}:00:00") for i in range(args.events))
+    tracking.executemany("INSERT INTO events (email_id, event_type, url, ip, user_agent, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                         events)
+    tracking.commit()
+    migrations.migrate(tracking, migrations.TRACKING)
+    tracking.close()
+    return email_ids
+
+
+def start_stubs(latency):
+    servers = {name: stub_servers.start_in_thread(name, latency=latency) for name in stub_servers.STUBS}
+    base = {name: f"http://127.0.0.1:{server.server_port}" for name, server in servers.items()}
+    return servers, {"RESEND_BASE": base["resend"], "DATAFORSEO_BASE": base["dataforseo"] + "/v3",
+                     "POP_BASE": base["pop"] + "/api", "OPENROUTER_BASE": base["openrouter"] + "/api/v1"}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(tmp, stub_env, args):
+    port = free_port()
+    env = dict(os.environ, **stub_env,
+               DB_PATH=os.path.join(tmp, "tracking.db"), PROSPECTS_DB_PATH=os.path.join(tmp, "prospects.db"),
+               PROFILE_DIR=os.path.join(tmp, "profiles"), PROMETHEUS_MULTIPROC_DIR=os.path.join(tmp, "metrics"),
+               API_KEY=API_KEY, PROSPECTOR_KEY=PROSPECTOR_KEY, RESEND_API_KEY="bench", SEND_RATE_LIMIT="1000000000",
+               DATAFORSEO_LOGIN="bench", DATAFORSEO_PASSWORD="bench", OPENROUTER_API_KEY="bench",
+               LEGACY_TRACKING="1")  # the pixel loads use unsigned /t/open?id= links
+    log = open(os.path.join(tmp, "gunicorn.log"), "w")
+    proc = subprocess.Popen(["gunicorn", "app:app", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}",
+                             "--workers", str(args.workers), "--threads", str(args.threads), "--timeout", "600"],
+                            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"gunicorn exited with {proc.returncode}; see {log.name}")
+        try:
+            if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                return proc, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    sys.exit(f"gunicorn did not become healthy; see {log.name}")
+
+
+# ============================================================
+# LOAD
+# ============================================================
+
+def percentiles(samples):
+    if not samples:
+        return {"n": 0}
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 2)
+    return {"n": len(samples), "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": round(samples[-1] * 1000, 2)}
+
+
+def drive(make_request, concurrency, seconds):
+    """Call make_request(session, i) from `concurrency` threads for `seconds`; i is a global counter."""
+    stop = threading.Event()
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+    latencies, errors, responses = [], {}, []
+
+    def worker():
+        session = requests.Session()
+        while not stop.is_set():
+            with lock:
+                i = next(counter)
+            start = time.perf_counter()
+            try:
+                resp = make_request(session, i)
+                status = resp.status_code
+            except requests.RequestException as e:
+                resp, status = None, type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                if status in (200, 302):
+                    latencies.append(elapsed)
+                    responses.append(resp)
+                else:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    result = {"requests_per_s": round(len(latencies) / wall, 1), "latency": percentiles(latencies), "errors": errors}
+    return result, responses
+
+
+def run_scenario(name, url, email_ids, args):
+    prospector = {"X-API-Key": PROSPECTOR_KEY}
+    relay = {"X-API-Key": API_KEY}
+    run_id = dt.utcnow().strftime("%H%M%S")
+    if name == "t_open":
+        return drive(lambda s, i: s.get(f"{url}/t/open", params={"id": random.choice(email_ids)}),
+                     args.concurrency, args.seconds)[0]
+    if name == "send":
+        return drive(lambda s, i: s.post(f"{url}/send", headers=relay, json={
+            "to": f"lead{i}@example.com", "subject": "A few quick wins", "html": "<p>Hi there</p>",
+            "tracking_id": f"bench-{run_id}-{i}", "client": "bench"}), args.concurrency, args.seconds)[0]
+    if name == "api_list":
+        return drive(lambda s, i: s.get(f"{url}/api/list", headers=prospector), args.concurrency, args.seconds)[0]
+    if name == "api_list_hot":
+        return drive(lambda s, i: s.get(f"{url}/api/list", params={"status": "hot"}, headers=prospector),
+                     args.concurrency, args.seconds)[0]
+    if name == "t_analytics":
+        return drive(lambda s, i: s.get(f"{url}/t/analytics", headers=relay), args.concurrency, args.seconds)[0]
+    if name == "api_search":
+        result, responses = drive(lambda s, i: s.get(f"{url}/api/search", headers=prospector, params={
+            "niche": f"bench niche {run_id} {i}", "location": "Austin, TX", "limit": args.search_limit}),
+            args.concurrency, args.seconds)
+        ingested = sum(r.json().get("count", 0) for r in responses)
+        result["prospects_ingested_per_s"] = round(ingested / args.seconds, 1)
+        return result
+    if name == "pop_jobs":
+        return run_pop_jobs(url, prospector, args)
+    raise ValueError(name)
+
+
+def run_pop_jobs(url, headers, args):
+    """Start every job at once, then poll until all finish; time each from start to completion."""
+    session = requests.Session()
+    pids = random.sample(range(1, args.prospects + 1), min(args.pop_jobs, args.prospects))
+    started, finished, failed = {}, {}, {}
+    t0 = time.perf_counter()
+    for pid in pids:
+        resp = session.post(f"{url}/api/pop_audit_start", params={"prospect_id": pid}, headers=headers)
+        if resp.status_code == 200:
+            started[resp.json()["job_id"]] = time.perf_counter()
+        else:
+            failed[f"start {pid}"] = resp.status_code
+    deadline = time.monotonic() + args.pop_timeout
+    pending = set(started)
+    while pending and time.monotonic() < deadline:
+        for job_id in list(pending):
+            resp = session.get(f"{url}/api/pop_audit_status", params={"job_id": job_id}, headers=headers)
+            body = resp.json()
+            if resp.status_code == 200 and body.get("status") == "running":
+                continue
+            # Status polls run on another worker can 404: jobs live in the worker that started them
+            if resp.status_code == 404:
+                continue
+            pending.discard(job_id)
+            if body.get("success"):
+                finished[job_id] = time.perf_counter() - started[job_id]
+            else:
+                failed[job_id] = body.get("error", resp.status_code)
+        time.sleep(args.pop_poll)
+    wall = time.perf_counter() - t0
+    return {"jobs": len(pids), "completed": len(finished), "failed": len(failed), "timed_out": len(pending),
+            "jobs_per_s": round(len(finished) / wall, 2), "completion": percentiles(list(finished.values())),
+            "errors": {str(k): str(v)[:200] for k, v in list(failed.items())[:5]}}
+
+
+# ============================================================
+# MAIN
+# ============================================================
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except OSError:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prospects", type=int, default=10000)
+    parser.add_argument("--emails", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads per scenario")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each scenario")
+    parser.add_argument("--search-limit", type=int, default=50, help="maps results per /api/search request")
+    parser.add_argument("--pop-jobs", type=int, default=20)
+    parser.add_argument("--pop-poll", type=float, default=0.2, help="seconds between status sweeps")
+    parser.add_argument("--pop-timeout", type=float, default=300)
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds added to every upstream response")
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, help="run just these scenarios")
+    parser.add_argument("--out", help="result file (default bench/results/endpoints-<commit>.json)")
+    args = parser.parse_args()
+
+    random.seed(1)
+    revision = git_revision()
+    tmp = tempfile.mkdtemp(prefix="relay-bench-")
+    started = time.perf_counter()
+    email_ids = seed(tmp, args)
+    seed_seconds = round(time.perf_counter() - started, 1)
+    _, stub_env = start_stubs(args.stub_latency)
+    proc, url = start_app(tmp, stub_env, args)
+    results = {}
+    try:
+        for name in args.only or SCENARIOS:
+            print(f"running {name}...", file=sys.stderr)
+            results[name] = run_scenario(name, url, email_ids, args)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("only", "out")}
+    report = {"commit": revision, "ran_at": dt.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+              "python": platform.python_version(), "cpus": os.cpu_count(), "config": config,
+              "seed_seconds": seed_seconds, "scenarios": results}
+    out = args.out or os.path.join(ROOT, "bench", "results", f"endpoints-{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps(report, indent=2, sort_keys=True))
+    print(f"wrote {out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Startup cost of the app: import time, and gunicorn boot with and without preload.
+
+"import": runs ``python -X importtime -c "import app"`` --runs times in fresh
+interpreters, against throwaway databases that the first run migrates. For
+each run it takes the cumulative time of the top-level ``app`` import. It
+reports the median and the slowest modules by cumulative time. It also
+lists which DEFERRED modules were loaded at import. Those modules are
+meant to load on first use, and the run exits non-zero if any of them
+show up, so a stray top-level import is caught.
+
+"boot": starts gunicorn with the Procfile layout, first with PRELOAD_APP=1
+and then with PRELOAD_APP=0. It times from exec until /health/live
+answers, and lets every worker finish booting. It also reports the CPU
+seconds the master and its workers used from start to shutdown. Each
+worker that imports the app itself adds one import's worth of CPU to that
+total. On a small instance that CPU goes to the import instead of to
+requests.
+
+    python bench/import_time.py --runs 10
+    python bench/import_time.py --only import --top 30 --out /tmp/import.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+
+from endpoints import free_port
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED = ("bs4", "email.mime")  # loaded on first use, never at startup
+
+
+def import_profile(env):
+    """{module: (self_us, cumulative_us)} from one `python -X importtime -c "import app"`."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode:
+        sys.exit(f"import app failed:\n{proc.stderr[-2000:]}")
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative))
+    return modules
+
+
+def measure_import(env, runs, top):
+    import_profile(env)  # migrate the scratch databases, warm the .pyc cache
+    totals, slowest, deferred = [], {}, set()
+    for _ in range(runs):
+        modules = import_profile(env)
+        totals.append(modules["app"][1] / 1000)
+        for name, (_, cumulative) in modules.items():
+            slowest.setdefault(name, []).append(cumulative / 1000)
+        deferred |= {m for m in modules if m.split(".")[0] in DEFERRED or m in DEFERRED}
+    ranked = sorted(((statistics.median(v), k) for k, v in slowest.items() if k != "app"), reverse=True)[:top]
+    return {"app_ms": {"median": round(statistics.median(totals), 1), "min": round(min(totals), 1),
+                       "max": round(max(totals), 1)},
+            "slowest_ms": {name: round(ms, 1) for ms, name in ranked},
+            "deferred_loaded": sorted(deferred)}
+
+
+def wait_live(url, proc, deadline):
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            if requests.get(f"{url}/health/live", timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.02)
+    return False
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure_boot(env, tmp, args, preload):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    log = open(os.path.join(tmp, f"gunicorn-preload{preload}.log"), "w")
+    cpu = children_cpu()
+    start = time.monotonic()
+    proc = subprocess.Popen(["gunicorn", "app:app", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}",
+                             "--workers", str(args.workers), "--threads", str(args.threads)],
+                            cwd=ROOT, env=dict(env, PRELOAD_APP=str(preload), PROMETHEUS_MULTIPROC_DIR=os.path.join(tmp, "metrics")),
+                            stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not wait_live(url, proc, start + 60):
+            sys.exit(f"gunicorn did not come up; see {log.name}")
+        boot = time.monotonic() - start
+        time.sleep(2)  # the other workers finish booting
+    finally:
+        proc.terminate()
+        proc.wait()
+    # Workers are reaped by the master, and the master by us, so their CPU is counted here
+    return {"first_ready_s": round(boot, 3), "cpu_s": round(children_cpu() - cpu, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=["import", "boot"], default=["import", "boot"])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="relay-bench-")
+    env = dict(os.environ, DB_PATH=os.path.join(tmp, "tracking.db"), PROSPECTS_DB_PATH=os.path.join(tmp, "prospects.db"),
+               SEQUENCES_ENABLED="0")
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)  # a plain import, as in a single process; gunicorn.conf.py sets it for boot
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    report = {"commit": commit, "python": sys.version.split()[0]}
+    if "import" in args.only:
+        report["import"] = measure_import(env, args.runs, args.top)
+    if "boot" in args.only:
+        report["boot"] = {f"preload={p}": measure_boot(env, tmp, args, p) for p in (1, 0)}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if report.get("import", {}).get("deferred_loaded"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""CPU cost of tracking-link rewriting in /send, by body size.
+
+Builds newsletter-style HTML bodies (paragraphs, inline-styled links with
+utm parameters, a footer with mailto/anchor links) and times:
+
+- "streaming": tracking_links.rewrite_html(), as /send runs it. One regex
+  pass, each unique link signed once, pixel added before </body>.
+- "dom": the same rewrite done by parsing into a BeautifulSoup tree and
+  serialising it back, for scale.
+
+Reported per size: mean and p99 milliseconds per body.
+
+    python bench/link_rewrite.py --sizes 20 100 250 --links 15 40 100
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import tracking_links
+from bs4 import BeautifulSoup
+
+BASE = "https://track.example.com"
+FOOTER = ('<p style="font-size:11px"><a href="mailto:hello@example.com">Contact</a> · '
+          '<a href="#top">Back to top</a> · <a href="https://example.com/unsubscribe?u=1&amp;l=2">Unsubscribe</a></p>')
+
+
+def newsletter(kb, links):
+    words = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor. "
+    para = words * max(1, kb * 1024 // (links * len(words)))
+    items = "".join(f'<tr><td style="padding:8px"><p>{para}</p><a style="color:#0066cc;font-weight:bold" '
+                    f'href="https://shop.example.com/item/{i}?utm_source=newsletter&amp;utm_medium=email">Read more</a>'
+                    f'</td></tr>\n' for i in range(links))
+    return f'<html><head><title>News</title></head><body><table width="600">{items}</table>{FOOTER}</body></html>'
+
+
+def dom_rewrite(markup, click_url, pixel_url):
+    soup = BeautifulSoup(markup, "html.parser")
+    targets, index = [], {}
+    for a in soup.find_all("a", href=True):
+        url = a["href"].strip()
+        if not url.lower().startswith(("http://", "https://")):
+            continue
+        if url not in index:
+            index[url] = len(targets)
+            targets.append(url)
+        a["href"] = click_url(index[url])
+    pixel = soup.new_tag("img", src=pixel_url, width="1", height="1", alt="")
+    (soup.body or soup).append(pixel)
+    return str(soup), targets
+
+
+def measure(fn, markup, rounds):
+    signer = tracking_links.Signer("bench-secret")
+    times = []
+    for i in range(rounds):
+        email_id = f"bench-{i}"
+        start = time.perf_counter()
+        fn(markup, lambda n: f"{BASE}/t/c/{signer.click_token(email_id, n)}", f"{BASE}/t/o/{signer.open_token(email_id)}")
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {"mean_ms": round(sum(times) / len(times) * 1e3, 3), "p99_ms": round(times[int(len(times) * 0.99)] * 1e3, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 100, 250], help="body sizes (KB)")
+    parser.add_argument("--links", type=int, nargs="+", default=[15, 40, 100], help="links per body, paired with --sizes")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    results = []
+    for kb, links in zip(args.sizes, args.links):
+        markup = newsletter(kb, links)
+        results.append({"kb": round(len(markup) / 1024), "links": links,
+                        "streaming": measure(tracking_links.rewrite_html, markup, args.rounds),
+                        "dom": measure(dom_rewrite, markup, max(10, args.rounds // 20))})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
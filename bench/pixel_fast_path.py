@@ -0,0 +1,100 @@
+"""Per-worker cost of /t/open: the raw WSGI fast path vs the old Flask route.
+
+Both variants are called as WSGI apps from this thread, with no HTTP server
+in between, so the numbers are the app's own cost per hit, i.e. the ceiling
+on pixels/s per worker thread:
+
+- "flask_route": the pre-fast-path handler, registered here as a Flask
+  route. Request context, CORS, before/after hooks and one SQLite insert
+  and commit per hit.
+- "flask_buffered": the same Flask route queuing on the event buffer,
+  to separate the batching gain from the routing gain.
+- "fast_path": /t/open as served now. Query-string parse, preallocated GIF,
+  and a buffered event. The buffered variants include the time to write
+  their rows at the end of each round.
+
+    python bench/pixel_fast_path.py --requests 20000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def call(wsgi, environ):
+    out = []
+    body = wsgi(dict(environ), lambda status, headers, exc_info=None: out.append(status))
+    b"".join(body)
+    if hasattr(body, "close"):
+        body.close()
+    return out[0]
+
+
+def measure(wsgi, environ, n, flush=None):
+    start = time.perf_counter()
+    for _ in range(n):
+        call(wsgi, environ)
+    if flush:
+        flush()
+    elapsed = time.perf_counter() - start
+    return {"requests_per_s": round(n / elapsed), "mean_us": round(elapsed / n * 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="relay-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmp, "tracking.db")
+    os.environ["PROSPECTS_DB_PATH"] = os.path.join(tmp, "prospects.db")
+    os.environ["LEGACY_TRACKING"] = "1"  # unsigned /t/open?id= hits are recorded, as in the old route
+    sys.path.insert(0, ROOT)
+    import app as relay
+    from werkzeug.test import EnvironBuilder
+
+    def flask_open():
+        request = relay.request
+        email_id = request.args.get("id", "")
+        if email_id:
+            relay.store.record_event(email_id, "open", None, request.remote_addr or "",
+                                     request.headers.get("User-Agent", ""), relay.dt.utcnow().isoformat())
+        return relay.Response(relay.PIXEL_GIF, mimetype="image/gif",
+                              headers={"Cache-Control": "no-cache, no-store, must-revalidate"})
+
+    def flask_buffered():
+        request = relay.request
+        relay.event_buffer.add((request.args.get("id", ""), "open", None, request.remote_addr or "",
+                                request.headers.get("User-Agent", ""), relay.dt.utcnow().isoformat()))
+        return relay.Response(relay.PIXEL_GIF, mimetype="image/gif",
+                              headers={"Cache-Control": "no-cache, no-store, must-revalidate"})
+
+    relay.app.add_url_rule("/bench/flask-open", "bench_flask_open", flask_open)
+    relay.app.add_url_rule("/bench/flask-buffered", "bench_flask_buffered", flask_buffered)
+    headers = {"User-Agent": "Mozilla/5.0 (bench)"}
+    environs = {name: EnvironBuilder(path=path, query_string="id=bench-1", headers=headers).get_environ()
+                for name, path in (("flask_route", "/bench/flask-open"), ("flask_buffered", "/bench/flask-buffered"),
+                                   ("fast_path", "/t/open"))}
+    wsgi = relay.app.wsgi_app
+    assert all(call(wsgi, env).startswith("200") for env in environs.values())
+    relay.event_buffer.interval = 3600  # flush only when measure() asks, so the write cost is counted once
+    relay.event_buffer.batch_max = args.requests + 1
+
+    results = {name: [] for name in environs}
+    for i in range(args.rounds):
+        # Alternate the order so no variant always runs against the larger events table
+        for name in (list(environs) if i % 2 == 0 else list(environs)[::-1]):
+            flush = relay.event_buffer.flush if name != "flask_route" else None
+            results[name].append(measure(wsgi, environs[name], args.requests, flush))
+    best = {name: max(rounds, key=lambda r: r["requests_per_s"]) for name, rounds in results.items()}
+    best["speedup"] = round(best["fast_path"]["requests_per_s"] / best["flask_route"]["requests_per_s"], 1)
+    print(json.dumps(best, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Overhead of /metrics instrumentation on the /t/open pixel path.
+
+Two measurements, using throwaway databases in a temp dir:
+
+- "direct": the exact metric calls one pixel request makes (request hooks
+  plus one observation per SQLite statement), timed in a tight loop. This
+  is the number to watch; it is free of disk noise.
+- "end_to_end": the pixel through Flask's test client with instrumentation
+  on and off (hooks removed, plain sqlite3 connections). SQLite commit
+  latency varies by tens of microseconds, so treat this as a sanity check.
+
+/t/open no longer runs through Flask or write per hit (see
+bench/pixel_fast_path.py), so this now bounds the per-request metric cost
+of the other Flask routes rather than of the pixel itself.
+
+    python bench/pixel_metrics.py --requests 5000
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(client, n):
+    samples = []
+    for i in range(n):
+        start = time.perf_counter()
+        resp = client.get(f"/t/open?id=bench-{i % 200}")
+        samples.append(time.perf_counter() - start)
+        assert resp.status_code == 200
+    samples.sort()
+    return {
+        "mean_us": round(statistics.fmean(samples) * 1e6, 1),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "p99_us": round(samples[int(len(samples) * 0.99)] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="relay-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmp, "tracking.db")
+    os.environ["PROSPECTS_DB_PATH"] = os.path.join(tmp, "prospects.db")
+    os.environ["LEGACY_TRACKING"] = "1"  # unsigned /t/open?id= hits are recorded, as in the old route
+    sys.path.insert(0, ROOT)
+    import app as relay
+
+    client = relay.app.test_client()
+    instrumented_connect = relay.connect_db
+    hooks = (relay.start_request_timer, relay.record_request_metrics)
+
+    def plain_connect(path, name):
+        return sqlite3.connect(path)
+
+    def set_instrumented(on):
+        before = relay.app.before_request_funcs.setdefault(None, [])
+        after = relay.app.after_request_funcs.setdefault(None, [])
+        if on:
+            relay.connect_db = instrumented_connect
+            if hooks[0] not in before:
+                before.append(hooks[0])
+                after.append(hooks[1])
+        else:
+            relay.connect_db = plain_connect
+            if hooks[0] in before:
+                before.remove(hooks[0])
+                after.remove(hooks[1])
+
+    run(client, 200)  # warm up
+    results = {"instrumented": [], "bare": []}
+    for i in range(args.rounds):
+        # Alternate the order so neither mode always runs against the larger events table
+        for mode in (("bare", "instrumented") if i % 2 == 0 else ("instrumented", "bare")):
+            set_instrumented(mode == "instrumented")
+            results[mode].append(run(client, args.requests))
+
+    end_to_end = {mode: min(rounds, key=lambda r: r["mean_us"]) for mode, rounds in results.items()}
+    direct_us = direct_cost(relay, count_statements(relay, client), args.requests)
+    print(json.dumps({
+        "direct": {"per_request_us": direct_us,
+                   "pct_of_pixel": round(direct_us / end_to_end["bare"]["mean_us"] * 100, 2)},
+        "end_to_end": end_to_end,
+    }, indent=2))
+
+
+def count_statements(relay, client):
+    """How many timed SQLite calls (execute/commit) one pixel hit makes."""
+    metrics = relay.telemetry
+    calls = []
+    original = metrics.DB_QUERY_LATENCY.labels
+
+    def counting(*labels):
+        calls.append(labels)
+        return original(*labels)
+
+    metrics.DB_QUERY_LATENCY.labels = counting
+    try:
+        client.get("/t/open?id=bench-count")
+    finally:
+        metrics.DB_QUERY_LATENCY.labels = original
+    return calls
+
+
+def direct_cost(relay, statements, n):
+    metrics = relay.telemetry
+    with relay.app.test_request_context("/t/open?id=bench"):
+        relay.app.preprocess_request()  # binds url_rule like a real dispatch
+        response = relay.Response(relay.PIXEL_GIF, mimetype="image/gif")
+        start = time.perf_counter()
+        for _ in range(n):
+            relay.start_request_timer()
+            for labels in statements:
+                t0 = time.perf_counter()
+                metrics.DB_QUERY_LATENCY.labels(*labels).observe(time.perf_counter() - t0)
+            relay.record_request_metrics(response)
+        return round((time.perf_counter() - start) / n * 1e6, 2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""End-to-end POP audit throughput against the offline POP simulator.
+
+Runs the real audit job (/api/pop_audit_start -> _run_pop_audit_job ->
+save_pop_audit) in-process against pop_simulator.py, for every
+combination of polling interval and concurrency (audits in flight), and
+reports per combination:
+
+- audits/min and completion time percentiles;
+- outcomes (complete, or the error each failed job ended with);
+- POP calls per audit and the simulator's detection delay: how long a
+  finished task waited before a poll picked it up. Lower intervals cut the
+  delay and cost more polls.
+
+Intervals, the poll timeout (600s) and the create-report retry delay (10s)
+are given in real-API seconds and multiplied by --time-scale along with
+the simulated task durations, so results transfer back to production
+settings. Use --replay to drive the jobs from a recorder log instead of a
+scenario (see pop_simulator.py).
+
+    python bench/pop_pipeline.py --scenario live --time-scale 0.01 --intervals 1 3 10 --concurrency 1 4 16
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from prospects_concurrency import seed, percentiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(relay, sim, client, headers, pids, interval, concurrency, args):
+    relay.POP_POLL_INTERVAL = interval * args.time_scale
+    sim.reset()
+    queue = list(pids)
+    in_flight, completions, outcomes = {}, [], {}
+    started = time.perf_counter()
+    while queue or in_flight:
+        while queue and len(in_flight) < concurrency:
+            resp = client.post(f"/api/pop_audit_start?prospect_id={queue.pop()}", headers=headers)
+            in_flight[resp.get_json()["job_id"]] = time.perf_counter()
+        for job_id, job_started in list(in_flight.items()):
+            job = relay.pop_jobs[job_id]
+            if job["status"] == "running":
+                continue
+            del in_flight[job_id]
+            if job["status"] == "complete":
+                completions.append(time.perf_counter() - job_started)
+                outcome = "complete"
+            else:
+                outcome = job.get("error", "")[:80]
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        time.sleep(0.01)
+    wall = time.perf_counter() - started
+    stats = sim.stats()
+    return {"interval_s": interval, "concurrency": concurrency, "audits": len(pids),
+            "audits_per_min": round(len(completions) / wall * 60, 1), "wall_s": round(wall, 2),
+            "completion": percentiles(completions), "outcomes": outcomes,
+            "pop_calls_per_audit": round((stats["get_terms"] + stats["create_report"] + stats["polls"]) / len(pids), 1),
+            "simulator": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="live")
+    parser.add_argument("--replay", help="recorder log to replay instead of --scenario")
+    parser.add_argument("--time-scale", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--audits", type=int, default=40, help="audits per combination")
+    parser.add_argument("--intervals", type=float, nargs="+", default=[1, 3, 10], help="real-API poll intervals (s)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--out", help="also write the results to this file")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="relay-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmp, "tracking.db")
+    os.environ["PROSPECTS_DB_PATH"] = os.path.join(tmp, "prospects.db")
+    sys.path.insert(0, ROOT)
+    import app as relay
+    import stub_servers
+    import pop_simulator
+
+    relay.app.logger.setLevel("WARNING")  # one INFO line per poll otherwise
+    sim = pop_simulator.Simulator(args.scenario, time_scale=args.time_scale, seed=args.seed, replay=args.replay)
+    server = stub_servers.start_in_thread("pop", routes=sim.routes())
+    relay.POP_BASE = f"http://127.0.0.1:{server.server_port}/api"
+    relay.POP_POLL_TIMEOUT = 600 * args.time_scale
+    relay.POP_RETRY_DELAY = 10 * args.time_scale
+
+    seed(relay.PROSPECTS_DB_PATH, args.audits)
+    client = relay.app.test_client()
+    headers = {"X-API-Key": relay.PROSPECTOR_KEY}
+    pids = list(range(1, args.audits + 1))
+    results = []
+    for interval in args.intervals:
+        for concurrency in args.concurrency:
+            print(f"interval {interval}s, concurrency {concurrency}...", file=sys.stderr)
+            results.append(run(relay, sim, client, headers, pids, interval, concurrency, args))
+
+    report = {"scenario": "replay" if args.replay else args.scenario, "time_scale": args.time_scale,
+              "seed": args.seed, "runs": results}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
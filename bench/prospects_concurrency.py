@@ -0,0 +1,172 @@
+"""Dashboard read latency while /api/bulk_import is writing to prospects.db.
+
+Reader threads loop over /api/list?status=hot, /api/stats and
+/api/get_pop_report through Flask's test client while a second process
+(standing in for another gunicorn worker) posts bulk imports back to back,
+so readers contend with the import on SQLite locks rather than on the GIL.
+Each journal mode runs in a fresh process against its own seeded database:
+
+- "wal": the shipped setup (WAL, read-only pool, single writer thread).
+- "delete": the same code with the database switched back to the rollback
+  journal, i.e. how readers behaved before; they wait for (or time out on)
+  every import transaction.
+
+Reported per mode: reader latency idle and under write load, reader errors,
+and import throughput.
+
+    python bench/prospects_concurrency.py --prospects 10000 --readers 4 --seconds 10
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READ_PATHS = ["/api/list?status=hot", "/api/stats", "/api/get_pop_report?prospect_id={pid}"]
+
+
+def fake_report(terms=300):
+    """A POP report blob of realistic size (~30KB) with a content brief."""
+    return json.dumps({"metrics": {"page_score": 30, "word_count_current": 400, "word_count_target": 900,
+                                   "missing_terms": ["a", "b"]},
+                       "report_data": {"report": {"wordCount": {"current": 400, "target": 900},
+                                                  "cleanedContentBrief": {"p": [
+                                                      {"term": {"phrase": f"term {i}", "type": "lsi", "weight": 1},
+                                                       "contentBrief": {"current": i % 4, "targetMin": 2, "targetMax": 5}}
+                                                      for i in range(terms)]}}}})
+
+
+def seed(path, n):
+    db = sqlite3.connect(path)
+    statuses = ["hot"] + ["warm", "cold", "new"] * 6  # ~5% hot, so /api/list?status=hot stays a dashboard-sized page
+    report = fake_report()
+    db.executemany("""INSERT INTO prospects (business_name, website, niche, prospect_status, prospect_score,
+            pop_report_data, pop_audit_date, pop_score) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        [(f"Biz {i}", f"site{i}.example", random.choice(["plumbing", "roofing", "dental"]),
+          statuses[i % len(statuses)], i % 100, report if i % 3 == 0 else None,
+          "2026-01-01 00:00:00" if i % 3 == 0 else None, i % 100) for i in range(1, n + 1)])
+    db.commit()
+    db.close()
+
+
+def percentiles(samples):
+    if not samples:
+        return {"n": 0}
+    samples = sorted(samples)
+    return {"n": len(samples),
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+            "p99_ms": round(samples[int(len(samples) * 0.99)] * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2)}
+
+
+def read_loop(relay, headers, n_prospects, stop, latencies, errors):
+    client = relay.app.test_client()
+    while not stop.is_set():
+        template = random.choice(READ_PATHS)
+        start = time.perf_counter()
+        resp = client.get(template.format(pid=random.randint(1, n_prospects)), headers=headers)
+        elapsed = time.perf_counter() - start
+        if resp.status_code == 200:
+            latencies.append((template.split("?")[0], elapsed))
+        else:
+            errors.append(resp.status_code)
+
+
+def import_loop(relay, headers, n_prospects, batch, seconds):
+    client = relay.app.test_client()
+    report = fake_report()
+    imported = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        base = random.randint(1, max(1, n_prospects - batch))
+        rows = [{"id": base + i, "business_name": f"Imported {base + i}", "website": f"site{base + i}.example",
+                 "prospect_status": "warm", "prospect_score": 50, "pop_report_data": report,
+                 "pop_audit_date": "2026-02-01 00:00:00"} for i in range(batch)]
+        resp = client.post("/api/bulk_import", json={"prospects": rows}, headers=headers)
+        if resp.status_code == 200:
+            imported += resp.get_json()["imported"]
+    return imported
+
+
+def phase(relay, headers, args, writing):
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=read_loop, args=(relay, headers, args.prospects, stop, latencies, errors))
+               for _ in range(args.readers)]
+    importer = None
+    if writing:
+        importer = subprocess.Popen(argv(args, "--importer"), stdout=subprocess.PIPE, text=True)
+        time.sleep(1)  # let it import the app before readers start the clock
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    result = {"reads": percentiles([t for _, t in latencies]), "read_errors": len(errors),
+              "by_route": {route: percentiles([t for r, t in latencies if r == route])
+                           for route in sorted({r for r, _ in latencies})}}
+    if importer:
+        out, _ = importer.communicate()
+        result["imported_rows_per_s"] = round(int(out.strip().splitlines()[-1]) / args.seconds)
+    return result
+
+
+def argv(args, role):
+    return [sys.executable, __file__, role, args.child or "wal", "--prospects", str(args.prospects),
+            "--readers", str(args.readers), "--batch", str(args.batch), "--seconds", str(args.seconds)]
+
+
+def child(args):
+    tmp = tempfile.mkdtemp(prefix="relay-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmp, "tracking.db")
+    os.environ["PROSPECTS_DB_PATH"] = os.path.join(tmp, "prospects.db")  # inherited by the importer
+    sys.path.insert(0, ROOT)
+    import app as relay
+
+    seed(relay.PROSPECTS_DB_PATH, args.prospects)
+    if args.child == "delete":
+        # No pooled or writer connection is open yet, so the switch takes effect
+        db = sqlite3.connect(relay.PROSPECTS_DB_PATH)
+        db.execute("PRAGMA journal_mode=DELETE")
+        db.close()
+    headers = {"X-API-Key": relay.PROSPECTOR_KEY}
+    client = relay.app.test_client()
+    for pid in range(1, args.prospects + 1, 3):  # build report views up front so reads stay reads
+        client.get(f"/api/get_pop_report?prospect_id={pid}", headers=headers)
+    print(json.dumps({"idle": phase(relay, headers, args, writing=False),
+                      "bulk_import": phase(relay, headers, args, writing=True)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prospects", type=int, default=10000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=2000, help="rows per bulk import request")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--child", choices=["wal", "delete"], help=argparse.SUPPRESS)
+    parser.add_argument("--importer", choices=["wal", "delete"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.importer:
+        sys.path.insert(0, ROOT)
+        import app as relay
+        return print(import_loop(relay, {"X-API-Key": relay.PROSPECTOR_KEY}, args.prospects, args.batch, args.seconds + 1))
+    if args.child:
+        return child(args)
+
+    results = {}
+    for mode in ("wal", "delete"):
+        args.child = mode
+        out = subprocess.run(argv(args, "--child"), capture_output=True, text=True, check=True)
+        results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
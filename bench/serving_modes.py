@@ -0,0 +1,84 @@
+"""Sync threads vs gevent workers (SERVING_MODE) under slow upstreams.
+
+For each mode the app runs under gunicorn with the Procfile's worker and
+thread counts, against stub upstreams that add --upstream-latency to every
+response. Two loads run at once:
+
+- `--senders` client threads posting /send, i.e. requests that spend
+  nearly all their time waiting on Resend;
+- `--pixels` client threads hitting /t/open, to see what the waiting
+  senders do to pixel latency.
+
+With threads, a worker holds at most --threads requests, so /send
+throughput is capped near workers * threads / upstream latency and pixels
+queue behind the senders. With gevent the cap is GEVENT_CONNECTIONS.
+
+    python bench/serving_modes.py --senders 200 --upstream-latency 0.25 --seconds 15
+"""
+import sys
+import json
+import argparse
+import tempfile
+import threading
+import importlib.util
+
+from endpoints import seed, start_stubs, start_app, drive, API_KEY
+
+
+def run_mode(mode, email_ids, args):
+    tmp = tempfile.mkdtemp(prefix=f"relay-bench-{mode}-")
+    seed(tmp, args)
+    _, stub_env = start_stubs(args.upstream_latency)
+    proc, url = start_app(tmp, dict(stub_env, SERVING_MODE=mode), args)
+    headers = {"X-API-Key": API_KEY}
+    results = {}
+
+    def sends():
+        results["send"] = drive(lambda s, i: s.post(f"{url}/send", headers=headers, json={
+            "to": f"lead{i}@example.com", "subject": "A few quick wins", "html": "<p>Hi</p>",
+            "tracking_id": f"{mode}-{i}"}), args.senders, args.seconds)[0]
+
+    def pixels():
+        results["t_open"] = drive(lambda s, i: s.get(f"{url}/t/open", params={"id": email_ids[i % len(email_ids)]}),
+                                  args.pixels, args.seconds)[0]
+
+    try:
+        threads = [threading.Thread(target=sends), threading.Thread(target=pixels)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        proc.terminate()
+        proc.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--senders", type=int, default=200)
+    parser.add_argument("--pixels", type=int, default=4)
+    parser.add_argument("--upstream-latency", type=float, default=0.25)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--out", help="also write the results to this file")
+    args = parser.parse_args()
+    # Small databases: this measures the serving model, not the queries
+    args.prospects, args.emails, args.events = 100, 200, 1000
+
+    report = {"config": vars(args), "modes": {}}
+    for mode in ("threads", "gevent"):
+        if mode == "gevent" and importlib.util.find_spec("gevent") is None:
+            report["modes"][mode] = {"skipped": "gevent is not installed"}
+            continue
+        print(f"running {mode}...", file=sys.stderr)
+        report["modes"][mode] = run_mode(mode, [f"seed-{i:06d}" for i in range(args.emails)], args)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
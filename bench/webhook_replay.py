@@ -0,0 +1,119 @@
+"""Replay signed Resend webhooks against the app to load-test ingestion.
+
+Every request is a Resend-style event, signed the way Resend signs them
+(webhooks.sign) with a fresh svix-id and timestamp. Events are either
+synthetic or replayed from a capture. Synthetic events follow a realistic
+mix of delivered, opened, clicked, bounced and complained, for the seeded
+emails. A capture is a JSONL file with one webhook payload per line, and
+its events are re-signed on the way out. `--duplicates` re-sends that
+fraction of events under an id already used, the way Resend's retries do.
+
+By default this seeds throwaway databases, starts the app under gunicorn
+with a webhook secret, drives it for --seconds, then reads tracking.db to
+check that every accepted event was written (after the buffer's flush
+interval). A repeat that lands on a different worker than the original
+is written twice, since de-duplication is per worker. Pass --url and
+--secret to aim it at an app that is already running instead; the write
+check is skipped then.
+
+    python bench/webhook_replay.py --concurrency 8 --seconds 10
+    python bench/webhook_replay.py --file captured.jsonl --url http://127.0.0.1:8000 --secret whsec_...
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+from endpoints import seed, start_stubs, start_app, drive
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import webhooks  # noqa: E402
+
+MIX = [("email.delivered", 60), ("email.opened", 25), ("email.clicked", 8), ("email.bounced", 5),
+       ("email.complained", 2)]
+
+
+def synthetic_event(i, emails):
+    kind = random.choices([k for k, _ in MIX], [w for _, w in MIX])[0]
+    n = random.randrange(emails)
+    data = {"email_id": f"seed-{n:06d}", "to": [f"owner{n}@example.com"], "subject": "Quick wins"}
+    if kind == "email.clicked":
+        data["click"] = {"link": f"https://example.com/{i % 50}", "ipAddress": "10.0.0.1", "userAgent": "Mozilla/5.0"}
+    elif kind == "email.bounced":
+        data["bounce"] = {"type": "Permanent" if i % 2 else "Transient", "message": "mailbox unavailable"}
+    return {"type": kind, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "data": data}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="app already running here (needs --secret)")
+    parser.add_argument("--secret", default="whsec_" + base64.b64encode(b"bench-webhook-secret").decode())
+    parser.add_argument("--file", help="JSONL of captured webhook payloads to replay, in a loop")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--duplicates", type=float, default=0.02, help="fraction of re-sent (already used) ids")
+    parser.add_argument("--emails", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    args.prospects, args.events = 100, 0
+
+    captured = [json.loads(line) for line in open(args.file) if line.strip()] if args.file else None
+    proc = tmp = None
+    url = args.url
+    if not url:
+        tmp = tempfile.mkdtemp(prefix="relay-bench-")
+        seed(tmp, args)
+        _, stub_env = start_stubs(0.0)
+        proc, url = start_app(tmp, dict(stub_env, RESEND_WEBHOOK_SECRET=args.secret), args)
+
+    lock = threading.Lock()
+    used = []
+    accepted = {}
+
+    def post(session, i):
+        event = captured[i % len(captured)] if captured else synthetic_event(i, args.emails)
+        with lock:
+            resend = used and random.random() < args.duplicates
+            msg_id = random.choice(used) if resend else f"msg_bench_{i}"
+        body = json.dumps(event).encode()
+        ts = str(int(time.time()))
+        resp = session.post(f"{url}/webhooks/resend", data=body, headers={
+            "Content-Type": "application/json", "svix-id": msg_id, "svix-timestamp": ts,
+            "svix-signature": webhooks.sign(args.secret, msg_id, ts, body)})
+        if resp.status_code == 200:
+            with lock:
+                outcome = resp.json()
+                if not resend and not outcome.get("duplicate") and not outcome.get("ignored"):
+                    used.append(msg_id)
+                    kind = webhooks.event_row(event)[1]
+                    accepted[kind] = accepted.get(kind, 0) + 1
+        return resp
+
+    try:
+        result, _ = drive(post, args.concurrency, args.seconds)
+        report = {"config": {k: v for k, v in vars(args).items() if k != "secret"}, "http": result,
+                  "accepted": accepted}
+        if tmp:
+            time.sleep(2)  # > EVENT_FLUSH_INTERVAL, so buffered events are written
+            db = sqlite3.connect(os.path.join(tmp, "tracking.db"))
+            written = dict(db.execute("SELECT event_type, COUNT(*) FROM events GROUP BY event_type").fetchall())
+            report["written"] = written
+            # > 0: repeats that reached a different gunicorn worker (de-duplication is per worker)
+            report["written_minus_accepted"] = sum(written.values()) - sum(accepted.values())
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
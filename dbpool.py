@@ -0,0 +1,141 @@
+"""One writer, many readers over a SQLite database in WAL mode.
+
+In WAL mode a reader sees the last committed snapshot while a write
+transaction is open, so dashboard reads never wait behind POP saves, bulk
+imports or pitch batches. Within a process every write goes through one
+Writer: a dedicated thread and connection that applies queued jobs in
+order, group-committing whatever has queued up since the last commit.
+Reads use a ReadPool of read-only connections (``mode=ro`` plus
+``PRAGMA query_only``), so a read path cannot take the write lock by
+accident.
+
+Other writers (the other gunicorn workers' Writers, backfill threads) still
+take SQLite's single write lock in turn; the connection busy timeout makes
+them queue instead of failing with "database is locked".
+"""
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+GROUP_COMMIT_MAX = 64  # jobs folded into one transaction
+
+
+def enable_wal(db):
+    """Switch the database file to WAL (persistent; a no-op once set)."""
+    return db.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+
+
+class ReadPool:
+    """Bounded pool of read-only connections; `connect()` opens a new one on demand."""
+
+    def __init__(self, connect, size):
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.size = size
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, db):
+        try:
+            if db.in_transaction:
+                db.rollback()
+            self._idle.put(db)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        db = self.acquire()
+        try:
+            yield db
+        finally:
+            self.release(db)
+
+
+class Writer:
+    """Serializes writes onto one connection owned by a background thread.
+
+    A job is ``fn(db, *args)``; it runs inside a SAVEPOINT, so a job that
+    raises is rolled back alone and its exception re-raised to the caller
+    while the rest of the batch commits. Jobs must not call commit() or
+    rollback() themselves.
+    """
+
+    def __init__(self, connect, name="writer"):
+        self._connect = connect
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.name = name
+
+    def submit(self, fn, *args):
+        future = Future()
+        self._jobs.put((future, fn, args))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name=f"{self.name}-writer", daemon=True)
+                    self._thread.start()
+        return future
+
+    def run(self, fn, *args, timeout=None):
+        """Submit a job and wait for its result."""
+        return self.submit(fn, *args).result(timeout)
+
+    def depth(self):
+        return self._jobs.qsize()
+
+    def _loop(self):
+        db = self._connect()
+        db.isolation_level = None  # transactions are managed here (BEGIN/SAVEPOINT/COMMIT)
+        while True:
+            batch = [self._jobs.get()]
+            while len(batch) < GROUP_COMMIT_MAX:
+                try:
+                    batch.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(db, batch)
+
+    def _apply(self, db, batch):
+        done = []
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            for future, fn, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                db.execute("SAVEPOINT job")
+                try:
+                    result = fn(db, *args)
+                except BaseException as e:
+                    db.execute("ROLLBACK TO job")
+                    db.execute("RELEASE job")
+                    done.append((future, e, False))
+                    continue
+                db.execute("RELEASE job")
+                done.append((future, result, True))
+            db.execute("COMMIT")
+        except Exception as e:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            for future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, value, ok in done:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
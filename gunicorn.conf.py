@@ -0,0 +1,145 @@
+"""Gunicorn settings shared by every deployment (CLI flags still override them).
+
+GUNICORN_PROFILE sizes the workers for the traffic an instance serves:
+
+- "balanced" (default): max(2, CPUs) workers x 4 threads, the old Procfile
+  layout on a 1-CPU instance.
+- "pixel": tracking pixels, clicks and webhooks, i.e. many short requests
+  that are mostly Python and SQLite time. 2 x CPUs + 1 workers with 2
+  threads each, so they get processes rather than GIL-bound threads.
+- "prospector": search, analyze, pitch and POP calls that mostly wait on
+  upstreams. CPUs + 1 workers with 16 threads each, so many slow calls
+  wait at once in few processes.
+
+CPUs are those this process may use: the cgroup CPU quota when a
+container sets one, else the affinity mask. WEB_CONCURRENCY, GUNICORN_THREADS,
+GUNICORN_TIMEOUT and MAX_REQUESTS override the profile. Workers retire
+after MAX_REQUESTS requests, with up to 10% jitter so they don't all
+restart at once, which caps slow memory growth (pop_jobs, caches). Before a
+worker exits it waits, for up to graceful_timeout less a margin, for its
+running POP audits and queued campaign sends, which live only in memory.
+
+The timeout is 120s. Requests that used to run longer now run in the
+background: /api/pop_audit answers 202 with a job once POP_AUDIT_WAIT has
+passed, and /api/pitch_batch stops at PITCH_BATCH_DEADLINE.
+
+SERVING_MODE picks the worker model:
+
+- "threads" (default): sync workers with --threads OS threads each, so a
+  worker holds at most that many requests, including ones that are only
+  waiting on Resend, POP, DataForSEO or OpenRouter.
+- "gevent": each worker is an event loop. gunicorn's gevent worker
+  monkey-patches sockets, sleeps, locks and threads before the app is
+  imported, so the same Flask code yields while it waits on an upstream
+  and one process holds up to GEVENT_CONNECTIONS requests. SQLite calls
+  still block the loop while they run; they are short (WAL, single
+  writer), which is what keeps the pixel path fast. Requires gevent and
+  must not be combined with preload_app, which would import the app
+  before the patching.
+
+In "threads" mode the app is preloaded (PRELOAD_APP=0 turns it off). The
+master imports it once, which runs the migrations and pays the import
+cost, and workers fork from it. So a boot or a worker restart doesn't
+repeat either. Connections and threads are opened lazily in each worker.
+The module-level tables the import builds (templates, scoring rules, lookup
+tables) are then shared copy-on-write. The cyclic GC is off while the master
+imports the app, and the master freezes its objects before each fork
+(gc.freeze). Otherwise a collection in a worker would write to every shared
+object's GC header and copy the page it sits on.
+"""
+import gc
+import os
+import math
+import shutil
+import tempfile
+
+SERVING_MODE = os.environ.get("SERVING_MODE", "threads")
+preload_app = SERVING_MODE != "gevent" and os.environ.get("PRELOAD_APP", "1") == "1"
+
+PROFILES = {
+    # name: (workers for n CPUs, threads per worker, max_requests)
+    "balanced": (lambda cpus: max(2, cpus), 4, 5000),
+    "pixel": (lambda cpus: 2 * cpus + 1, 2, 20000),
+    "prospector": (lambda cpus: cpus + 1, 16, 2000),
+}
+PROFILE = os.environ.get("GUNICORN_PROFILE", "balanced")
+if PROFILE not in PROFILES:
+    raise RuntimeError(f"GUNICORN_PROFILE must be one of {', '.join(PROFILES)}, not {PROFILE!r}")
+
+
+def available_cpus():
+    """CPUs this process may use: the cgroup quota if one is set, else the affinity mask."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2: "<quota> <period>" or "max <period>"
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        try:  # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as q, open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as p:
+                quota, period = int(q.read()), int(p.read())
+            if quota > 0:
+                cpus = min(cpus, math.ceil(quota / period))
+        except (OSError, ValueError):
+            pass
+    return max(1, cpus)
+
+
+_size, _threads, _max_requests = PROFILES[PROFILE]
+workers = int(os.environ.get("WEB_CONCURRENCY") or min(_size(available_cpus()), int(os.environ.get("MAX_WORKERS", "8"))))
+threads = int(os.environ.get("GUNICORN_THREADS", _threads))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+max_requests = int(os.environ.get("MAX_REQUESTS", _max_requests))
+max_requests_jitter = max_requests // 10
+# On shutdown the master kills workers graceful_timeout after SIGTERM, so a worker
+# must finish draining (worker_exit) within that, with a margin for its exit.
+drain_timeout = max(0, graceful_timeout - 5)
+
+if preload_app:
+    gc.disable()  # no collections while the master imports the app; pre_fork re-enables it
+
+# Fresh shared metrics directory per master; workers inherit the env var and
+# write their samples to mmap files there (see metrics.py). Set up here rather
+# than in on_starting, because prometheus_client picks multiprocess mode when it
+# is imported, and preload_app imports the app before on_starting runs. A config
+# reload (HUP) re-reads this file in the same master; that must not wipe it.
+if os.environ.get("RELAY_METRICS_MASTER") != str(os.getpid()):
+    os.environ["RELAY_METRICS_MASTER"] = str(os.getpid())
+    _metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "relay-metrics"))
+    shutil.rmtree(_metrics_dir, ignore_errors=True)
+    os.makedirs(_metrics_dir, exist_ok=True)
+
+if SERVING_MODE == "gevent":
+    worker_class = "gevent"
+    worker_connections = int(os.environ.get("GEVENT_CONNECTIONS", "500"))
+    # Hundreds of concurrent upstream calls would overflow the default keep-alive
+    # pools (10) and reconnect on every call; workers inherit these from the master.
+    for name in ("RESEND", "DATAFORSEO", "POP", "OPENROUTER"):
+        os.environ.setdefault(f"OUTBOUND_{name}_POOL", "100")
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        gc.freeze()  # what exists now is shared with the worker; collections skip it
+        gc.enable()  # in the master too, which lives on (and reloads on HUP)
+
+
+def post_worker_init(worker):
+    # Background jobs (the follow-up scheduler) are per process, so they start after the fork.
+    # With preload_app this import is a no-op; without it, it loads the app in the worker.
+    import app
+    app.start_background_jobs()
+
+
+def worker_exit(server, worker):
+    # Also called in the master for a worker that died; only a worker has anything to drain
+    if worker.booted and worker.pid == os.getpid():
+        import app
+        app.drain_background_jobs(drain_timeout)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,78 @@
+"""Buffered ingestion of tracking events.
+
+Pixel and click hits append a row to an in-memory buffer and return; a
+background thread hands the buffer to one bulk write (e.g.
+``store.record_events``) every ``interval`` seconds, or as soon as
+``batch_max`` rows are waiting. On a campaign day that turns thousands of
+single-row transactions, each with its own commit, into a few per second.
+
+Trade-offs: analytics see an event up to ``interval`` late, and rows still
+buffered when a worker is killed hard are lost (a graceful exit flushes
+them). A failed write is retried with the next flush; past ``max_pending``
+rows new events are dropped and counted rather than growing without bound.
+"""
+import atexit
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class EventBuffer:
+    def __init__(self, write, interval=0.5, batch_max=500, max_pending=100000, name="events"):
+        self._write = write
+        self.interval = interval
+        self.batch_max = batch_max
+        self.max_pending = max_pending
+        self.name = name
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()  # one write at a time, in order
+        self._wake = threading.Event()
+        self._thread = None
+        self.flushed = 0
+        self.dropped = 0
+
+    def add(self, row):
+        """Queue one row; returns False if it was dropped because the buffer is full."""
+        with self._lock:
+            if len(self._rows) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._rows.append(row)
+            waiting = len(self._rows)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=f"{self.name}-flusher", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        if waiting >= self.batch_max:
+            self._wake.set()
+        return True
+
+    def depth(self):
+        return len(self._rows)
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of rows written."""
+        with self._flushing:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                self._write(rows)
+            except Exception as e:
+                log.error(f"{self.name} flush of {len(rows)} rows failed, will retry: {e}")
+                with self._lock:
+                    keep = max(0, self.max_pending - len(self._rows))
+                    self.dropped += len(rows) - min(keep, len(rows))
+                    self._rows[:0] = rows[:keep]
+                return 0
+            self.flushed += len(rows)
+            return len(rows)
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
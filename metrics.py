@@ -0,0 +1,80 @@
+"""Prometheus metrics for the relay, tracker and prospector.
+
+Under gunicorn, gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a
+scratch directory before workers start, so every worker writes its samples
+to shared mmap files and /metrics aggregates across all of them.
+"""
+import os
+import time
+import sqlite3
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SLOW_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180, 300, 600)
+
+HTTP_REQUESTS = Counter("relay_http_requests_total", "HTTP requests served", ["route", "method", "status"])
+HTTP_LATENCY = Histogram("relay_http_request_duration_seconds", "Request latency by route", ["route"],
+                         buckets=FAST_BUCKETS)
+DB_QUERY_LATENCY = Histogram("relay_db_query_duration_seconds", "SQLite statement latency", ["db", "op"],
+                             buckets=FAST_BUCKETS)
+UPSTREAM_LATENCY = Histogram("relay_upstream_request_duration_seconds", "Outbound call latency",
+                             ["upstream", "outcome"], buckets=SLOW_BUCKETS)
+POP_JOBS_RUNNING = Gauge("relay_pop_jobs_running", "POP audit jobs in flight", multiprocess_mode="livesum")
+POP_JOBS = Counter("relay_pop_jobs_total", "Finished POP audit jobs", ["outcome"])
+POP_STEP_LATENCY = Histogram("relay_pop_step_duration_seconds", "POP audit step duration", ["step"],
+                             buckets=SLOW_BUCKETS)
+RATE_LIMITED = Counter("relay_rate_limit_rejections_total", "Requests rejected by a rate limiter", ["limiter"])
+CAMPAIGN_EMAILS = Counter("relay_campaign_emails_total", "Campaign emails handed to Resend", ["outcome"])
+WEBHOOK_EVENTS = Counter("relay_webhook_events_total", "Resend webhook deliveries by event type or outcome", ["type"])
+IDEMPOTENT_REPEATS = Counter("relay_idempotent_repeats_total", "Repeated Idempotency-Keys on /send", ["outcome"])
+SEQUENCE_ENROLLMENTS = Counter("relay_sequence_steps_total", "Follow-up scheduler decisions", ["outcome"])
+TRACKING_REJECTED = Counter("relay_tracking_rejected_total", "Tracking hits dropped as unsigned or forged", ["route"])
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that times every execute() into DB_QUERY_LATENCY.
+
+    Pass as ``factory=`` to sqlite3.connect and set ``db_name`` afterwards.
+    """
+    db_name = "sqlite"
+
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            DB_QUERY_LATENCY.labels(self.db_name, _op(sql)).observe(time.perf_counter() - start)
+
+    def executemany(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            DB_QUERY_LATENCY.labels(self.db_name, _op(sql)).observe(time.perf_counter() - start)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            DB_QUERY_LATENCY.labels(self.db_name, "COMMIT").observe(time.perf_counter() - start)
+
+
+def _op(sql):
+    word = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "CREATE", "ALTER", "PRAGMA") else "OTHER"
+
+
+def observe_upstream(upstream, seconds, ok):
+    UPSTREAM_LATENCY.labels(upstream, "ok" if ok else "error").observe(seconds)
+
+
+def render():
+    """Return (body, content_type) for the /metrics endpoint."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,321 @@
+"""Versioned schema migrations for prospects.db and tracking.db.
+
+Each database has an ordered list of migrations; the ``schema_version``
+table records which have been applied. ``migrate()`` runs at startup and
+applies the pending ones inside one ``BEGIN IMMEDIATE`` transaction, so two
+gunicorn workers booting together cannot both apply the same step. A
+migration is a tuple of SQL statements or a callable taking the connection.
+
+Never edit a migration that has shipped; append a new one.
+
+tests/test_migrations.py checks that the hot queries in storage.py are
+served by the indexes these migrations create.
+"""
+from datetime import datetime as dt
+
+import webhooks
+
+SCHEMA_VERSION_DDL = """CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT,
+    applied_at TEXT
+)"""
+
+
+# ============================================================
+# PROSPECTS DB
+# ============================================================
+
+PROSPECTS_BASELINE = (
+    """CREATE TABLE IF NOT EXISTS prospects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        business_name TEXT,
+        website TEXT UNIQUE,
+        phone TEXT,
+        address TEXT,
+        city TEXT,
+        state TEXT,
+        niche TEXT,
+        rating REAL,
+        reviews INTEGER,
+        seo_score INTEGER DEFAULT 0,
+        prospect_score INTEGER DEFAULT 0,
+        prospect_status TEXT DEFAULT 'new',
+        issues TEXT,
+        has_ssl INTEGER DEFAULT 0,
+        pitch_subject TEXT,
+        pitch_body TEXT,
+        pitch_date TEXT,
+        sent_date TEXT,
+        contact_method TEXT,
+        response_date TEXT,
+        pop_report_data TEXT,
+        pop_audit_date TEXT,
+        pop_score INTEGER,
+        search_query TEXT,
+        created_at TEXT DEFAULT (datetime('now')),
+        updated_at TEXT DEFAULT (datetime('now'))
+    )""",
+    """CREATE TABLE IF NOT EXISTS searches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        query TEXT,
+        niche TEXT,
+        location TEXT,
+        result_count INTEGER,
+        created_at TEXT DEFAULT (datetime('now'))
+    )""",
+    """CREATE TABLE IF NOT EXISTS pop_report_views (
+        prospect_id INTEGER PRIMARY KEY,
+        pop_audit_date TEXT,
+        etag TEXT,
+        view TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS pitch_cache (
+        prompt_hash TEXT PRIMARY KEY,
+        model TEXT,
+        subject TEXT,
+        body TEXT,
+        tokens INTEGER DEFAULT 0,
+        created_at TEXT DEFAULT (datetime('now'))
+    )""",
+)
+
+
+def add_pop_metric_columns(db):
+    """Columns that used to be added ad hoc; older databases may already have some."""
+    cols = [c[1] for c in db.execute("PRAGMA table_info(prospects)").fetchall()]
+    for col, ddl in (("pop_word_count_current", "INTEGER DEFAULT 0"), ("pop_word_count_target", "INTEGER DEFAULT 0"),
+                     ("pop_page_score", "REAL"), ("pop_missing_terms", "INTEGER"), ("pop_score_version", "INTEGER")):
+        if col not in cols:
+            db.execute(f"ALTER TABLE prospects ADD COLUMN {col} {ddl}")
+
+
+PROSPECTS = [
+    (1, "baseline", PROSPECTS_BASELINE),
+    (2, "pop metric columns", add_pop_metric_columns),
+    (3, "dashboard indexes", (
+        # /api/list?status= filters on status and orders by audit date then score
+        "CREATE INDEX IF NOT EXISTS idx_prospects_status ON prospects(prospect_status, pop_audit_date, prospect_score)",
+        "CREATE INDEX IF NOT EXISTS idx_prospects_pop_audit_date ON prospects(pop_audit_date)",
+        "CREATE INDEX IF NOT EXISTS idx_prospects_sent_date ON prospects(sent_date)",
+        "CREATE INDEX IF NOT EXISTS idx_prospects_response_date ON prospects(response_date)",
+        "CREATE INDEX IF NOT EXISTS idx_prospects_niche ON prospects(niche)",
+        "CREATE INDEX IF NOT EXISTS idx_searches_created_at ON searches(created_at)",
+    )),
+    (4, "funnel refresh index", (
+        # The funnel refresh re-evaluates prospects updated since its last run
+        "CREATE INDEX IF NOT EXISTS idx_prospects_updated_at ON prospects(updated_at)",
+    )),
+    (5, "backfill runs", (
+        # Used to be created on every backfill start and status call
+        """CREATE TABLE IF NOT EXISTS backfill_runs (
+            name TEXT PRIMARY KEY,
+            status TEXT,
+            params TEXT,
+            last_id INTEGER DEFAULT 0,
+            processed INTEGER DEFAULT 0,
+            updated INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            error TEXT,
+            owner TEXT,
+            heartbeat REAL,
+            started_at TEXT,
+            updated_at TEXT,
+            finished_at TEXT
+        )""",
+    )),
+]
+
+
+
+# ============================================================
+# TRACKING DB
+# ============================================================
+
+def add_suppressions(db):
+    """Suppressed addresses get a table of their own, so a bounce for mail sent without a
+    tracking id (no emails row) is kept too. Seeded from the bounces already recorded."""
+    db.execute("""CREATE TABLE IF NOT EXISTS suppressions (
+        address TEXT PRIMARY KEY,
+        reason TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )""")
+    recorded = db.execute("""SELECT e.recipient, ev.event_type, MIN(ev.timestamp) FROM events ev
+        JOIN emails e ON e.id = ev.email_id WHERE ev.event_type IN ('hard_bounced', 'complained')
+        GROUP BY e.recipient, ev.event_type""").fetchall()
+    db.executemany("INSERT OR IGNORE INTO suppressions (address, reason, created_at) VALUES (?, ?, ?)",
+                   [(a, reason, at or "") for recipient, reason, at in recorded for a in webhooks.addresses(recipient)])
+
+
+TRACKING = [
+    (1, "baseline", (
+        """CREATE TABLE IF NOT EXISTS emails (
+            id TEXT PRIMARY KEY,
+            subject TEXT,
+            recipient TEXT,
+            recipient_name TEXT,
+            client TEXT,
+            sent_at TEXT,
+            resend_id TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email_id TEXT,
+            event_type TEXT,
+            url TEXT,
+            ip TEXT,
+            user_agent TEXT,
+            timestamp TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_events_email ON events(email_id)",
+    )),
+    (2, "analytics indexes", (
+        # Covers every per-email subquery in /t/analytics: counts, MIN/MAX(timestamp), COUNT(DISTINCT ip)
+        "CREATE INDEX IF NOT EXISTS idx_events_email_type ON events(email_id, event_type, timestamp, ip)",
+        # Totals: COUNT(DISTINCT email_id) WHERE event_type = 'open', COUNT(*) WHERE event_type = 'click'
+        "CREATE INDEX IF NOT EXISTS idx_events_type_email ON events(event_type, email_id)",
+        "CREATE INDEX IF NOT EXISTS idx_emails_sent_at ON emails(sent_at)",
+        "DROP INDEX IF EXISTS idx_events_email",  # prefix of idx_events_email_type
+    )),
+    (3, "tracked links", (
+        # Click targets behind signed /t/c/ tokens, by email and link number
+        """CREATE TABLE IF NOT EXISTS links (
+            email_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            PRIMARY KEY (email_id, idx)
+        ) WITHOUT ROWID""",
+    )),
+    (4, "campaigns", (
+        """CREATE TABLE IF NOT EXISTS campaigns (
+            id TEXT PRIMARY KEY,
+            subject TEXT,
+            from_addr TEXT,
+            client TEXT,
+            created_at TEXT,
+            total INTEGER
+        )""",
+        # NULL status: sent one at a time through /send
+        "ALTER TABLE emails ADD COLUMN campaign_id TEXT",
+        "ALTER TABLE emails ADD COLUMN status TEXT",
+        # Progress counters: COUNT(*) ... WHERE campaign_id = ? GROUP BY status
+        "CREATE INDEX IF NOT EXISTS idx_emails_campaign ON emails(campaign_id, status)",
+    )),
+    (5, "resend webhooks", (
+        # Webhook events name emails by Resend's id
+        "CREATE INDEX IF NOT EXISTS idx_emails_resend_id ON emails(resend_id)",
+    )),
+    (6, "idempotency keys", (
+        # One row per Idempotency-Key seen by /send; status 0 while the first request is in flight
+        """CREATE TABLE IF NOT EXISTS idempotency (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            response TEXT,
+            created_at REAL NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_idempotency_created_at ON idempotency(created_at)",
+    )),
+    (7, "follow-up sequences", (
+        """CREATE TABLE IF NOT EXISTS sequences (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            steps TEXT NOT NULL,
+            from_addr TEXT,
+            created_at TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS enrollments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sequence_id TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            prospect_id INTEGER,
+            vars TEXT,
+            step INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'active',
+            due_at REAL,
+            last_email_id TEXT,
+            last_sent_at TEXT,
+            created_at TEXT
+        )""",
+        # The scheduler's timer heap: earliest due active enrollments first
+        "CREATE INDEX IF NOT EXISTS idx_enrollments_due ON enrollments(status, due_at)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_enrollments_recipient ON enrollments(sequence_id, recipient)",
+        # Which worker runs a background job (the sequence scheduler), until expires_at
+        """CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )""",
+    )),
+    (8, "prospect funnel", (
+        # Which prospect a tracked email pitched; NULL for mail not sent to a prospect
+        "ALTER TABLE emails ADD COLUMN prospect_id INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_emails_prospect ON emails(prospect_id)",
+        # Stage flags last counted per prospect (storage.FUNNEL_STAGES), and their sums per niche and city
+        """CREATE TABLE IF NOT EXISTS funnel_prospects (
+            prospect_id INTEGER PRIMARY KEY,
+            niche TEXT NOT NULL,
+            city TEXT NOT NULL,
+            analyzed INTEGER NOT NULL,
+            audited INTEGER NOT NULL,
+            pitched INTEGER NOT NULL,
+            opened INTEGER NOT NULL,
+            clicked INTEGER NOT NULL,
+            responded INTEGER NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS funnel_counts (
+            niche TEXT NOT NULL,
+            city TEXT NOT NULL,
+            searched INTEGER NOT NULL DEFAULT 0,
+            analyzed INTEGER NOT NULL DEFAULT 0,
+            audited INTEGER NOT NULL DEFAULT 0,
+            pitched INTEGER NOT NULL DEFAULT 0,
+            opened INTEGER NOT NULL DEFAULT 0,
+            clicked INTEGER NOT NULL DEFAULT 0,
+            responded INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (niche, city)
+        ) WITHOUT ROWID""",
+        # Prospects whose emails were registered since the last refresh
+        "CREATE TABLE IF NOT EXISTS funnel_dirty (prospect_id INTEGER PRIMARY KEY)",
+        # Refresh watermarks: prospects updated_at, last events id, refreshed_at
+        "CREATE TABLE IF NOT EXISTS funnel_state (name TEXT PRIMARY KEY, value TEXT)",
+    )),    (9, "suppressions", add_suppressions),
+]
+
+
+# ============================================================
+# RUNNER
+# ============================================================
+
+def current_version(db):
+    db.execute(SCHEMA_VERSION_DDL)
+    return db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(db, migrations):
+    """Apply pending migrations in order. Returns the list of versions applied."""
+    isolation = db.isolation_level
+    db.isolation_level = None  # manage the transaction explicitly; DDL must not autocommit midway
+    applied = []
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            version = current_version(db)
+            for number, name, step in migrations:
+                if number <= version:
+                    continue
+                if callable(step):
+                    step(db)
+                else:
+                    for sql in step:
+                        db.execute(sql)
+                db.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                           (number, name, dt.utcnow().strftime("%Y-%m-%d %H:%M:%S")))
+                applied.append(number)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+    finally:
+        db.isolation_level = isolation
+    return applied
@@ -0,0 +1,197 @@
+"""Shared outbound HTTP client.
+
+One keep-alive ``requests.Session`` per upstream (Resend, DataForSEO, POP,
+OpenRouter and prospect websites), each with its own connection pool size,
+retry/backoff policy, circuit breaker and latency histogram.
+
+Tune any upstream from the environment, e.g. ``OUTBOUND_POP_POOL=20``,
+``OUTBOUND_POP_RETRIES=1``, ``OUTBOUND_POP_BREAKER_FAILURES=3``,
+``OUTBOUND_POP_BREAKER_RESET=120``.
+"""
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# pool: max keep-alive connections; retries: connect/5xx retries with exponential
+# backoff; retry_post: whether POSTs may be retried after a read error or 5xx
+# (never for Resend, where a retry can double-send); breaker_failures: consecutive
+# failures before the circuit opens (0 disables it); breaker_reset: seconds the
+# circuit stays open before a single probe request is let through.
+UPSTREAMS = {
+    "resend":     {"pool": 10, "retries": 2, "backoff": 0.5, "retry_post": False, "breaker_failures": 5, "breaker_reset": 30, "timeout": 30},
+    "dataforseo": {"pool": 10, "retries": 2, "backoff": 1.0, "retry_post": True,  "breaker_failures": 5, "breaker_reset": 60, "timeout": 60},
+    "pop":        {"pool": 10, "retries": 1, "backoff": 1.0, "retry_post": False, "breaker_failures": 5, "breaker_reset": 60, "timeout": 60},
+    "openrouter": {"pool": 10, "retries": 1, "backoff": 0.5, "retry_post": False, "breaker_failures": 5, "breaker_reset": 30, "timeout": 30},
+    # Prospect websites are thousands of unrelated hosts, so no shared breaker
+    "sites":      {"pool": 20, "retries": 0, "backoff": 0.0, "retry_post": False, "breaker_failures": 0, "breaker_reset": 0, "timeout": 15},
+}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, upstream, retry_in):
+        self.upstream = upstream
+        self.retry_in = retry_in
+        super().__init__(f"{upstream} unavailable (circuit open, retry in {retry_in:.0f}s)")
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open probe -> closed."""
+
+    def __init__(self, name, failures, reset_after):
+        self.name = name
+        self.threshold = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        if not self.threshold:
+            return
+        with self.lock:
+            if self.state == "closed":
+                return
+            waited = time.monotonic() - self.opened_at
+            if self.state == "open" and waited >= self.reset_after:
+                self.state = "half_open"  # this caller is the probe
+                return
+            raise CircuitOpenError(self.name, max(0.0, self.reset_after - waited))
+
+    def record(self, ok):
+        if not self.threshold:
+            return
+        with self.lock:
+            if ok:
+                self.state = "closed"
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+class LatencyHistogram:
+    """Cumulative latency buckets (Prometheus-style `le` bounds) in seconds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += seconds
+            self.count += 1
+            if error:
+                self.errors += 1
+
+    def snapshot(self):
+        with self.lock:
+            cumulative, running = {}, 0
+            for bound, n in zip(self.buckets, self.counts):
+                running += n
+                cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+            return {"buckets": cumulative, "sum": round(self.sum, 4), "count": self.count, "errors": self.errors}
+
+
+def _env_config(name, defaults):
+    cfg = dict(defaults)
+    prefix = f"OUTBOUND_{name.upper()}_"
+    for key, default in defaults.items():
+        raw = os.environ.get(prefix + key.upper())
+        if raw is None:
+            continue
+        if isinstance(default, bool):
+            cfg[key] = raw.lower() in ("1", "true", "yes")
+        else:
+            cfg[key] = type(default)(raw)
+    return cfg
+
+
+class Upstream:
+    def __init__(self, name, cfg):
+        self.name = name
+        self.cfg = cfg
+        methods = Retry.DEFAULT_ALLOWED_METHODS | ({"POST"} if cfg["retry_post"] else set())
+        retry = Retry(
+            total=cfg["retries"], connect=cfg["retries"], read=cfg["retries"], status=cfg["retries"],
+            backoff_factor=cfg["backoff"], status_forcelist=(502, 503, 504),
+            allowed_methods=methods, raise_on_status=False, respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=cfg["pool"], max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.breaker = CircuitBreaker(name, cfg["breaker_failures"], cfg["breaker_reset"])
+        self.latency = LatencyHistogram()
+
+    def request(self, method, url, **kwargs):
+        self.breaker.before_call()
+        kwargs.setdefault("timeout", self.cfg["timeout"])
+        start = time.perf_counter()
+        resp = None
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        finally:
+            # Whatever was raised (not only RequestException) is a failure, so a half-open
+            # probe always settles the breaker instead of leaving it half open for good
+            ok = resp is not None and resp.status_code < 500
+            self._observe(time.perf_counter() - start, ok)
+            self.breaker.record(ok)
+        return resp
+
+    def _observe(self, seconds, ok):
+        self.latency.observe(seconds, error=not ok)
+        for fn in observers:
+            fn(self.name, seconds, ok)
+
+
+_upstreams = {}
+_lock = threading.Lock()
+observers = []  # callables(upstream, seconds, ok) notified after every call, e.g. metrics export
+
+
+def upstream(name):
+    client = _upstreams.get(name)
+    if client is None:
+        with _lock:
+            client = _upstreams.get(name)
+            if client is None:
+                client = _upstreams[name] = Upstream(name, _env_config(name, UPSTREAMS[name]))
+    return client
+
+
+def get(name, url, **kwargs):
+    return upstream(name).request("GET", url, **kwargs)
+
+
+def post(name, url, **kwargs):
+    return upstream(name).request("POST", url, **kwargs)
+
+
+def latency_histograms():
+    """Per-upstream latency histograms for upstreams used by this process."""
+    return {name: client.latency.snapshot() for name, client in list(_upstreams.items())}
+
+
+def breaker_states():
+    return {name: client.breaker.snapshot() for name, client in list(_upstreams.items())}
@@ -0,0 +1,400 @@
+"""Offline stand-in for the PageOptimizer (POP) API.
+
+Implements the three calls the audit pipeline makes -- ``expose/get-terms``,
+``expose/create-report`` and ``task/{id}/results`` -- with task timing and
+failure modes taken from a scenario, or replayed from a recording of real
+traffic. Tasks are clocked, not counted: a task is ready ``duration``
+seconds after it was created however often it is polled, so the cost of a
+polling interval shows up as detection delay (ready -> first served) and
+as polls per task.
+
+Failure modes seen from the live API and reproduced here:
+
+- create-report answered straight away with ``{"status": "FAILURE"}``;
+- a report task that ends in a bare ``{"status": "FAILURE"}``;
+- the value=100 quirk: PROGRESS with value 100 and no data for a while
+  before SUCCESS (or forever, for "stuck" tasks).
+
+``time_scale`` multiplies every duration, so ``--time-scale 0.01`` turns
+3-minute audits into 2-second ones. Random draws are seeded per task
+kind and number, so a run is repeatable for the same sequence of requests.
+
+    python pop_simulator.py serve --scenario live --time-scale 0.01 --port 8702
+    POP_BASE=http://127.0.0.1:8702/api POP_POLL_INTERVAL=0.1 gunicorn app:app
+
+    # Record real traffic through a pass-through proxy, then replay it
+    python pop_simulator.py record --out pop.jsonl --port 8702
+    python pop_simulator.py serve --replay pop.jsonl --time-scale 0.01
+
+``GET /sim/stats`` returns task and poll counters; ``POST /sim/reset``
+clears them.
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+
+# Durations are (low, high) seconds; rates are fractions of tasks.
+SCENARIOS = {
+    # Every task succeeds on its first poll (what bench/endpoints.py uses)
+    "instant": {"latency": (0, 0), "terms_seconds": (0, 0), "report_seconds": (0, 0), "quirk_seconds": (0, 0),
+                "quirk_rate": 0.0, "create_failure_rate": 0.0, "report_failure_rate": 0.0, "stuck_rate": 0.0},
+    # Shaped on the Feb 2026 batch run: 3-6 minute audits, some failures and some that never finish
+    "live": {"latency": (0.2, 1.5), "terms_seconds": (60, 180), "report_seconds": (60, 180), "quirk_seconds": (5, 60),
+             "quirk_rate": 0.5, "create_failure_rate": 0.05, "report_failure_rate": 0.05, "stuck_rate": 0.02},
+    # Every report sits at value=100 without data before it succeeds
+    "quirk": {"latency": (0.05, 0.2), "terms_seconds": (30, 60), "report_seconds": (30, 60), "quirk_seconds": (30, 90),
+              "quirk_rate": 1.0, "create_failure_rate": 0.0, "report_failure_rate": 0.0, "stuck_rate": 0.0},
+    # Retry and error paths
+    "failures": {"latency": (0.05, 0.2), "terms_seconds": (10, 30), "report_seconds": (10, 30), "quirk_seconds": (0, 0),
+                 "quirk_rate": 0.0, "create_failure_rate": 0.3, "report_failure_rate": 0.3, "stuck_rate": 0.1},
+}
+
+TASK_PATH = re.compile(r"/api/task/([^/]+)/results")
+
+
+def fake_terms(keyword):
+    return {"prepareId": uuid.uuid4().hex[:12], "variations": [keyword],
+            "lsaPhrases": [{"phrase": f"{keyword} tip {i}"} for i in range(10)]}
+
+
+def fake_report(keyword, terms=60):
+    seed = int(hashlib.sha1(keyword.encode("utf-8")).hexdigest()[:8], 16)
+    return {"report": {
+        "wordCount": {"current": 300 + seed % 900, "target": 1200, "competitorAvg": 1100},
+        "competitorInfo": {"competitors": [{"url": f"https://competitor{i}.example/"} for i in range(5)]},
+        "tagCounts": [{"tagLabel": "H2", "count": seed % 6}],
+        "terms": [{"term": f"{keyword} term {i}", "count": (seed >> i) % 3} for i in range(terms)],
+        "cleanedContentBrief": {"pageScore": {"pageScore": 20 + seed % 70}, "p": [
+            {"term": {"phrase": f"{keyword} term {i}", "type": "lsi", "weight": 1},
+             "contentBrief": {"current": (seed >> i) % 3, "targetMin": 1, "targetMax": 4}} for i in range(terms)]},
+    }}
+
+
+# ============================================================
+# SIMULATOR
+# ============================================================
+
+class Simulator:
+    """POP API state: tasks, their timelines and counters. Thread-safe."""
+
+    def __init__(self, scenario="instant", time_scale=1.0, seed=0, replay=None, **overrides):
+        self.config = dict(SCENARIOS[scenario], **overrides)
+        self.scenario = "replay" if replay else scenario
+        self.time_scale = time_scale
+        self.seed = seed
+        self.replay = load_recording(replay) if replay else None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.tasks = {}  # task id -> task dict
+            self.prepared = {}  # prepareId -> recorded audit (replay)
+            self.attempts = {}  # prepareId -> create-report calls so far (replay)
+            self.created = {}  # kind -> tasks created, so the nth report task always draws the same fate
+            self.counts = {"get_terms": 0, "create_report": 0, "create_failures": 0, "polls": 0,
+                           "polls_while_ready": 0, "succeeded": 0, "failed": 0}
+            self.detection_delays = []  # seconds between a task becoming ready and its result being served
+
+    def _rng(self, kind):
+        self.created[kind] = self.created.get(kind, 0) + 1
+        return random.Random(f"{self.seed}:{kind}:{self.created[kind]}")
+
+    def _draw(self, rng, key):
+        low, high = self.config[key]
+        return rng.uniform(low, high) * self.time_scale
+
+    def _latency(self):
+        low, high = self.config["latency"]
+        if high:
+            time.sleep(random.uniform(low, high) * self.time_scale)
+
+    # --- scenario tasks ---
+
+    def _new_task(self, kind, request):
+        with self.lock:
+            rng = self._rng(kind)
+            duration = self._draw(rng, "terms_seconds" if kind == "terms" else "report_seconds")
+            task = {"kind": kind, "request": request, "created": time.monotonic(), "duration": duration,
+                    "quirk": 0.0, "outcome": "SUCCESS", "polls": 0, "served": False}
+            if kind == "report":
+                roll = rng.random()
+                if roll < self.config["stuck_rate"]:
+                    task["outcome"] = "STUCK"
+                elif roll < self.config["stuck_rate"] + self.config["report_failure_rate"]:
+                    task["outcome"] = "FAILURE"
+                elif rng.random() < self.config["quirk_rate"]:
+                    task["quirk"] = self._draw(rng, "quirk_seconds")
+            task_id = str(uuid.uuid4())
+            self.tasks[task_id] = task
+            return task_id, rng
+
+    def get_terms(self, body):
+        self._latency()
+        with self.lock:
+            self.counts["get_terms"] += 1
+        if self.replay:
+            return self.replay.start(self, body)
+        if not body.get("keyword") or not body.get("targetUrl"):
+            return 200, {"status": "FAILURE", "msg": "keyword and targetUrl are required"}
+        task_id, _ = self._new_task("terms", body)
+        return 200, {"status": "PROGRESS", "taskId": task_id}
+
+    def create_report(self, body):
+        self._latency()
+        with self.lock:
+            self.counts["create_report"] += 1
+        if self.replay:
+            return self.replay.create(self, body)
+        if not body.get("prepareId"):
+            return 200, {"status": "FAILURE", "msg": "prepareId is required"}
+        with self.lock:
+            fail = random.Random(f"{self.seed}:create:{self.counts['create_report']}").random() < self.config["create_failure_rate"]
+            self.counts["create_failures"] += fail
+        if fail:
+            return 200, {"status": "FAILURE", "msg": ""}
+        task_id, _ = self._new_task("report", body)
+        return 200, {"status": "PROGRESS", "taskId": task_id}
+
+    def results(self, task_id):
+        self._latency()
+        now = time.monotonic()
+        with self.lock:
+            self.counts["polls"] += 1
+            task = self.tasks.get(task_id)
+            if task is None:
+                return 404, {"status": "FAILURE", "msg": f"Task {task_id} not found"}
+            task["polls"] += 1
+            elapsed = now - task["created"]
+            if "timeline" in task:
+                return self.replay.poll(self, task, elapsed)
+            ready = elapsed >= task["duration"]
+            if ready and task["outcome"] == "STUCK":
+                self.counts["polls_while_ready"] += 1
+                return 200, {"status": "PROGRESS", "value": 100, "msg": ""}
+            if not ready or elapsed < task["duration"] + task["quirk"]:
+                value = 100 if ready else int(elapsed / task["duration"] * 100) if task["duration"] else 0
+                return 200, {"status": "PROGRESS", "value": min(value, 100), "msg": "Calculating"}
+            if task["served"]:
+                self.counts["polls_while_ready"] += 1
+            else:
+                task["served"] = True
+                self.detection_delays.append(elapsed - task["duration"] - task["quirk"])
+            if task["outcome"] == "FAILURE":
+                self.counts["failed"] += 1
+                return 200, {"status": "FAILURE"}
+            self.counts["succeeded"] += 1
+            request = task["request"]
+            data = fake_terms(request.get("keyword", "")) if task["kind"] == "terms" else fake_report(request.get("prepareId", ""))
+            return 200, {"status": "SUCCESS", "value": 100, "msg": "", "data": data}
+
+    def stats(self):
+        with self.lock:
+            delays = sorted(self.detection_delays)
+            polls = [t["polls"] for t in self.tasks.values()]
+            return dict(self.counts, scenario=self.scenario, time_scale=self.time_scale,
+                        tasks=len(self.tasks), polls_per_task=round(sum(polls) / len(polls), 2) if polls else 0,
+                        detection_delay_p50_s=round(delays[len(delays) // 2], 3) if delays else None,
+                        detection_delay_max_s=round(delays[-1], 3) if delays else None)
+
+    def routes(self):
+        """Handlers in stub_servers' fn(handler, path, body) -> (status, payload) form."""
+        def results(handler, path, body):
+            match = TASK_PATH.match(path)
+            return self.results(match.group(1)) if match else (404, {"status": "FAILURE", "msg": "bad task path"})
+
+        def reset(handler, path, body):
+            self.reset()
+            return 200, {"ok": True}
+
+        return {("POST", "/api/expose/get-terms"): lambda h, p, b: self.get_terms(b),
+                ("POST", "/api/expose/create-report"): lambda h, p, b: self.create_report(b),
+                ("GET", "/api/task/"): results,
+                ("GET", "/sim/stats"): lambda h, p, b: (200, self.stats()),
+                ("POST", "/sim/reset"): reset}
+
+
+# ============================================================
+# REPLAY
+# ============================================================
+
+class Recording:
+    """Audits rebuilt from a recorder log, served back on the recorded clock.
+
+    Each audit is the get-terms answer, the terms task's poll timeline, the
+    create-report answers (one per attempt) and the report task's poll
+    timeline, with poll offsets relative to the call that created the task.
+    """
+
+    def __init__(self, audits):
+        if not audits:
+            raise ValueError("recording has no complete get-terms exchanges")
+        self.audits = audits
+        self.next = 0
+
+    def _pick(self):
+        audit = self.audits[self.next % len(self.audits)]
+        self.next += 1
+        return audit
+
+    def _task(self, sim, kind, audit, answer, timeline):
+        """Register a replayed task and rewrite the recorded task id in the answer."""
+        recorded_id = answer.get("taskId") or answer.get("task_id")
+        if not recorded_id:
+            return 200, answer
+        task_id = str(uuid.uuid4())
+        sim.tasks[task_id] = {"kind": kind, "audit": audit, "created": time.monotonic(), "polls": 0,
+                              "timeline": timeline, "served": False}
+        return 200, json.loads(json.dumps(answer).replace(recorded_id, task_id))
+
+    def start(self, sim, body):
+        with sim.lock:
+            audit = self._pick()
+            return self._task(sim, "terms", audit, audit["get-terms"], audit["terms"])
+
+    def create(self, sim, body):
+        with sim.lock:
+            prepare_id = body.get("prepareId")
+            audit = sim.prepared.get(prepare_id) or self._pick()
+            if not audit["create-report"]:
+                return 200, {"status": "FAILURE", "msg": "no create-report in recording"}
+            attempt = sim.attempts.get(prepare_id, 0)
+            sim.attempts[prepare_id] = attempt + 1
+            answer = audit["create-report"][min(attempt, len(audit["create-report"]) - 1)]
+            return self._task(sim, "report", audit, answer, audit["report"])
+
+    def poll(self, sim, task, elapsed):
+        """Latest recorded answer at or before `elapsed` (scaled); caller holds sim.lock."""
+        timeline = task["timeline"]
+        if not timeline:
+            return 200, {"status": "PROGRESS", "value": 0, "msg": ""}
+        answer = timeline[0]
+        for entry in timeline:
+            if entry["at"] * sim.time_scale <= elapsed:
+                answer = entry
+        status, body = answer["status"], answer["response"]
+        terminal = isinstance(body, dict) and body.get("status") in ("SUCCESS", "FAILURE")
+        if terminal and not task["served"]:
+            task["served"] = True
+            sim.detection_delays.append(elapsed - answer["at"] * sim.time_scale)
+            sim.counts["succeeded" if body["status"] == "SUCCESS" else "failed"] += 1
+            prepare_id = (body.get("data") or body).get("prepareId") if task["kind"] == "terms" else None
+            if prepare_id:
+                sim.prepared[prepare_id] = task["audit"]
+        elif terminal:
+            sim.counts["polls_while_ready"] += 1
+        return status, body
+
+
+def load_recording(path):
+    """Group a recorder log (JSONL exchanges) into audits."""
+    with open(path) as f:
+        exchanges = [json.loads(line) for line in f if line.strip()]
+    audits, by_task = [], {}
+    by_prepare = {}  # prepareId from a terms result -> its audit
+    for ex in exchanges:
+        response = ex.get("response") if isinstance(ex.get("response"), dict) else {}
+        task_id = response.get("taskId") or response.get("task_id")
+        if "/expose/get-terms" in ex["path"]:
+            audit = {"get-terms": response, "terms": [], "create-report": [], "report": []}
+            audits.append(audit)
+            if task_id:
+                by_task[task_id] = (audit, "terms", ex["at"])
+        elif "/expose/create-report" in ex["path"]:
+            audit = by_prepare.get((ex.get("request") or {}).get("prepareId"))
+            if audit is None:
+                audit = next((a for a in audits if not a["create-report"] and a["terms"]), None)
+            if audit is None:
+                continue
+            audit["create-report"].append(response)
+            if task_id:
+                by_task[task_id] = (audit, "report", ex["at"])
+        else:
+            match = TASK_PATH.search(ex["path"])
+            if not match or match.group(1) not in by_task:
+                continue
+            audit, kind, created = by_task[match.group(1)]
+            audit[kind].append({"at": round(ex["at"] - created, 3), "status": ex["status"], "response": ex["response"]})
+            prepare_id = (response.get("data") or response).get("prepareId") if kind == "terms" else None
+            if prepare_id:
+                by_prepare[prepare_id] = audit
+    return Recording([a for a in audits if a["get-terms"]])
+
+
+# ============================================================
+# RECORDER
+# ============================================================
+
+def make_recorder(upstream, out_path, host="127.0.0.1", port=0):
+    """Pass-through proxy to the real API that appends every exchange to a JSONL log.
+
+    API keys are dropped from the logged request bodies.
+    """
+    from http.server import ThreadingHTTPServer
+    import requests
+    from stub_servers import StubHandler
+
+    session = requests.Session()
+    lock = threading.Lock()
+
+    def forward(method):
+        def route(handler, path, body):
+            started = time.time()
+            url = upstream.rstrip("/") + path[len("/api"):]
+            if method == "POST":
+                resp = session.post(url, json=body, timeout=300)
+            else:
+                resp = session.get(url, timeout=300)
+            try:
+                payload = resp.json()
+            except ValueError:
+                payload = {"raw": resp.text[:2000]}
+            logged = {k: v for k, v in body.items() if k != "apiKey"} if isinstance(body, dict) else body
+            with lock, open(out_path, "a") as f:
+                f.write(json.dumps({"at": round(started, 3), "method": method, "path": path,
+                                    "request": logged, "status": resp.status_code, "response": payload}) + "\n")
+            return resp.status_code, payload
+        return route
+
+    routes = {("POST", "/api/"): forward("POST"), ("GET", "/api/"): forward("GET")}
+    handler = type("PopRecorderHandler", (StubHandler,), {"routes": routes})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the simulator")
+    serve.add_argument("--scenario", choices=sorted(SCENARIOS), default="live")
+    serve.add_argument("--replay", help="recorder log to replay instead of a scenario")
+    serve.add_argument("--time-scale", type=float, default=1.0)
+    serve.add_argument("--seed", type=int, default=0)
+    record = sub.add_parser("record", help="proxy to the real API and log every exchange")
+    record.add_argument("--upstream", default="https://app.pageoptimizer.pro/api")
+    record.add_argument("--out", required=True)
+    for p in (serve, record):
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=8702)
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        server = make_recorder(args.upstream, args.out, args.host, args.port)
+    else:
+        import stub_servers
+        sim = Simulator(args.scenario, time_scale=args.time_scale, seed=args.seed, replay=args.replay)
+        server = stub_servers.make_server("pop", args.host, args.port, routes=sim.routes())
+    print(f"pop {args.command} listening on http://{args.host}:{server.server_port}/api", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Opt-in per-request profiling.
+
+A profiled request is sampled by a background thread that records the
+request thread's Python stack every PROFILE_INTERVAL_MS, producing
+flame-graph "folded" stacks (``frame;frame;frame count``, as consumed by
+flamegraph.pl / speedscope). Every SQLite statement the request runs is
+captured through ``sqlite3`` trace callbacks with its wall time.
+
+CPU-bound code only yields the GIL every sys.getswitchinterval() (5ms), so
+that is the effective sampling resolution while the request is computing;
+time spent in I/O and SQLite is sampled at the full rate.
+
+Nothing here runs unless a request asks for it: app.py only consults
+``current()`` (a thread-local lookup) when opening a connection.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from collections import Counter
+
+import metrics
+
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "1")) / 1000.0
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))  # stored profiles kept on disk
+
+_local = threading.local()
+
+
+class Session:
+    def __init__(self, label):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self.sql = []  # [{"sql", "start", "ms"}]
+        self.started = time.perf_counter()
+        self.wall_ms = 0.0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.id}", daemon=True)
+
+    def _sample(self):
+        root = os.path.dirname(os.path.abspath(__file__))
+        while not self._stop.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                path = code.co_filename
+                if path.startswith(root):
+                    path = os.path.relpath(path, root)
+                else:
+                    path = os.path.basename(path)
+                names.append(f"{code.co_name} ({path}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    # -- sqlite3 trace callback ------------------------------------------
+    def on_sql(self, statement):
+        self.sql.append({"sql": statement, "start": round((time.perf_counter() - self.started) * 1000, 3), "ms": None})
+
+    def finish_sql(self, mark):
+        """Close statements traced since `mark` (statements issued by one execute call)."""
+        now = (time.perf_counter() - self.started) * 1000
+        for entry in self.sql[mark:]:
+            if entry["ms"] is None:
+                entry["ms"] = round(now - entry["start"], 3)
+
+    def folded(self):
+        return "\n".join(f"{stack} {n}" for stack, n in self.stacks.most_common())
+
+    def to_dict(self):
+        return {
+            "id": self.id, "request": self.label, "wall_ms": round(self.wall_ms, 3),
+            "interval_ms": PROFILE_INTERVAL * 1000, "samples": self.samples,
+            "sql_count": len(self.sql), "sql_ms": round(sum(s["ms"] or 0 for s in self.sql), 3),
+            "sql": self.sql, "folded": self.folded(),
+        }
+
+
+class ProfiledConnection(metrics.InstrumentedConnection):
+    """Closes the timing of traced statements when each execute() returns."""
+    session = None
+
+    def execute(self, sql, *args):
+        mark = len(self.session.sql)
+        try:
+            return super().execute(sql, *args)
+        finally:
+            self.session.finish_sql(mark)
+
+    def executemany(self, sql, *args):
+        mark = len(self.session.sql)
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            self.session.finish_sql(mark)
+
+    def commit(self):
+        mark = len(self.session.sql)
+        try:
+            return super().commit()
+        finally:
+            self.session.finish_sql(mark)
+
+
+def current():
+    return getattr(_local, "session", None)
+
+
+def start(label):
+    session = Session(label)
+    _local.session = session
+    session._sampler.start()
+    return session
+
+
+def stop(session):
+    session.wall_ms = (time.perf_counter() - session.started) * 1000
+    session._stop.set()
+    session._sampler.join()
+    session.finish_sql(0)
+    _local.session = None
+    return session
+
+
+def store(session, directory):
+    """Persist a finished profile as JSON plus a .folded file; prune old ones."""
+    os.makedirs(directory, exist_ok=True)
+    data = session.to_dict()
+    with open(os.path.join(directory, f"{session.id}.json"), "w") as f:
+        json.dump(data, f)
+    with open(os.path.join(directory, f"{session.id}.folded"), "w") as f:
+        f.write(data["folded"])
+    stored = sorted((p for p in os.listdir(directory) if p.endswith(".json")),
+                    key=lambda p: os.path.getmtime(os.path.join(directory, p)))
+    for name in stored[:-PROFILE_KEEP]:
+        for ext in (".json", ".folded"):
+            try:
+                os.remove(os.path.join(directory, name[:-5] + ext))
+            except OSError:
+                pass
+    return data
+
+
+def load(directory, profile_id, folded=False):
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(directory, f"{profile_id}.{'folded' if folded else 'json'}")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read() if folded else json.load(f)
@@ -0,0 +1,181 @@
+"""POP prospect scoring.
+
+All scoring goes through one versioned rule table. Rules work on four
+extracted metric columns kept on the prospects row (pop_page_score,
+pop_word_count_current, pop_word_count_target, pop_missing_terms), so a batch
+of rows (up to the whole table) is rescored as one NumPy pass plus one
+UPDATE batch without touching the raw POP report JSON.
+
+Rule history:
+  1 - legacy synchronous /api/pop_audit (word count vs target, missing terms)
+  2 - async POP audit job (word count % bands, missing terms)
+  3 - /api/backfill_pop_scores (page score, word gap %)
+"""
+import os
+import json
+
+BASE_SCORE = 50
+HOT_AT = 80
+WARM_AT = 60
+
+# version -> list of components. A component scores one feature: the first
+# band whose test passes contributes its points (and optional reason).
+# Bands are (op, threshold, points, reason_template).
+RULES = {
+    1: [
+        {"feature": "wc_ratio_pct", "requires": "wc_target", "bands": [
+            ("<", 50, 20, None), ("<", 100, 10, None)]},
+        {"feature": "missing_terms", "bands": [
+            (">", 10, 25, None), (">", 5, 15, None)]},
+    ],
+    2: [
+        {"feature": "wc_ratio_pct", "requires": "wc_both", "bands": [
+            ("<", 30, 30, "Severe content gap ({wc_current} vs {wc_target} words)"),
+            ("<", 50, 20, "Major content gap ({wc_current} vs {wc_target} words)"),
+            ("<", 70, 10, "Content below target ({wc_current} vs {wc_target} words)")]},
+        {"feature": "missing_terms", "bands": [
+            (">=", 15, 15, "Missing {missing_terms}+ LSI terms"),
+            (">=", 10, 10, "Missing {missing_terms} LSI terms"),
+            (">=", 5, 5, "Missing {missing_terms} LSI terms")]},
+    ],
+    3: [
+        {"feature": "page_score", "bands": [
+            (">=", 40, 30, "Page score {page_score}"),
+            (">=", 25, 20, "Page score {page_score}"),
+            (">=", 10, 10, "Page score {page_score}")]},
+        {"feature": "word_gap_pct", "bands": [
+            (">", 50, 15, "Severe content gap ({wc_current} vs {wc_target} words)"),
+            (">", 25, 10, "Major content gap ({wc_current} vs {wc_target} words)"),
+            (">", 0, 5, "Content below target ({wc_current} vs {wc_target} words)")]},
+    ],
+}
+
+CURRENT_VERSION = int(os.environ.get("SCORING_VERSION", max(RULES)))
+
+COLUMNS = ("page_score", "wc_current", "wc_target", "missing_terms")
+
+
+def _features(np, cols):
+    page = np.asarray(cols["page_score"], dtype=np.float64)
+    cur = np.asarray(cols["wc_current"], dtype=np.float64)
+    tgt = np.asarray(cols["wc_target"], dtype=np.float64)
+    missing = np.asarray(cols["missing_terms"], dtype=np.float64)
+    has_target = tgt > 0
+    safe_tgt = np.where(has_target, tgt, 1.0)
+    return {
+        "page_score": page,
+        "wc_current": cur,
+        "wc_target": tgt,
+        "missing_terms": missing,
+        "wc_ratio_pct": cur / safe_tgt * 100,
+        "word_gap_pct": np.where(has_target, (tgt - cur) / safe_tgt * 100, 0.0),
+        "requires:wc_target": has_target,
+        "requires:wc_both": has_target & (cur > 0),
+    }
+
+
+_OPS = {
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+}
+
+
+def score_columns(cols, version=None):
+    """Score metric columns in bulk.
+
+    `cols` maps each name in COLUMNS to a sequence (NULLs as 0). Returns
+    (scores, statuses, band_index) arrays; band_index[c][i] is the band that
+    fired for component c on row i, or -1.
+    """
+    import numpy as np
+
+    rules = RULES[version or CURRENT_VERSION]
+    feats = _features(np, cols)
+    n = len(feats["page_score"])
+    scores = np.full(n, BASE_SCORE, dtype=np.int64)
+    fired = []
+    for comp in rules:
+        values = feats[comp["feature"]]
+        eligible = feats[f"requires:{comp['requires']}"] if comp.get("requires") else np.ones(n, dtype=bool)
+        conds = [eligible & _OPS[op](values, threshold) for op, threshold, _, _ in comp["bands"]]
+        scores += np.select(conds, [points for _, _, points, _ in comp["bands"]], default=0)
+        fired.append(np.select(conds, list(range(len(conds))), default=-1))
+    scores = np.minimum(scores, 100)
+    statuses = np.where(scores >= HOT_AT, "hot", np.where(scores >= WARM_AT, "warm", "cold"))
+    return scores, statuses, fired
+
+
+def score_one(page_score=0, wc_current=0, wc_target=0, missing_terms=0, version=None):
+    """Score a single audit. Returns (pop_score, status, reasons)."""
+    row = {"page_score": page_score or 0, "wc_current": wc_current or 0,
+           "wc_target": wc_target or 0, "missing_terms": missing_terms or 0}
+    scores, statuses, fired = score_columns({k: [v] for k, v in row.items()}, version)
+    reasons = []
+    for comp, idx in zip(RULES[version or CURRENT_VERSION], fired):
+        band = int(idx[0])
+        if band >= 0 and comp["bands"][band][3]:
+            reasons.append(comp["bands"][band][3].format(**row))
+    return int(scores[0]), str(statuses[0]), reasons
+
+
+def extract_columns(pop_report_data):
+    """Metric columns from a stored pop_report_data JSON blob (one-time extraction)."""
+    data = json.loads(pop_report_data)
+    m = data.get("metrics", {}) if isinstance(data, dict) else {}
+    report_data = data.get("report_data", {}) if isinstance(data, dict) else {}
+    report = report_data.get("report", report_data.get("data", {}).get("report", {})) if isinstance(report_data, dict) else {}
+    wc = report.get("wordCount", {}) if isinstance(report.get("wordCount"), dict) else {}
+    return {
+        "page_score": m.get("page_score", 0) or 0,
+        "wc_current": m.get("word_count_current", 0) or wc.get("current", 0) or 0,
+        "wc_target": m.get("word_count_target", 0) or wc.get("target", 0) or 0,
+        "missing_terms": m.get("missing_terms_count", len(m.get("missing_terms", []))) or 0,
+    }
+
+
+# Rows for rescore_rows are `SELECT id, <RESCORE_COLUMNS>`. The raw report is only
+# read for rows whose metric columns predate this module; otherwise SQLite never loads the blob.
+RESCORE_COLUMNS = """pop_page_score, pop_word_count_current, pop_word_count_target, pop_missing_terms,
+    pop_score, prospect_status, pop_score_version,
+    CASE WHEN pop_page_score IS NULL THEN pop_report_data END AS raw"""
+
+
+def rescore_rows(db, rows, version=None):
+    """Rescore a batch of `SELECT id, <RESCORE_COLUMNS>` rows; caller commits.
+
+    Fills missing metric columns from the raw report, scores the batch in one
+    NumPy pass and writes changed rows with a single executemany. Returns a
+    list of {id, old_score, new_score, status} for rows whose score changed.
+    """
+    import numpy as np
+
+    version = version or CURRENT_VERSION
+    if not rows:
+        return []
+    ids, page, cur, tgt, missing, old, old_status, old_version, raw = (list(c) for c in zip(*rows))
+    filled = []
+    for i, blob in enumerate(raw):
+        if page[i] is not None:
+            continue
+        try:
+            c = extract_columns(blob)
+        except Exception:
+            c = {"page_score": 0, "wc_current": 0, "wc_target": 0, "missing_terms": 0}
+        page[i], cur[i], tgt[i], missing[i] = c["page_score"], c["wc_current"], c["wc_target"], c["missing_terms"]
+        filled.append((page[i], cur[i], tgt[i], missing[i], ids[i]))
+    if filled:
+        db.executemany("""UPDATE prospects SET pop_page_score=?, pop_word_count_current=?,
+            pop_word_count_target=?, pop_missing_terms=? WHERE id=?""", filled)
+
+    scores, statuses, _ = score_columns({
+        "page_score": [v or 0 for v in page], "wc_current": [v or 0 for v in cur],
+        "wc_target": [v or 0 for v in tgt], "missing_terms": [v or 0 for v in missing],
+    }, version)
+    old_scores = np.array([-1 if v is None else v for v in old], dtype=np.int64)
+    changed = (scores != old_scores) | (statuses != np.array(old_status, dtype=object)) | \
+              (np.array([v or 0 for v in old_version]) != version)
+    idx = np.nonzero(changed)[0]
+    db.executemany("UPDATE prospects SET pop_score=?, prospect_score=?, prospect_status=?, pop_score_version=? WHERE id=?",
+                   [(int(scores[i]), int(scores[i]), str(statuses[i]), version, ids[i]) for i in idx])
+    return [{"id": ids[i], "old_score": old[i], "new_score": int(scores[i]), "status": str(statuses[i])}
+            for i in idx if old[i] != int(scores[i])]
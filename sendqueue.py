@@ -0,0 +1,106 @@
+"""Background sender for campaign emails.
+
+/send_batch renders and registers a whole campaign, hands its messages to
+a SendQueue and returns. Worker threads take the messages in chunks of up
+to ``batch_size`` and make one ``send(payloads, key)`` call per chunk
+(Resend's batch endpoint takes 100 emails per request). Each outcome is
+reported through ``done(rows)`` as (status, resend_id, sent_at, email_id)
+rows, so tracking.db shows each email's progress.
+
+``key`` is stable per chunk, so an upstream that honours idempotency keys
+won't send a retried chunk twice. If ``send`` raises Retry(after) (rate
+limited, circuit open), the worker waits and tries the same chunk again,
+up to ``max_attempts``. Any other error fails the chunk.
+
+Messages live in memory only. If a worker is killed mid-campaign, its
+unsent emails stay 'queued' in tracking.db, and the campaign's progress
+counters show them.
+"""
+import queue
+import logging
+import threading
+import time
+from datetime import datetime as dt
+
+log = logging.getLogger(__name__)
+
+
+class Retry(Exception):
+    """Raised by a send function when the whole chunk may be tried again after `after` seconds."""
+
+    def __init__(self, after, reason=""):
+        self.after = after
+        super().__init__(reason or f"retry in {after:.0f}s")
+
+
+class SendQueue:
+    def __init__(self, send, done, batch_size=100, workers=2, max_attempts=5, name="campaigns"):
+        self._send = send
+        self._done = done
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.name = name
+        self._chunks = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.waiting = 0
+        self.sent = 0
+        self.failed = 0
+
+    def submit(self, key, messages):
+        """Queue (email_id, payload) pairs; chunk i is sent with idempotency key "<key>/<i>"."""
+        with self._lock:
+            if not self._threads:
+                self._threads = [threading.Thread(target=self._loop, name=f"{self.name}-sender-{i}", daemon=True)
+                                 for i in range(self.workers)]
+                for t in self._threads:
+                    t.start()
+            self.waiting += len(messages)
+        for i in range(0, len(messages), self.batch_size):
+            self._chunks.put((f"{key}/{i // self.batch_size}", messages[i:i + self.batch_size]))
+
+    def depth(self):
+        """Messages submitted but not yet sent or failed."""
+        return self.waiting
+
+    def join(self):
+        """Block until every submitted chunk has been handled."""
+        self._chunks.join()
+
+    def _loop(self):
+        while True:
+            key, messages = self._chunks.get()
+            try:
+                rows = self._deliver(key, messages)
+                try:
+                    self._done(rows)
+                except Exception as e:
+                    log.error(f"{self.name}: recording {len(rows)} outcomes for {key} failed: {e}")
+                with self._lock:
+                    self.waiting -= len(messages)
+                    sent = sum(1 for r in rows if r[0] == "sent")
+                    self.sent += sent
+                    self.failed += len(rows) - sent
+            finally:
+                self._chunks.task_done()
+
+    def _deliver(self, key, messages):
+        payloads = [payload for _, payload in messages]
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                ids = list(self._send(payloads, key))
+                ids += [""] * (len(messages) - len(ids))  # accepted, but no id came back for these
+                now = dt.utcnow().isoformat()
+                return [("sent", rid, now, email_id) for (email_id, _), rid in zip(messages, ids)]
+            except Retry as e:
+                if attempt == self.max_attempts:
+                    log.error(f"{self.name}: {key} gave up after {attempt} attempts: {e}")
+                    break
+                log.warning(f"{self.name}: {key} attempt {attempt} deferred: {e}")
+                time.sleep(e.after)
+            except Exception as e:
+                log.error(f"{self.name}: {key} failed: {e}")
+                break
+        now = dt.utcnow().isoformat()
+        return [("failed", "", now, email_id) for email_id, _ in messages]
@@ -0,0 +1,125 @@
+"""Follow-up sequences: step conditions and the background runner.
+
+A sequence is an ordered list of steps, each one email:
+
+    {"after_days": 3, "when": "no_open", "subject": "...", "html": "...", "text": "..."}
+
+An enrollment walks one recipient through a sequence. Its ``due_at`` is
+when the next step is considered: ``after_days`` after the previous email,
+or after enrolling for the first step. The enrollments table, indexed on
+(status, due_at), is the persistent timer heap. Nothing is held in memory
+between ticks, and a restart loses nothing.
+
+Each tick takes the earliest due enrollments in one batch. It loads the
+engagement of their previous emails (opens, clicks, bounces) and the
+prospects' response dates in one query each. Then it decides every
+enrollment in the batch:
+
+- stop: the prospect responded, the last email hard-bounced or drew a
+  complaint, or the address is suppressed;
+- send: the step's condition holds, so the step's email goes out and the
+  next step is scheduled;
+- skip: the condition doesn't hold, so the next step is scheduled from
+  now without sending.
+
+Conditions are checked against the previous email in the sequence:
+
+    always, no_open, opened, no_click, clicked, opened_no_click
+
+Runner drives ticks from a daemon thread in each worker. Only the holder
+of a database lease ticks, so several workers never send the same step.
+A tick returns when to tick again (the next due time, or when the send
+rate limiter has room), and the runner sleeps until then or for ``idle``
+seconds, whichever is sooner.
+"""
+import os
+import uuid
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+CONDITIONS = {
+    "always": lambda e: True,
+    "no_open": lambda e: e["opens"] == 0,
+    "opened": lambda e: e["opens"] > 0,
+    "no_click": lambda e: e["clicks"] == 0,
+    "clicked": lambda e: e["clicks"] > 0,
+    "opened_no_click": lambda e: e["opens"] > 0 and e["clicks"] == 0,
+}
+NO_ENGAGEMENT = {"opens": 0, "clicks": 0, "bounced": 0}
+
+
+def validate_steps(steps):
+    """Raise ValueError unless `steps` is a usable list of step dicts."""
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("'steps' must be a non-empty list")
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise ValueError(f"step {i}: must be an object")
+        if step.get("when", "always") not in CONDITIONS:
+            raise ValueError(f"step {i}: 'when' must be one of {', '.join(CONDITIONS)}")
+        if not isinstance(step.get("after_days", 0), (int, float)) or step.get("after_days", 0) < 0:
+            raise ValueError(f"step {i}: 'after_days' must be a non-negative number")
+        if not step.get("subject") or not (step.get("html") or step.get("text")):
+            raise ValueError(f"step {i}: 'subject' and 'html' or 'text' are required")
+
+
+def decide(enrollment, step, engagement, responded, suppressed):
+    """"stop", "send" or "skip" for one due enrollment."""
+    if responded or suppressed or engagement["bounced"]:
+        return "stop"
+    if enrollment["last_email_id"] is None or CONDITIONS[step.get("when", "always")](engagement):
+        return "send"
+    return "skip"
+
+
+class Runner:
+    """Calls tick() from a daemon thread while this process holds the lease.
+
+    ``tick(now)`` handles what it can of the due enrollments and returns
+    when to tick again (epoch seconds, or None for "nothing scheduled").
+    ``lead(owner, now, ttl)`` acquires or renews the lease and returns
+    whether this process holds it.
+    """
+
+    def __init__(self, tick, lead, idle=30.0, lease_ttl=120.0, name="sequences"):
+        self._tick = tick
+        self._lead = lead
+        self.idle = idle
+        self.lease_ttl = lease_ttl
+        self.name = name
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.leader = False
+        self.ticks = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"  # after any fork
+                self._thread = threading.Thread(target=self._loop, name=f"{self.name}-runner", daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Tick now (e.g. after new enrollments), instead of at the next due time."""
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            wait = self.idle
+            try:
+                now = time.time()
+                self.leader = self._lead(self.owner, now, self.lease_ttl)
+                if self.leader:
+                    next_due = self._tick(now)
+                    self.ticks += 1
+                    if next_due is not None:
+                        wait = min(self.idle, max(0.0, next_due - time.time()))
+            except Exception as e:
+                log.error(f"{self.name} tick failed: {e}")
+            self._wake.wait(wait)
+            self._wake.clear()
@@ -0,0 +1,990 @@
+"""Storage backends for prospects, searches, emails and events.
+
+Request handlers go through a Storage object instead of opening SQL
+connections. Two implementations share the query code below:
+
+- SQLiteStorage (default) keeps today's layout: prospects.db in WAL mode
+  behind a read-only pool and one writer thread per process (dbpool.py),
+  and tracking.db opened per call. It is handed those connection functions
+  by app.py, so metrics and profiling keep working.
+- PostgresStorage keeps every table in one PostgreSQL database behind a
+  psycopg connection pool, so several web instances can share state. Bulk
+  event ingest goes through COPY. psycopg is only imported when this backend
+  is selected (STORAGE_BACKEND=postgres, DATABASE_URL=...).
+
+Queries are written for SQLite (``?`` placeholders, ``INSERT OR ...``);
+PostgresStorage rewrites placeholders and builds ON CONFLICT upserts.
+
+Not covered here: backfills, bulk rescoring and schema migrations
+(backfills.py, scoring.py, migrations.py) work on the SQLite file only.
+
+tests/test_storage.py runs every operation against SQLite, and against
+Postgres when STORAGE_CHECK_DSN is set (in a scratch storage_check schema).
+"""
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+EMAIL_COLUMNS = ("id", "subject", "recipient", "recipient_name", "client", "sent_at", "resend_id", "campaign_id", "status",
+                 "prospect_id")
+CAMPAIGN_COLUMNS = ("id", "subject", "from_addr", "client", "created_at", "total")
+EVENT_COLUMNS = ("email_id", "event_type", "url", "ip", "user_agent", "timestamp")
+LINK_COLUMNS = ("email_id", "idx", "url")
+SUPPRESSION_COLUMNS = ("address", "reason", "created_at")
+IDEMPOTENCY_COLUMNS = ("key", "fingerprint", "status", "response", "created_at")
+SEQUENCE_COLUMNS = ("id", "name", "steps", "from_addr", "created_at")
+ENROLLMENT_COLUMNS = ("sequence_id", "recipient", "prospect_id", "vars", "due_at", "created_at")
+# Funnel stages, in order; every prospect has been searched (or imported)
+FUNNEL_STAGES = ("searched", "analyzed", "audited", "pitched", "opened", "clicked", "responded")
+SEARCH_COLUMNS = ("id", "query", "niche", "location", "result_count", "created_at")
+FOUND_COLUMNS = ("business_name", "website", "phone", "address", "city", "state", "niche", "rating", "reviews",
+                 "search_query", "created_at", "updated_at")
+IMPORT_COLUMNS = ("id", "business_name", "website", "phone", "address", "city", "state", "niche", "rating", "reviews",
+                  "seo_score", "prospect_score", "prospect_status", "issues", "has_ssl",
+                  "pitch_subject", "pitch_body", "pitch_date", "sent_date", "contact_method",
+                  "response_date", "pop_report_data", "pop_audit_date", "pop_score",
+                  # Derived POP columns are reset so an imported report is re-extracted, not scored from stale values
+                  "pop_word_count_current", "pop_word_count_target", "pop_page_score", "pop_missing_terms",
+                  "pop_score_version", "search_query", "created_at", "updated_at")
+IMPORT_DEFAULTS = {"seo_score": 0, "prospect_score": 0, "prospect_status": "new", "has_ssl": 0,
+                   "pop_word_count_current": 0, "pop_word_count_target": 0}
+# Columns update_prospect() may set
+UPDATABLE = frozenset(IMPORT_COLUMNS) - {"id", "created_at"}
+FUNNEL_PROSPECT_COLUMNS = ("prospect_id", "niche", "city") + FUNNEL_STAGES[1:]
+# Stage flags of the given prospects, read across both databases (prospects.db is
+# ATTACHed to the tracking connection on SQLite). Pitched counts a manual mark_sent
+# or any tracked email; opened and clicked count the tracker's and Resend's events.
+FUNNEL_STAGES_SQL = """SELECT p.id AS prospect_id, COALESCE(p.niche, '') AS niche, COALESCE(p.city, '') AS city,
+    CASE WHEN p.issues IS NOT NULL THEN 1 ELSE 0 END AS analyzed,
+    CASE WHEN p.pop_audit_date IS NOT NULL THEN 1 ELSE 0 END AS audited,
+    CASE WHEN p.sent_date IS NOT NULL OR EXISTS (SELECT 1 FROM emails e WHERE e.prospect_id = p.id) THEN 1 ELSE 0 END AS pitched,
+    CASE WHEN EXISTS (SELECT 1 FROM emails e WHERE e.prospect_id = p.id AND EXISTS (
+        SELECT 1 FROM events ev WHERE ev.email_id = e.id AND ev.event_type IN ('open', 'opened'))) THEN 1 ELSE 0 END AS opened,
+    CASE WHEN EXISTS (SELECT 1 FROM emails e WHERE e.prospect_id = p.id AND EXISTS (
+        SELECT 1 FROM events ev WHERE ev.email_id = e.id AND ev.event_type IN ('click', 'clicked'))) THEN 1 ELSE 0 END AS clicked,
+    CASE WHEN p.response_date IS NOT NULL THEN 1 ELSE 0 END AS responded
+FROM {prospects} p WHERE p.id IN ({ids})"""
+# Prospects that may have changed funnel stage since the watermarks (updated day, last event id)
+FUNNEL_CANDIDATES_SQL = """SELECT id FROM {prospects} WHERE updated_at >= ?
+    UNION SELECT prospect_id FROM funnel_dirty
+    UNION SELECT e.prospect_id FROM events ev JOIN emails e ON e.id = ev.email_id
+        WHERE ev.id > ? AND e.prospect_id IS NOT NULL"""
+
+# Queries on request and scheduler paths. They are named so `python migrations.py
+# check` explains the exact text that runs; {marks} is one "?" per id.
+PROSPECT_SQL = "SELECT * FROM prospects WHERE id = ?"
+PROSPECT_BY_WEBSITE_SQL = "SELECT * FROM prospects WHERE website = ?"
+PROSPECTS_BY_STATUS_SQL = """SELECT * FROM prospects WHERE prospect_status = ?
+    ORDER BY pop_audit_date DESC{nulls_last}, prospect_score DESC"""
+PROSPECT_COUNT_SQL = "SELECT COUNT(*) AS n FROM prospects"
+STATUS_COUNTS_SQL = "SELECT prospect_status, COUNT(*) as c FROM prospects GROUP BY prospect_status"
+TOP_NICHES_SQL = "SELECT niche, COUNT(*) as c FROM prospects WHERE niche IS NOT NULL GROUP BY niche ORDER BY c DESC LIMIT 10"
+RECENT_SEARCHES_SQL = "SELECT * FROM searches ORDER BY created_at DESC LIMIT 5"
+SENT_COUNT_SQL = "SELECT COUNT(*) AS n FROM prospects WHERE sent_date IS NOT NULL"
+RESPONDED_COUNT_SQL = "SELECT COUNT(*) AS n FROM prospects WHERE response_date IS NOT NULL"
+AUDITED_COUNT_SQL = "SELECT COUNT(*) AS n FROM prospects WHERE pop_audit_date IS NOT NULL"
+REPORT_VIEW_SQL = """SELECT p.id, p.business_name, p.website, p.pop_audit_date, p.pop_score,
+        p.pop_word_count_current, p.pop_word_count_target, p.pop_report_data IS NOT NULL AS has_report,
+        v.pop_audit_date AS view_date, v.etag, v.view
+    FROM prospects p LEFT JOIN pop_report_views v ON v.prospect_id = p.id WHERE p.id = ?"""
+ANALYTICS_SQL = """SELECT e.*,
+        (SELECT COUNT(*) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'open') as opens,
+        (SELECT COUNT(DISTINCT ip) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'open') as unique_opens,
+        (SELECT COUNT(*) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'click') as clicks,
+        (SELECT MIN(timestamp) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'open') as first_open,
+        (SELECT MAX(timestamp) FROM events ev WHERE ev.email_id = e.id AND ev.event_type = 'open') as last_open
+    FROM emails e ORDER BY e.sent_at DESC"""
+EMAIL_COUNT_SQL = "SELECT COUNT(*) AS n FROM emails"
+OPENED_COUNT_SQL = "SELECT COUNT(DISTINCT email_id) AS n FROM events WHERE event_type = 'open'"
+CLICK_COUNT_SQL = "SELECT COUNT(*) AS n FROM events WHERE event_type = 'click'"
+EMAIL_EVENTS_SQL = "SELECT * FROM events WHERE email_id = ? ORDER BY timestamp DESC"
+EMAIL_LINKS_SQL = "SELECT url FROM links WHERE email_id = ? ORDER BY idx"
+CAMPAIGN_COUNTS_SQL = "SELECT status, COUNT(*) AS n FROM emails WHERE campaign_id = ? GROUP BY status"
+# Explicit casts: these parameters sit in a SELECT list, not a VALUES row, so nothing ties them to the events columns
+RESEND_EVENTS_SQL = f"""INSERT INTO events ({', '.join(EVENT_COLUMNS)})
+    SELECT id, CAST(? AS TEXT), CAST(? AS TEXT), CAST(? AS TEXT), CAST(? AS TEXT), CAST(? AS TEXT)
+    FROM emails WHERE resend_id = ?"""
+SUPPRESSED_SQL = "SELECT address FROM suppressions"
+IDEMPOTENCY_SQL = "SELECT fingerprint, status, response, created_at FROM idempotency WHERE key = ?"
+IDEMPOTENCY_PURGE_SQL = "DELETE FROM idempotency WHERE created_at < ?"
+DUE_ENROLLMENTS_SQL = """SELECT * FROM enrollments WHERE status = 'active' AND due_at <= ?
+    ORDER BY due_at LIMIT ?"""
+NEXT_DUE_SQL = "SELECT MIN(due_at) AS t FROM enrollments WHERE status = 'active'"
+ENGAGEMENT_SQL = """SELECT email_id, SUM(CASE WHEN event_type IN ('open', 'opened') THEN 1 ELSE 0 END) AS opens,
+        SUM(CASE WHEN event_type IN ('click', 'clicked') THEN 1 ELSE 0 END) AS clicks,
+        SUM(CASE WHEN event_type IN ('hard_bounced', 'complained') THEN 1 ELSE 0 END) AS bounced
+    FROM events WHERE email_id IN ({marks}) GROUP BY email_id"""
+
+
+def _utcnow():
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class Storage:
+    """Shared query code. Subclasses supply connections and dialect hooks."""
+    name = None
+    NULLS_LAST = ""  # SQLite already sorts NULLs last under DESC
+    PROSPECTS = "prospects"  # the prospects table as seen from a funnel_write() connection
+
+    # -- backend hooks ---------------------------------------------------
+    def read(self):
+        """Context manager yielding a prospects connection for reads."""
+        raise NotImplementedError
+
+    def write(self, fn, *args):
+        """Run fn(db, *args) in one prospects transaction and return its result."""
+        raise NotImplementedError
+
+    def tracking_read(self):
+        raise NotImplementedError
+
+    def tracking_write(self, fn, *args):
+        raise NotImplementedError
+
+    def funnel_write(self, fn):
+        """Run fn(db) in one tracking transaction that can also read PROSPECTS,
+        holding out any other funnel refresh until it commits."""
+        raise NotImplementedError
+
+    def sql(self, sql):
+        return sql
+
+    def insert(self, table, columns, replace_on=None):
+        """INSERT that skips conflicting rows, or replaces them when `replace_on` names the key."""
+        marks = ", ".join("?" * len(columns))
+        verb = "INSERT OR REPLACE" if replace_on else "INSERT OR IGNORE"
+        return f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({marks})"
+
+    def executemany(self, db, sql, rows):
+        """Run `sql` once per row; returns the number of rows changed."""
+        return db.executemany(self.sql(sql), rows).rowcount
+
+    @contextmanager
+    def savepoint(self, db):
+        db.execute("SAVEPOINT row")
+        try:
+            yield
+        except Exception:
+            db.execute("ROLLBACK TO row")
+            db.execute("RELEASE row")
+            raise
+        db.execute("RELEASE row")
+
+    def after_import(self, db, table):
+        """Hook run after rows were inserted with explicit ids."""
+
+    # -- helpers ---------------------------------------------------------
+    def _funnel_dirty(self, db, emails):
+        """Queue the prospects of newly registered emails for the next funnel refresh."""
+        pids = {(e.get("prospect_id"),) for e in emails if e.get("prospect_id") is not None}
+        if pids:
+            self.executemany(db, self.insert("funnel_dirty", ("prospect_id",)), sorted(pids))
+
+    def _all(self, db, sql, params=()):
+        return [dict(r) for r in db.execute(self.sql(sql), params).fetchall()]
+
+    def _one(self, db, sql, params=()):
+        row = db.execute(self.sql(sql), params).fetchone()
+        return dict(row) if row is not None else None
+
+    # -- emails / events -------------------------------------------------
+    def register_email(self, email, links=None):
+        """Insert or replace a tracked email; `email` maps EMAIL_COLUMNS.
+
+        `links` (target URLs in link-number order), when given, replaces the
+        email's link table in the same transaction.
+        """
+        def write(db):
+            db.execute(self.sql(self.insert("emails", EMAIL_COLUMNS, replace_on="id")),
+                       tuple(email.get(c) for c in EMAIL_COLUMNS))
+            self._funnel_dirty(db, [email])
+            if links is not None:
+                db.execute(self.sql("DELETE FROM links WHERE email_id = ?"), (email["id"],))
+                self.executemany(db, self.insert("links", LINK_COLUMNS), [(email["id"], i, url) for i, url in enumerate(links)])
+        self.tracking_write(write)
+
+    def create_campaign(self, campaign, emails, links):
+        """Store a campaign (`campaign` maps CAMPAIGN_COLUMNS), its queued emails
+        (dicts mapping EMAIL_COLUMNS) and their links ({email_id: [url, ...]}) in one transaction."""
+        def write(db):
+            db.execute(self.sql(self.insert("campaigns", CAMPAIGN_COLUMNS)), tuple(campaign.get(c) for c in CAMPAIGN_COLUMNS))
+            self.executemany(db, self.insert("emails", EMAIL_COLUMNS, replace_on="id"),
+                             [tuple(e.get(c) for c in EMAIL_COLUMNS) for e in emails])
+            self._funnel_dirty(db, emails)
+            self.executemany(db, self.insert("links", LINK_COLUMNS),
+                             [(email_id, i, url) for email_id, urls in links.items() for i, url in enumerate(urls)])
+        self.tracking_write(write)
+
+    def mark_emails(self, rows):
+        """Record send outcomes, (status, resend_id, sent_at, email_id) each."""
+        if rows:
+            self.tracking_write(lambda db: self.executemany(
+                db, "UPDATE emails SET status = ?, resend_id = ?, sent_at = ? WHERE id = ?", rows))
+
+    def campaign_progress(self, campaign_id):
+        """The campaign row plus email counts by status, or None."""
+        with self.tracking_read() as db:
+            campaign = self._one(db, "SELECT * FROM campaigns WHERE id = ?", (campaign_id,))
+            if campaign:
+                campaign["counts"] = {r["status"]: r["n"] for r in self._all(db, CAMPAIGN_COUNTS_SQL, (campaign_id,))}
+        return campaign
+
+    def email_links(self, email_id):
+        """Target URLs of an email's tracked links, indexed by link number."""
+        with self.tracking_read() as db:
+            return [r["url"] for r in self._all(db, EMAIL_LINKS_SQL, (email_id,))]
+
+    def record_event(self, email_id, event_type, url, ip, user_agent, timestamp):
+        self.tracking_write(lambda db: db.execute(
+            self.sql(f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)"),
+            (email_id, event_type, url, ip, user_agent, timestamp)))
+
+    def record_events(self, rows):
+        """Bulk-insert event tuples ordered as EVENT_COLUMNS."""
+        if rows:
+            self.tracking_write(lambda db: self.executemany(
+                db, f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)", rows))
+
+    def record_resend_events(self, rows):
+        """Bulk-insert webhook events, (resend_id, event_type, url, ip, user_agent, timestamp) each.
+        Events for emails we don't know (sent outside the relay) are dropped."""
+        if rows:
+            self.tracking_write(lambda db: self.executemany(db, RESEND_EVENTS_SQL, [(*r[1:], r[0]) for r in rows]))
+
+    def suppress(self, rows):
+        """Add (address, reason, created_at) rows; an address already listed keeps its first reason."""
+        if rows:
+            self.tracking_write(lambda db: self.executemany(db, self.insert("suppressions", SUPPRESSION_COLUMNS), rows))
+
+    def suppressed_recipients(self):
+        """Addresses that hard-bounced or drew a complaint, whether or not we tracked the email."""
+        with self.tracking_read() as db:
+            return [r["address"] for r in self._all(db, SUPPRESSED_SQL)]
+
+    def email_analytics(self):
+        with self.tracking_read() as db:
+            emails = self._all(db, ANALYTICS_SQL)
+            totals = {
+                "total_sent": self._one(db, EMAIL_COUNT_SQL)["n"],
+                "total_opened": self._one(db, OPENED_COUNT_SQL)["n"],
+                "total_clicks": self._one(db, CLICK_COUNT_SQL)["n"],
+            }
+        return emails, totals
+
+    def email_detail(self, email_id):
+        with self.tracking_read() as db:
+            email = self._one(db, "SELECT * FROM emails WHERE id = ?", (email_id,))
+            events = self._all(db, EMAIL_EVENTS_SQL, (email_id,))
+        return email, events
+
+    # -- idempotency keys ------------------------------------------------
+    def claim_request(self, key, fingerprint, now, ttl, stale_after):
+        """Claim an idempotency key for a request whose body hashes to `fingerprint`.
+
+        Returns None when the caller now owns the key: it was unseen, expired
+        (older than `ttl`), or left in flight for over `stale_after` seconds.
+        Otherwise returns the existing row (fingerprint, status, response,
+        created_at); status is 0 while the first request is still running.
+        """
+        def claim(db):
+            if db.execute(self.sql(self.insert("idempotency", IDEMPOTENCY_COLUMNS)),
+                          (key, fingerprint, 0, None, now)).rowcount:
+                return None
+            row = self._one(db, IDEMPOTENCY_SQL, (key,))
+            if row and row["created_at"] >= now - ttl and (row["status"] or row["created_at"] >= now - stale_after):
+                return row
+            db.execute(self.sql(self.insert("idempotency", IDEMPOTENCY_COLUMNS, replace_on="key")),
+                       (key, fingerprint, 0, None, now))
+            return None
+        return self.tracking_write(claim)
+
+    def finish_request(self, key, status, response):
+        self.tracking_write(lambda db: db.execute(
+            self.sql("UPDATE idempotency SET status = ?, response = ? WHERE key = ?"), (status, response, key)))
+
+    def release_request(self, key):
+        self.tracking_write(lambda db: db.execute(self.sql("DELETE FROM idempotency WHERE key = ?"), (key,)))
+
+    def purge_requests(self, before):
+        """Drop idempotency keys created before `before` (epoch seconds)."""
+        self.tracking_write(lambda db: db.execute(self.sql(IDEMPOTENCY_PURGE_SQL), (before,)))
+
+    # -- follow-up sequences ---------------------------------------------
+    def create_sequence(self, sequence):
+        """Insert a sequence; `sequence` maps SEQUENCE_COLUMNS (steps as JSON text)."""
+        self.tracking_write(lambda db: db.execute(self.sql(self.insert("sequences", SEQUENCE_COLUMNS)),
+                                                  tuple(sequence.get(c) for c in SEQUENCE_COLUMNS)))
+
+    def get_sequences(self, ids):
+        """{id: sequence row} for the ids that exist."""
+        if not ids:
+            return {}
+        with self.tracking_read() as db:
+            rows = self._all(db, f"SELECT * FROM sequences WHERE id IN ({','.join('?' * len(ids))})", tuple(ids))
+        return {r["id"]: r for r in rows}
+
+    def enroll(self, rows):
+        """Add enrollments, tuples ordered as ENROLLMENT_COLUMNS; recipients already
+        in the sequence are skipped. Returns the number added."""
+        # Skipped rows change nothing, so the row count is the number added
+        return self.tracking_write(lambda db: self.executemany(db, self.insert("enrollments", ENROLLMENT_COLUMNS), rows))
+
+    def due_enrollments(self, now, limit):
+        """Active enrollments due by `now`, earliest first, and the next due time after them."""
+        with self.tracking_read() as db:
+            due = self._all(db, DUE_ENROLLMENTS_SQL, (now, limit))
+            next_due = self._one(db, NEXT_DUE_SQL)["t"]
+        return due, next_due
+
+    def engagement(self, email_ids):
+        """{email_id: {"opens", "clicks", "bounced"}} for emails with any events.
+        Opens and clicks count both the tracker's and Resend's events."""
+        if not email_ids:
+            return {}
+        with self.tracking_read() as db:
+            rows = self._all(db, ENGAGEMENT_SQL.format(marks=",".join("?" * len(email_ids))), tuple(email_ids))
+        return {r.pop("email_id"): r for r in rows}
+
+    def advance_enrollments(self, updates, emails=(), links=None):
+        """Apply scheduler decisions in one transaction: `updates` are
+        (step, status, due_at, last_email_id, last_sent_at, id) rows, and the
+        emails they send (dicts mapping EMAIL_COLUMNS, with links {email_id: [url, ...]})
+        are registered alongside."""
+        def write(db):
+            if emails:
+                self.executemany(db, self.insert("emails", EMAIL_COLUMNS, replace_on="id"),
+                                 [tuple(e.get(c) for c in EMAIL_COLUMNS) for e in emails])
+                self._funnel_dirty(db, emails)
+            if links:
+                self.executemany(db, self.insert("links", LINK_COLUMNS),
+                                 [(email_id, i, url) for email_id, urls in links.items() for i, url in enumerate(urls)])
+            self.executemany(db, """UPDATE enrollments SET step = ?, status = ?, due_at = ?, last_email_id = ?,
+                last_sent_at = ? WHERE id = ?""", updates)
+        self.tracking_write(write)
+
+    def sequence_progress(self, sequence_id):
+        """Enrollment counts by status plus the next due time, or None if there's no such sequence."""
+        with self.tracking_read() as db:
+            sequence = self._one(db, "SELECT * FROM sequences WHERE id = ?", (sequence_id,))
+            if sequence:
+                sequence["counts"] = {r["status"]: r["n"] for r in self._all(
+                    db, "SELECT status, COUNT(*) AS n FROM enrollments WHERE sequence_id = ? GROUP BY status",
+                    (sequence_id,))}
+                sequence["next_due"] = self._one(db, """SELECT MIN(due_at) AS t FROM enrollments
+                    WHERE sequence_id = ? AND status = 'active'""", (sequence_id,))["t"]
+        return sequence
+
+    def take_lease(self, name, owner, now, ttl):
+        """Acquire or renew the named lease for `owner` until now + ttl. True if `owner` holds it."""
+        def write(db):
+            db.execute(self.sql(self.insert("leases", ("name", "owner", "expires_at"))), (name, owner, now + ttl))
+            return db.execute(self.sql("UPDATE leases SET owner = ?, expires_at = ? WHERE name = ? AND (owner = ? OR expires_at < ?)"),
+                              (owner, now + ttl, name, owner, now)).rowcount == 1
+        return self.tracking_write(write)
+
+    # -- funnel ----------------------------------------------------------
+    def refresh_funnel(self):
+        """Bring the funnel aggregate up to date and return how many prospects were re-evaluated.
+
+        Only prospects that may have moved are re-evaluated: those updated
+        since the day of the last refresh (updated_at mixes formats, so whole
+        days are compared), those queued in funnel_dirty by email writes, and
+        those with events newer than the last seen event id. Their stage flags
+        are diffed against funnel_prospects and the differences are added to
+        funnel_counts. With no watermark (first run, or after reset_funnel())
+        everything is rebuilt.
+        """
+        def refresh(db):
+            marks = {r["name"]: r["value"] for r in self._all(db, "SELECT name, value FROM funnel_state")}
+            started = _utcnow()
+            last_event = self._one(db, "SELECT COALESCE(MAX(id), 0) AS n FROM events")["n"]
+            if "events" not in marks:
+                db.execute(self.sql("DELETE FROM funnel_prospects"))
+                db.execute(self.sql("DELETE FROM funnel_counts"))
+                pids = [r["id"] for r in self._all(db, f"SELECT id FROM {self.PROSPECTS}")]
+            else:
+                pids = [r["id"] for r in self._all(db, FUNNEL_CANDIDATES_SQL.format(prospects=self.PROSPECTS),
+                                                   (marks["prospects"][:10], int(marks["events"])))]
+            deltas = {}
+
+            def count(row, sign):
+                key = (row["niche"], row["city"])
+                totals = deltas.setdefault(key, [0] * len(FUNNEL_STAGES))
+                totals[0] += sign
+                for i, stage in enumerate(FUNNEL_STAGES[1:], 1):
+                    totals[i] += sign * row[stage]
+
+            for i in range(0, len(pids), 500):
+                chunk = pids[i:i + 500]
+                marks_sql = ",".join("?" * len(chunk))
+                old = {r["prospect_id"]: r for r in self._all(
+                    db, f"SELECT * FROM funnel_prospects WHERE prospect_id IN ({marks_sql})", tuple(chunk))}
+                new = {r["prospect_id"]: r for r in self._all(db, FUNNEL_STAGES_SQL.format(
+                    prospects=self.PROSPECTS, ids=marks_sql), tuple(chunk))}
+                changed = [r for pid, r in new.items() if old.get(pid) != r]
+                for row in changed:
+                    if row["prospect_id"] in old:
+                        count(old[row["prospect_id"]], -1)
+                    count(row, 1)
+                gone = [(pid,) for pid in old if pid not in new]
+                for (pid,) in gone:
+                    count(old[pid], -1)
+                self.executemany(db, self.insert("funnel_prospects", FUNNEL_PROSPECT_COLUMNS, replace_on="prospect_id"),
+                                 [tuple(r[c] for c in FUNNEL_PROSPECT_COLUMNS) for r in changed])
+                self.executemany(db, "DELETE FROM funnel_prospects WHERE prospect_id = ?", gone)
+
+            stages = ", ".join(FUNNEL_STAGES)
+            self.executemany(db, f"""INSERT INTO funnel_counts (niche, city, {stages})
+                VALUES (?, ?, {", ".join("?" * len(FUNNEL_STAGES))}) ON CONFLICT (niche, city) DO UPDATE SET
+                {", ".join(f"{s} = funnel_counts.{s} + excluded.{s}" for s in FUNNEL_STAGES)}""",
+                             [(*key, *totals) for key, totals in deltas.items() if any(totals)])
+            db.execute(self.sql("DELETE FROM funnel_counts WHERE searched <= 0"))
+            db.execute(self.sql("DELETE FROM funnel_dirty"))
+            self.executemany(db, self.insert("funnel_state", ("name", "value"), replace_on="name"),
+                             [("prospects", started), ("events", str(last_event)), ("refreshed_at", started)])
+            return len(pids)
+        return self.funnel_write(refresh)
+
+    def reset_funnel(self):
+        """Make the next refresh_funnel() rebuild from scratch (e.g. after a bulk import
+        whose rows carry old updated_at values)."""
+        self.tracking_write(lambda db: db.execute(self.sql("DELETE FROM funnel_state")))
+
+    def funnel(self, by=(), niche=None, city=None):
+        """Stage totals from the funnel aggregate, plus rows grouped by `by` (a subset of
+        ("niche", "city")), optionally filtered to one niche and/or city."""
+        where, params = [], []
+        for column, value in (("niche", niche), ("city", city)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(where)}" if where else ""
+        sums = ", ".join(f"COALESCE(SUM({s}), 0) AS {s}" for s in FUNNEL_STAGES)
+        with self.tracking_read() as db:
+            totals = self._one(db, f"SELECT {sums} FROM funnel_counts {where}", tuple(params))
+            groups = []
+            if by:
+                keys = ", ".join(by)
+                groups = self._all(db, f"""SELECT {keys}, {sums} FROM funnel_counts {where}
+                    GROUP BY {keys} ORDER BY searched DESC, {keys}""", tuple(params))
+            refreshed = self._one(db, "SELECT value FROM funnel_state WHERE name = 'refreshed_at'")
+        return totals, groups, refreshed and refreshed["value"]
+
+    # -- prospects -------------------------------------------------------
+    def get_prospect(self, pid):
+        with self.read() as db:
+            return self._one(db, PROSPECT_SQL, (pid,))
+
+    def get_prospects(self, ids):
+        """{id: prospect} for the ids that exist."""
+        if not ids:
+            return {}
+        with self.read() as db:
+            rows = self._all(db, f"SELECT * FROM prospects WHERE id IN ({','.join('?' * len(ids))})", tuple(ids))
+        return {r["id"]: r for r in rows}
+
+    def prospect_contacts(self, ids):
+        """{id: prospect} with just the columns follow-ups use (template fields, response_date)."""
+        if not ids:
+            return {}
+        with self.read() as db:
+            rows = self._all(db, f"""SELECT id, business_name, website, phone, city, state, niche, rating, reviews,
+                    seo_score, pop_score, sent_date, response_date
+                FROM prospects WHERE id IN ({','.join('?' * len(ids))})""", tuple(ids))
+        return {r["id"]: r for r in rows}
+
+    def list_prospects(self, status=None):
+        with self.read() as db:
+            if status:
+                return self._all(db, PROSPECTS_BY_STATUS_SQL.format(nulls_last=self.NULLS_LAST), (status,))
+            return self._all(db, """SELECT * FROM prospects
+                ORDER BY CASE WHEN pop_audit_date IS NULL THEN 1 ELSE 0 END, pop_audit_date DESC, prospect_score DESC""")
+
+    def count_prospects(self):
+        with self.read() as db:
+            return self._one(db, PROSPECT_COUNT_SQL)["n"]
+
+    def prospect_summary(self):
+        """Counts behind /api/stats and /api/text."""
+        with self.read() as db:
+            one = lambda sql: self._one(db, sql)["n"]
+            return {
+                "total": one(PROSPECT_COUNT_SQL),
+                "by_status": {r["prospect_status"]: r["c"] for r in self._all(db, STATUS_COUNTS_SQL)},
+                "by_niche": {r["niche"]: r["c"] for r in self._all(db, TOP_NICHES_SQL)},
+                "recent_searches": self._all(db, RECENT_SEARCHES_SQL),
+                "sent": one(SENT_COUNT_SQL),
+                "responded": one(RESPONDED_COUNT_SQL),
+                "pop_audits": one(AUDITED_COUNT_SQL),
+            }
+
+    def update_prospect(self, pid, **fields):
+        bad = set(fields) - UPDATABLE
+        if bad:
+            raise ValueError(f"Not updatable: {', '.join(sorted(bad))}")
+        sets = ", ".join(f"{c}=?" for c in fields)
+        self.write(lambda db: db.execute(self.sql(f"UPDATE prospects SET {sets} WHERE id=?"), (*fields.values(), pid)))
+
+    def save_search(self, found, query, niche, location, created_at):
+        """Insert search results (tuples ordered as FOUND_COLUMNS), skipping known websites.
+
+        Records the search and returns the stored prospect rows.
+        """
+        def save(db):
+            prospects = []
+            sql = self.sql(self.insert("prospects", FOUND_COLUMNS))
+            for values in found:
+                db.execute(sql, values)  # known websites are skipped by the conflict clause
+                row = self._one(db, PROSPECT_BY_WEBSITE_SQL, (values[1],))
+                if row:
+                    prospects.append(row)
+            db.execute(self.sql("INSERT INTO searches (query, niche, location, result_count, created_at) VALUES (?, ?, ?, ?, ?)"),
+                       (query, niche, location, len(prospects), created_at))
+            return prospects
+        return self.write(save)
+
+    def import_prospects(self, rows):
+        """Insert or replace prospect dicts by id. Returns (imported, skipped)."""
+        def save(db):
+            imported = skipped = 0
+            sql = self.sql(self.insert("prospects", IMPORT_COLUMNS, replace_on="id"))
+            for p in rows:
+                try:
+                    with self.savepoint(db):
+                        db.execute(sql, tuple(p.get(c, IMPORT_DEFAULTS.get(c)) for c in IMPORT_COLUMNS))
+                    imported += 1
+                except Exception:
+                    skipped += 1
+            # Imported rows may carry a different report under the same pop_audit_date
+            self.executemany(db, "DELETE FROM pop_report_views WHERE prospect_id = ?",
+                             [(p.get("id"),) for p in rows if p.get("id") is not None])
+            self.after_import(db, "prospects")
+            return imported, skipped
+        return self.write(save)
+
+    def import_searches(self, rows):
+        def save(db):
+            imported = 0
+            sql = self.sql(self.insert("searches", SEARCH_COLUMNS, replace_on="id"))
+            for s in rows:
+                try:
+                    with self.savepoint(db):
+                        db.execute(sql, tuple(s.get(c) for c in SEARCH_COLUMNS))
+                    imported += 1
+                except Exception:
+                    pass
+            self.after_import(db, "searches")
+            return imported
+        return self.write(save)
+
+    # -- POP reports -----------------------------------------------------
+    def save_pop_audit(self, pid, fields, view=None):
+        """Store an audit's prospect columns and, when given, its precomputed
+        report view (pop_audit_date, etag, view) in the same transaction."""
+        sets = ", ".join(f"{c}=?" for c in fields)
+
+        def save(db):
+            db.execute(self.sql(f"UPDATE prospects SET {sets} WHERE id=?"), (*fields.values(), pid))
+            if view:
+                self._put_report_view(db, pid, *view)
+        self.write(save)
+
+    def report_view(self, pid):
+        """Prospect columns the report modal needs, joined with its stored view (if any)."""
+        with self.read() as db:
+            return self._one(db, REPORT_VIEW_SQL, (pid,))
+
+    def report_blob(self, pid):
+        with self.read() as db:
+            row = self._one(db, "SELECT pop_report_data FROM prospects WHERE id = ?", (pid,))
+        return row["pop_report_data"] if row else None
+
+    def put_report_view(self, pid, pop_audit_date, etag, view):
+        self.write(self._put_report_view, pid, pop_audit_date, etag, view)
+
+    def _put_report_view(self, db, pid, pop_audit_date, etag, view):
+        db.execute(self.sql(self.insert("pop_report_views", ("prospect_id", "pop_audit_date", "etag", "view"),
+                                        replace_on="prospect_id")), (pid, pop_audit_date, etag, view))
+
+    # -- pitches ---------------------------------------------------------
+    def cached_pitches(self, hashes):
+        """{prompt_hash: {"subject", "body"}} for cached prompts."""
+        if not hashes:
+            return {}
+        with self.read() as db:
+            rows = self._all(db, f"SELECT prompt_hash, subject, body FROM pitch_cache WHERE prompt_hash IN "
+                                 f"({','.join('?' * len(hashes))})", tuple(hashes))
+        return {r["prompt_hash"]: r for r in rows}
+
+    def save_pitches(self, pitches, model, now, reused=()):
+        """Cache and assign generated pitches, (pid, prompt_hash, subject, body, tokens) each,
+        and assign `reused` cached ones, (pid, subject, body) each."""
+        def save(db):
+            self.executemany(db, self.insert("pitch_cache", ("prompt_hash", "model", "subject", "body", "tokens",
+                                                             "created_at"), replace_on="prompt_hash"),
+                             [(h, model, subject, body, tokens, now) for _, h, subject, body, tokens in pitches])
+            self.executemany(db, "UPDATE prospects SET pitch_subject=?, pitch_body=?, pitch_date=?, updated_at=? WHERE id=?",
+                             [(subject, body, now, now, pid) for pid, _, subject, body, _ in pitches] +
+                             [(subject, body, now, now, pid) for pid, subject, body in reused])
+        if pitches or reused:
+            self.write(save)
+
+
+class SQLiteStorage(Storage):
+    """Prospects via app-supplied read()/write() (pooled, single writer); tracking via connect_tracking().
+    The funnel refresh reads prospects_path ATTACHed to a tracking connection."""
+    name = "sqlite"
+    PROSPECTS = "p.prospects"
+
+    def __init__(self, read, write, connect_tracking, prospects_path=None):
+        self._read = read
+        self._write = write
+        self._connect_tracking = connect_tracking
+        self.prospects_path = prospects_path
+
+    def read(self):
+        return self._read()
+
+    def write(self, fn, *args):
+        return self._write(fn, *args)
+
+    @contextmanager
+    def tracking_read(self):
+        db = self._connect_tracking()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def tracking_write(self, fn, *args):
+        db = self._connect_tracking()
+        try:
+            result = fn(db, *args)
+            db.commit()
+            return result
+        finally:
+            db.close()
+
+    def check_writable(self):
+        """Take each database's write lock once, through the same paths writes use; raises if it can't."""
+        self.write(lambda db: None)  # the writer thread runs every job inside BEGIN IMMEDIATE
+        self.tracking_write(lambda db: db.execute("BEGIN IMMEDIATE"))
+
+    def table_estimates(self):
+        """Approximate row counts per table without counting: ANALYZE's sqlite_stat1 where
+        it has run, else MAX(rowid) (an index seek; deleted rows still count). Plus file sizes."""
+        out = {}
+        for name, connect in (("prospects", self.read), ("tracking", self.tracking_read)):
+            with connect() as db:
+                tables = [r[0] for r in db.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+                try:
+                    stats = {}
+                    for tbl, stat in db.execute("SELECT tbl, stat FROM sqlite_stat1"):
+                        stats[tbl] = max(stats.get(tbl, 0), int(stat.split()[0]))
+                except Exception:
+                    stats = {}  # never analyzed
+                estimates = {}
+                for table in tables:
+                    if table in stats:
+                        estimates[table] = {"rows": stats[table], "source": "sqlite_stat1"}
+                        continue
+                    try:
+                        rows = db.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+                        estimates[table] = {"rows": rows, "source": "max_rowid"}
+                    except Exception:
+                        estimates[table] = {"rows": None, "source": None}  # WITHOUT ROWID, not analyzed
+                pages = db.execute("PRAGMA page_count").fetchone()[0]
+                out[name] = {"size_bytes": pages * db.execute("PRAGMA page_size").fetchone()[0],
+                             "free_pages": db.execute("PRAGMA freelist_count").fetchone()[0], "tables": estimates}
+        return out
+
+    def funnel_write(self, fn):
+        def attached(db):
+            db.execute("ATTACH DATABASE ? AS p", (self.prospects_path,))  # outside any transaction
+            db.execute("BEGIN IMMEDIATE")  # watermarks are read, then advanced: one refresh at a time
+            return fn(db)
+        return self.tracking_write(attached)
+
+
+POSTGRES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prospects (
+    id BIGSERIAL PRIMARY KEY,
+    business_name TEXT,
+    website TEXT UNIQUE,
+    phone TEXT,
+    address TEXT,
+    city TEXT,
+    state TEXT,
+    niche TEXT,
+    rating DOUBLE PRECISION,
+    reviews INTEGER,
+    seo_score INTEGER DEFAULT 0,
+    prospect_score INTEGER DEFAULT 0,
+    prospect_status TEXT DEFAULT 'new',
+    issues TEXT,
+    has_ssl INTEGER DEFAULT 0,
+    pitch_subject TEXT,
+    pitch_body TEXT,
+    pitch_date TEXT,
+    sent_date TEXT,
+    contact_method TEXT,
+    response_date TEXT,
+    pop_report_data TEXT,
+    pop_audit_date TEXT,
+    pop_score INTEGER,
+    pop_word_count_current INTEGER DEFAULT 0,
+    pop_word_count_target INTEGER DEFAULT 0,
+    pop_page_score DOUBLE PRECISION,
+    pop_missing_terms INTEGER,
+    pop_score_version INTEGER,
+    search_query TEXT,
+    created_at TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS'),
+    updated_at TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+);
+CREATE TABLE IF NOT EXISTS searches (
+    id BIGSERIAL PRIMARY KEY,
+    query TEXT,
+    niche TEXT,
+    location TEXT,
+    result_count INTEGER,
+    created_at TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+);
+CREATE TABLE IF NOT EXISTS pop_report_views (
+    prospect_id BIGINT PRIMARY KEY,
+    pop_audit_date TEXT,
+    etag TEXT,
+    view TEXT
+);
+CREATE TABLE IF NOT EXISTS pitch_cache (
+    prompt_hash TEXT PRIMARY KEY,
+    model TEXT,
+    subject TEXT,
+    body TEXT,
+    tokens INTEGER DEFAULT 0,
+    created_at TEXT DEFAULT to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')
+);
+CREATE TABLE IF NOT EXISTS emails (
+    id TEXT PRIMARY KEY,
+    subject TEXT,
+    recipient TEXT,
+    recipient_name TEXT,
+    client TEXT,
+    sent_at TEXT,
+    resend_id TEXT,
+    campaign_id TEXT,
+    status TEXT,
+    prospect_id BIGINT
+);
+CREATE TABLE IF NOT EXISTS campaigns (
+    id TEXT PRIMARY KEY,
+    subject TEXT,
+    from_addr TEXT,
+    client TEXT,
+    created_at TEXT,
+    total INTEGER
+);
+CREATE TABLE IF NOT EXISTS links (
+    email_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (email_id, idx)
+);
+CREATE TABLE IF NOT EXISTS suppressions (
+    address TEXT PRIMARY KEY,
+    reason TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    response TEXT,
+    created_at DOUBLE PRECISION NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    steps TEXT NOT NULL,
+    from_addr TEXT,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS enrollments (
+    id BIGSERIAL PRIMARY KEY,
+    sequence_id TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    prospect_id BIGINT,
+    vars TEXT,
+    step INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'active',
+    due_at DOUBLE PRECISION,
+    last_email_id TEXT,
+    last_sent_at TEXT,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at DOUBLE PRECISION NOT NULL
+);
+CREATE TABLE IF NOT EXISTS funnel_prospects (
+    prospect_id BIGINT PRIMARY KEY,
+    niche TEXT NOT NULL,
+    city TEXT NOT NULL,
+    analyzed INTEGER NOT NULL,
+    audited INTEGER NOT NULL,
+    pitched INTEGER NOT NULL,
+    opened INTEGER NOT NULL,
+    clicked INTEGER NOT NULL,
+    responded INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS funnel_counts (
+    niche TEXT NOT NULL,
+    city TEXT NOT NULL,
+    searched INTEGER NOT NULL DEFAULT 0,
+    analyzed INTEGER NOT NULL DEFAULT 0,
+    audited INTEGER NOT NULL DEFAULT 0,
+    pitched INTEGER NOT NULL DEFAULT 0,
+    opened INTEGER NOT NULL DEFAULT 0,
+    clicked INTEGER NOT NULL DEFAULT 0,
+    responded INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (niche, city)
+);
+CREATE TABLE IF NOT EXISTS funnel_dirty (
+    prospect_id BIGINT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS funnel_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    id BIGSERIAL PRIMARY KEY,
+    email_id TEXT,
+    event_type TEXT,
+    url TEXT,
+    ip TEXT,
+    user_agent TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_prospects_status ON prospects(prospect_status, pop_audit_date, prospect_score);
+CREATE INDEX IF NOT EXISTS idx_prospects_pop_audit_date ON prospects(pop_audit_date);
+CREATE INDEX IF NOT EXISTS idx_prospects_sent_date ON prospects(sent_date);
+CREATE INDEX IF NOT EXISTS idx_prospects_response_date ON prospects(response_date);
+CREATE INDEX IF NOT EXISTS idx_prospects_niche ON prospects(niche);
+CREATE INDEX IF NOT EXISTS idx_searches_created_at ON searches(created_at);
+CREATE INDEX IF NOT EXISTS idx_events_email_type ON events(email_id, event_type, timestamp, ip);
+CREATE INDEX IF NOT EXISTS idx_events_type_email ON events(event_type, email_id);
+CREATE INDEX IF NOT EXISTS idx_emails_sent_at ON emails(sent_at);
+CREATE INDEX IF NOT EXISTS idx_emails_campaign ON emails(campaign_id, status);
+CREATE INDEX IF NOT EXISTS idx_emails_resend_id ON emails(resend_id);
+CREATE INDEX IF NOT EXISTS idx_idempotency_created_at ON idempotency(created_at);
+CREATE INDEX IF NOT EXISTS idx_enrollments_due ON enrollments(status, due_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_enrollments_recipient ON enrollments(sequence_id, recipient);
+CREATE INDEX IF NOT EXISTS idx_emails_prospect ON emails(prospect_id);
+CREATE INDEX IF NOT EXISTS idx_prospects_updated_at ON prospects(updated_at);
+"""
+
+
+class PostgresStorage(Storage):
+    """All tables in one PostgreSQL database behind a psycopg_pool.ConnectionPool."""
+    name = "postgres"
+    NULLS_LAST = " NULLS LAST"
+
+    def __init__(self, dsn, min_size=1, max_size=10, **connect_kwargs):
+        import psycopg
+        from psycopg.rows import dict_row
+        from psycopg_pool import ConnectionPool
+
+        # Opened on first use in each process: a pool opened in the gunicorn master
+        # (preload_app) would hand its sockets to every worker and lose its threads.
+        self.pool = ConnectionPool(dsn, min_size=min_size, max_size=max_size,
+                                   kwargs={"row_factory": dict_row, **connect_kwargs}, open=False)
+        self._opened_in = None
+        self._open_lock = threading.Lock()
+        with psycopg.connect(dsn, autocommit=True, **connect_kwargs) as db:
+            db.execute(POSTGRES_SCHEMA)
+
+    def close(self):
+        self.pool.close()
+
+    def _connection(self):
+        if self._opened_in != os.getpid():
+            with self._open_lock:
+                if self._opened_in != os.getpid():
+                    self.pool.open()
+                    self._opened_in = os.getpid()
+        return self.pool.connection()
+
+    @contextmanager
+    def read(self):
+        with self._connection() as db:
+            yield db
+
+    def write(self, fn, *args):
+        # The pool commits when the block exits cleanly and rolls back otherwise
+        with self._connection() as db:
+            return fn(db, *args)
+
+    tracking_read = read
+    tracking_write = write
+
+    def check_writable(self):
+        def primary(db):
+            if self._one(db, "SELECT pg_is_in_recovery() AS standby")["standby"]:
+                raise RuntimeError("connected to a read-only standby")
+        self.write(primary)
+
+    def table_estimates(self):
+        """Row estimates from the planner's statistics (pg_class.reltuples; None until first analyzed)."""
+        with self.read() as db:
+            rows = self._all(db, """SELECT c.relname AS name, c.reltuples::BIGINT AS rows,
+                pg_total_relation_size(c.oid) AS size_bytes FROM pg_class c
+                WHERE c.relkind = 'r' AND c.relnamespace = current_schema()::regnamespace ORDER BY c.relname""")
+        return {"postgres": {"size_bytes": sum(r["size_bytes"] for r in rows), "tables": {
+            r["name"]: {"rows": r["rows"] if r["rows"] >= 0 else None, "source": "reltuples",
+                        "size_bytes": r["size_bytes"]} for r in rows}}}
+
+    def funnel_write(self, fn):
+        def locked(db):
+            db.execute("LOCK TABLE funnel_state IN EXCLUSIVE MODE")  # readers still see the last refresh
+            return fn(db)
+        return self.write(locked)
+
+    def sql(self, sql):
+        return sql.replace("%", "%%").replace("?", "%s")
+
+    def insert(self, table, columns, replace_on=None):
+        marks = ", ".join("?" * len(columns))
+        if replace_on:
+            updates = ", ".join(f"{c}=EXCLUDED.{c}" for c in columns if c != replace_on)
+            conflict = f"ON CONFLICT ({replace_on}) DO UPDATE SET {updates}"
+        else:
+            conflict = "ON CONFLICT DO NOTHING"
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({marks}) {conflict}"
+
+    def executemany(self, db, sql, rows):
+        with db.cursor() as cur:
+            cur.executemany(self.sql(sql), rows)
+            return cur.rowcount  # summed over the rows since psycopg 3.1
+
+    @contextmanager
+    def savepoint(self, db):
+        with db.transaction():
+            yield
+
+    def after_import(self, db, table):
+        # Explicit ids bypass the sequence; move it past them
+        db.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                   f"GREATEST((SELECT MAX(id) FROM {table}), 1))")
+
+    def record_events(self, rows):
+        if not rows:
+            return
+
+        def copy(db):
+            with db.cursor() as cur:
+                with cur.copy(f"COPY events ({', '.join(EVENT_COLUMNS)}) FROM STDIN") as out:
+                    for row in rows:
+                        out.write_row(row)
+        self.write(copy)
@@ -0,0 +1,197 @@
+"""Local stand-ins for the upstream APIs, for offline runs of the app.
+
+Point the app at a stub with the matching *_BASE env var, e.g.
+
+    python stub_servers.py openrouter --port 8701
+    OPENROUTER_BASE=http://127.0.0.1:8701/api/v1 gunicorn app:app
+
+Bases per stub: RESEND_BASE=http://host:port, DATAFORSEO_BASE=http://host:port/v3,
+POP_BASE=http://host:port/api, OPENROUTER_BASE=http://host:port/api/v1.
+"""
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pop_simulator
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0  # seconds added to every response
+    routes = {}  # (method, path prefix) -> fn(handler, path, body) -> (status, payload)
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split("?", 1)[0]
+        for (m, prefix), fn in self.routes.items():
+            if m == method and path.startswith(prefix):
+                status, payload = fn(self, path, body)
+                if payload is not None:
+                    self.send_json(status, payload)
+                return
+        self.send_json(404, {"error": f"no stub for {method} {path}"})
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+# ============================================================
+# RESEND
+# ============================================================
+
+def resend_emails(handler, path, body):
+    if not body.get("to") or not body.get("subject"):
+        return 422, {"name": "validation_error", "message": "to and subject are required"}
+    return 200, {"id": str(uuid.uuid4())}
+
+
+def resend_batch(handler, path, body):
+    if not isinstance(body, list) or not 1 <= len(body) <= 100:
+        return 422, {"name": "validation_error", "message": "send 1 to 100 emails"}
+    if any(not e.get("to") or not e.get("subject") for e in body):
+        return 422, {"name": "validation_error", "message": "to and subject are required"}
+    return 200, {"data": [{"id": str(uuid.uuid4())} for _ in body]}
+
+
+# ============================================================
+# DATAFORSEO
+# ============================================================
+
+def fake_maps_items(keyword, depth):
+    """`depth` maps_search results with websites unique to the keyword."""
+    slug = hashlib.sha1(keyword.encode("utf-8")).hexdigest()[:8]
+    return [{"type": "maps_search", "rank_absolute": i + 1, "title": f"{keyword.title()} Co {i + 1}",
+             "url": f"https://{slug}-{i + 1}.example/", "phone": f"+1555{i:07d}",
+             "address": f"{100 + i} Main St", "rating": {"value": round(3 + (i % 20) / 10, 1), "votes_count": i * 7}}
+            for i in range(depth)]
+
+
+def dataforseo_maps(handler, path, body):
+    task = (body or [{}])[0]
+    items = fake_maps_items(task.get("keyword", ""), min(int(task.get("depth", 20)), 100))
+    return 200, {"status_code": 20000, "status_message": "Ok.",
+                 "tasks": [{"status_code": 20000, "result": [{"keyword": task.get("keyword"), "items": items}]}]}
+
+
+def dataforseo_other(handler, path, body):
+    return 200, {"status_code": 20000, "status_message": "Ok.", "tasks": [{"status_code": 20000, "result": [{}]}]}
+
+
+# ============================================================
+# OPENROUTER
+# ============================================================
+
+def fake_pitch(prompt):
+    """Deterministic subject/body derived from the prompt."""
+    business = "there"
+    for line in prompt.splitlines():
+        if line.startswith("Business:"):
+            business = line.split(":", 1)[1].strip()
+            break
+    tag = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:6]
+    return (f"Subject: A few quick wins for {business}\n\n"
+            f"Hi {business} team,\n\nWe took a look at your website and found a handful of "
+            f"fixes that could bring in more local customers. Happy to walk you through them.\n\n"
+            f"Best,\nThe SEO Design Lab team\n(ref {tag})")
+
+
+def stream_completion(handler, content, usage, token_delay=0.01):
+    """Write content as OpenAI-style SSE chunks, a few words at a time."""
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Connection", "close")
+    handler.end_headers()
+    handler.close_connection = True
+    handler.wfile.write(b": OPENROUTER PROCESSING\n\n")
+    words = content.split(" ")
+    for i in range(0, len(words), 3):
+        piece = " ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "")
+        chunk = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+        handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        handler.wfile.flush()
+        time.sleep(token_delay)
+    final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+    handler.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+    handler.wfile.flush()
+
+
+def openrouter_completions(handler, path, body):
+    prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+    content = fake_pitch(prompt)
+    usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    if body.get("stream"):
+        stream_completion(handler, content, usage)
+        return 200, None
+    return 200, {
+        "id": "gen-stub",
+        "model": body.get("model", ""),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage,
+    }
+
+
+STUBS = {
+    "resend": {("POST", "/emails/batch"): resend_batch, ("POST", "/emails"): resend_emails},
+    "dataforseo": {("POST", "/v3/serp/google/maps/live/advanced"): dataforseo_maps,
+                   ("POST", "/v3/"): dataforseo_other},
+    "pop": pop_simulator.Simulator("instant").routes(),  # pop_simulator.py for latency, failures and replay
+    "openrouter": {("POST", "/api/v1/chat/completions"): openrouter_completions},
+}
+
+
+def make_server(name, host="127.0.0.1", port=0, latency=0.0, routes=None):
+    """Build (but don't start) a stub server. Port 0 picks a free port; `routes` replaces STUBS[name]."""
+    handler = type(f"{name.title()}Handler", (StubHandler,), {"routes": routes or STUBS[name], "latency": latency})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_thread(name, **kwargs):
+    server = make_server(name, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("stub", choices=sorted(STUBS))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8701)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay per response")
+    args = parser.parse_args(argv)
+    server = make_server(args.stub, args.host, args.port, args.latency)
+    print(f"{args.stub} stub listening on http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+import migrations
+import storage
+
+
+def sqlite_store(directory):
+    """A SQLiteStorage over freshly migrated prospects.db and tracking.db in `directory`."""
+    def connect(name):
+        db = sqlite3.connect(os.path.join(directory, f"{name}.db"), isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    for name, steps in (("prospects", migrations.PROSPECTS), ("tracking", migrations.TRACKING)):
+        db = connect(name)
+        migrations.migrate(db, steps)
+        db.close()
+
+    @contextmanager
+    def read():
+        db = connect("prospects")
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def write(fn, *args):
+        db = connect("prospects")
+        try:
+            db.execute("BEGIN")
+            result = fn(db, *args)
+            db.execute("COMMIT")
+            return result
+        finally:
+            db.close()
+
+    return storage.SQLiteStorage(read, write, lambda: connect("tracking"), os.path.join(directory, "prospects.db"))
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def store(request, tmp_path):
+    """Each backend, empty. Postgres runs in a scratch storage_check schema of STORAGE_CHECK_DSN, if set."""
+    if request.param == "sqlite":
+        yield sqlite_store(tmp_path)
+        return
+    dsn = os.environ.get("STORAGE_CHECK_DSN")
+    if not dsn:
+        pytest.skip("set STORAGE_CHECK_DSN=postgresql://... to run against Postgres")
+    import psycopg
+
+    with psycopg.connect(dsn, autocommit=True) as db:
+        db.execute("DROP SCHEMA IF EXISTS storage_check CASCADE")
+        db.execute("CREATE SCHEMA storage_check")
+    pg = storage.PostgresStorage(dsn, options="-c search_path=storage_check")
+    try:
+        yield pg
+    finally:
+        pg.close()
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """app.py imported once, against scratch databases, with the follow-up scheduler off."""
+    directory = tmp_path_factory.mktemp("app")
+    os.environ.update(DB_PATH=str(directory / "tracking.db"), PROSPECTS_DB_PATH=str(directory / "prospects.db"),
+                      API_KEY="test-key", PROSPECTOR_KEY="test-prospector-key", SEQUENCES_ENABLED="0")
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,24 @@
+"""/metrics and /health/deep want credentials; the liveness probe doesn't."""
+import pytest
+
+ROUTES = ["/metrics", "/health/deep"]
+
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_requires_api_key_without_metrics_token(client, app_module, monkeypatch, route):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", "")
+    assert client.get(route).status_code == 401
+    assert client.get(route, headers={"X-API-Key": "wrong"}).status_code == 401
+    assert client.get(route, headers={"Authorization": "Bearer "}).status_code == 401
+    assert client.get(route, headers={"X-API-Key": "test-key"}).status_code == 200
+
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_accepts_metrics_token(client, app_module, monkeypatch, route):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", "scrape-token")
+    assert client.get(route, headers={"Authorization": "Bearer scrape-token"}).status_code == 200
+    assert client.get(route, headers={"Authorization": "Bearer other"}).status_code == 401
+
+
+def test_liveness_is_open(client):
+    assert client.get("/health/live").status_code == 200
@@ -0,0 +1,85 @@
+"""Migrations apply once, and the hot queries in storage.py use the indexes they create."""
+import sqlite3
+
+import pytest
+
+import migrations
+import storage
+
+# (db, label, sql, params, why a whole-table or whole-index read is fine) for the
+# queries on request and scheduler paths, taken from storage.py so the plans are
+# for the text that runs. "funnel" queries read both databases: the tracking
+# connection with prospects.db attached as p, as in SQLiteStorage.funnel_write().
+# The unfiltered /api/list returns every row, so a scan there is expected and it is not listed.
+HOT_QUERIES = [
+    ("prospects", "list by status", storage.PROSPECTS_BY_STATUS_SQL.format(nulls_last=""), ("hot",), None),
+    ("prospects", "prospect by id", storage.PROSPECT_SQL, (1,), None),
+    ("prospects", "prospect by website", storage.PROSPECT_BY_WEBSITE_SQL, ("x",), None),
+    ("prospects", "prospect count", storage.PROSPECT_COUNT_SQL, (), "counts every row"),
+    ("prospects", "status breakdown", storage.STATUS_COUNTS_SQL, (), "counts every row, from the covering index"),
+    ("prospects", "top niches", storage.TOP_NICHES_SQL, (), None),
+    ("prospects", "sent count", storage.SENT_COUNT_SQL, (), None),
+    ("prospects", "responded count", storage.RESPONDED_COUNT_SQL, (), None),
+    ("prospects", "audited count", storage.AUDITED_COUNT_SQL, (), None),
+    ("prospects", "recent searches", storage.RECENT_SEARCHES_SQL, (), "walks the created_at index, stops after 5 rows"),
+    ("prospects", "report view", storage.REPORT_VIEW_SQL, (1,), None),
+    ("tracking", "analytics", storage.ANALYTICS_SQL, (), "/t/analytics lists every email, newest first"),
+    ("tracking", "email count", storage.EMAIL_COUNT_SQL, (), "counts every row"),
+    ("tracking", "total opened", storage.OPENED_COUNT_SQL, (), None),
+    ("tracking", "total clicks", storage.CLICK_COUNT_SQL, (), None),
+    ("tracking", "email events", storage.EMAIL_EVENTS_SQL, ("x",), None),
+    ("tracking", "email links", storage.EMAIL_LINKS_SQL, ("x",), None),
+    ("tracking", "webhook event", storage.RESEND_EVENTS_SQL, ("x", None, "", "", "", "x"), None),
+    ("tracking", "suppressed recipients", storage.SUPPRESSED_SQL, (), "loads the whole list, every SUPPRESSION_REFRESH"),
+    ("tracking", "idempotency claim", storage.IDEMPOTENCY_SQL, ("x",), None),
+    ("tracking", "idempotency purge", storage.IDEMPOTENCY_PURGE_SQL, (0,), None),
+    ("tracking", "due enrollments", storage.DUE_ENROLLMENTS_SQL, (0, 500), None),
+    ("tracking", "next due enrollment", storage.NEXT_DUE_SQL, (), None),
+    ("tracking", "email engagement", storage.ENGAGEMENT_SQL.format(marks="?, ?"), ("x", "y"), None),
+    ("tracking", "campaign progress", storage.CAMPAIGN_COUNTS_SQL, ("x",), None),
+    ("funnel", "funnel candidates", storage.FUNNEL_CANDIDATES_SQL.format(prospects="p.prospects"), ("2026-01-01", 0),
+     "funnel_dirty is emptied by every refresh"),
+    ("funnel", "funnel stages", storage.FUNNEL_STAGES_SQL.format(prospects="p.prospects", ids="?, ?"), (1, 2), None),
+]
+
+
+@pytest.fixture
+def connections(tmp_path):
+    prospects = sqlite3.connect(tmp_path / "prospects.db")
+    tracking = sqlite3.connect(tmp_path / "tracking.db")
+    migrations.migrate(prospects, migrations.PROSPECTS)
+    migrations.migrate(tracking, migrations.TRACKING)
+    tracking.execute("ATTACH DATABASE ? AS p", (str(tmp_path / "prospects.db"),))
+    yield {"prospects": prospects, "tracking": tracking, "funnel": tracking}
+    prospects.close()
+    tracking.close()
+
+
+def test_migrations_apply_once(tmp_path):
+    for name, steps in (("prospects", migrations.PROSPECTS), ("tracking", migrations.TRACKING)):
+        db = sqlite3.connect(tmp_path / f"{name}.db")
+        assert migrations.migrate(db, steps) == [number for number, _, _ in steps]
+        assert migrations.migrate(db, steps) == []
+        assert migrations.current_version(db) == steps[-1][0]
+        db.close()
+
+
+def test_suppressions_seeded_from_recorded_bounces(tmp_path):
+    db = sqlite3.connect(tmp_path / "tracking.db")
+    migrations.migrate(db, [m for m in migrations.TRACKING if m[0] < 9])
+    db.execute("INSERT INTO emails (id, recipient) VALUES ('e1', 'Ann <ANN@x.example>, bob@y.example')")
+    db.execute("INSERT INTO events (email_id, event_type, timestamp) VALUES ('e1', 'hard_bounced', '2026-01-01')")
+    assert migrations.migrate(db, migrations.TRACKING) == [9]
+    assert sorted(db.execute("SELECT address, reason FROM suppressions")) == [("ann@x.example", "hard_bounced"),
+                                                                              ("bob@y.example", "hard_bounced")]
+    db.close()
+
+
+@pytest.mark.parametrize("db_name, sql, params, scan_ok", [(q[0], *q[2:]) for q in HOT_QUERIES],
+                         ids=[q[1] for q in HOT_QUERIES])
+def test_hot_query_uses_an_index(connections, db_name, sql, params, scan_ok):
+    plan = [row[3] for row in connections[db_name].execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    # `SCAN t` reads a whole table and `SCAN t USING INDEX i` walks a whole index; unless a LIMIT
+    # stops it, either one visits every row.
+    scans = [line for line in plan if line.startswith("SCAN ")]
+    assert scan_ok or not scans, plan
@@ -0,0 +1,49 @@
+"""Circuit breaker around outbound calls: the half-open probe always settles it."""
+import json
+
+import pytest
+import requests
+
+import outbound
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    cfg = dict(outbound.UPSTREAMS["resend"], breaker_failures=2, breaker_reset=0, retries=0)
+    client = outbound.Upstream("test", cfg)
+    outcomes = []
+
+    def request(method, url, **kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        resp = requests.Response()
+        resp.status_code = outcome
+        return resp
+    monkeypatch.setattr(client.session, "request", request)
+    return client, outcomes
+
+
+def test_opens_after_consecutive_failures(upstream):
+    client, outcomes = upstream
+    client.breaker.reset_after = 60
+    outcomes += [503, requests.ConnectionError("refused")]
+    assert client.request("POST", "https://x.example/").status_code == 503
+    with pytest.raises(requests.ConnectionError):
+        client.request("POST", "https://x.example/")
+    with pytest.raises(outbound.CircuitOpenError):
+        client.request("POST", "https://x.example/")
+
+
+@pytest.mark.parametrize("error", [json.JSONDecodeError("bad", "", 0), ValueError("ssl"), KeyboardInterrupt()])
+def test_probe_raising_anything_reopens(upstream, error):
+    client, outcomes = upstream
+    outcomes += [503, 503, error, 200]
+    for _ in range(2):
+        client.request("POST", "https://x.example/")
+    assert client.breaker.state == "open"
+    with pytest.raises(type(error)):
+        client.request("POST", "https://x.example/")  # the probe
+    assert client.breaker.state == "open"
+    assert client.request("POST", "https://x.example/").status_code == 200  # next probe gets through
+    assert client.breaker.state == "closed"
@@ -0,0 +1,92 @@
+"""/api/pitch_batch: input validation, pitch_cache hits, refresh, deferral at the deadline, and TokenBudget.
+OpenRouter is stubbed out (app.call_openrouter)."""
+import threading
+import time
+import uuid
+
+import pytest
+
+HEADERS = {"X-API-Key": "test-prospector-key"}
+
+
+@pytest.fixture
+def openrouter(app_module, monkeypatch):
+    """Stand-in for call_openrouter; records the prompts it was called with. Set `gate` to hold calls."""
+    class Stub:
+        prompts = []
+        gate = None
+
+        def __call__(self, prompt, timeout=30):
+            self.prompts.append(prompt)
+            if self.gate is not None:
+                self.gate.wait(5)
+            return f"Subject: Pitch {len(self.prompts)}\nBody for the prospect", 120
+
+    stub = Stub()
+    monkeypatch.setattr(app_module, "call_openrouter", stub)
+    return stub
+
+
+def new_prospect(app_module):
+    website = f"{uuid.uuid4().hex[:12]}.example"
+    found = [("Biz", website, "", "", "Austin", "TX", "plumbing", 4.5, 10, "plumber austin", "2026-01-01", "2026-01-01")]
+    return app_module.store.save_search(found, "plumber austin", "plumbing", "Austin, TX", "2026-01-01")[0]["id"]
+
+
+def pitch_batch(client, **data):
+    return client.post("/api/pitch_batch", json=data, headers=HEADERS)
+
+
+@pytest.mark.parametrize("data", [{"prospect_ids": ["abc"]}, {"prospect_ids": [None]}, {"prospect_ids": "1,2"},
+                                  {"prospect_ids": [1.5]}, {"prospect_ids": [True]}])
+def test_rejects_non_integer_ids(client, data):
+    resp = pitch_batch(client, **data)
+    assert resp.status_code == 400 and resp.get_json()["error"] == "prospect_ids must be a list of integers"
+
+
+@pytest.mark.parametrize("concurrency", ["many", None, 2.5])
+def test_rejects_non_integer_concurrency(client, concurrency):
+    resp = pitch_batch(client, prospect_ids=[1], concurrency=concurrency)
+    assert resp.status_code == 400 and resp.get_json()["error"] == "concurrency must be an integer"
+
+
+def test_unchanged_prompt_is_served_from_cache(client, app_module, openrouter):
+    pid = new_prospect(app_module)
+    first = pitch_batch(client, prospect_ids=[pid]).get_json()
+    assert first["generated"] == 1 and first["results"][0]["cached"] is False
+    second = pitch_batch(client, prospect_ids=[str(pid)]).get_json()
+    assert second["cached"] == 1 and second["generated"] == 0 and len(openrouter.prompts) == 1
+    assert second["results"][0]["subject"] == first["results"][0]["subject"]
+
+
+def test_refresh_regenerates(client, app_module, openrouter):
+    pid = new_prospect(app_module)
+    pitch_batch(client, prospect_ids=[pid])
+    again = pitch_batch(client, prospect_ids=[pid], refresh=True).get_json()
+    assert again["generated"] == 1 and again["cached"] == 0 and len(openrouter.prompts) == 2
+    assert app_module.store.get_prospect(pid)["pitch_subject"] == "Pitch 2"
+
+
+def test_unfinished_pitch_is_deferred_then_cached(client, app_module, openrouter, monkeypatch):
+    monkeypatch.setattr(app_module, "PITCH_BATCH_DEADLINE", 0.05)
+    openrouter.gate = threading.Event()
+    pid = new_prospect(app_module)
+    result = pitch_batch(client, prospect_ids=[pid]).get_json()
+    assert result["deferred"] == 1 and result["results"][0]["deferred"] is True
+    openrouter.gate.set()  # the call completes after the response; its pitch is still saved
+    deadline = time.monotonic() + 5
+    while app_module.store.get_prospect(pid)["pitch_subject"] is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    resent = pitch_batch(client, prospect_ids=[pid]).get_json()
+    assert resent["cached"] == 1 and len(openrouter.prompts) == 1
+
+
+def test_token_budget_refunds_and_waits(app_module):
+    budget = app_module.TokenBudget(6000)  # 100 tokens/s
+    budget.acquire(6000)
+    budget.settle(6000, 5000)  # used less than reserved: the rest is refunded
+    assert 990 <= budget.tokens <= 1100
+    budget.acquire(1000)
+    started = time.monotonic()
+    budget.acquire(20)  # empty: waits for the refill
+    assert time.monotonic() - started >= 0.1
@@ -0,0 +1,10 @@
+"""/send rate limiting."""
+import time
+
+
+def test_rate_limit_message_names_the_configured_limit(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "RATE_LIMIT", 3)
+    monkeypatch.setattr(app_module, "send_times", app_module.deque([time.time()] * 3))
+    resp = client.post("/send", json={"to": "a@x.example", "subject": "Hi", "body": "Hello"},
+                       headers={"X-API-Key": "test-key"})
+    assert resp.status_code == 429 and resp.get_json()["error"] == "Rate limit exceeded (3/min)"
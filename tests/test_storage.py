@@ -0,0 +1,143 @@
+"""Every Storage operation, against each backend (see conftest.store)."""
+import pytest
+
+import storage
+
+NOW = "2026-01-01 00:00:00"
+
+
+def add_prospect(store):
+    found = [("Biz", "biz.example", "", "", "Austin", "TX", "plumbing", 4.5, 10, "plumber austin", NOW, NOW)]
+    return store.save_search(found, "plumber austin", "plumbing", "Austin, TX", NOW)[0]["id"]
+
+
+def test_emails_and_events(store):
+    store.register_email({"id": "e1", "subject": "Hi", "recipient": "a@b.c", "sent_at": NOW})
+    store.register_email({"id": "e1", "subject": "Hi again", "recipient": "a@b.c", "sent_at": NOW})
+    store.record_event("e1", "open", None, "1.1.1.1", "ua", NOW)
+    store.record_events([("e1", "open", None, "2.2.2.2", "ua", NOW), ("e1", "click", "https://x", "2.2.2.2", "ua", NOW)])
+    emails, totals = store.email_analytics()
+    assert totals == {"total_sent": 1, "total_opened": 1, "total_clicks": 1}
+    assert emails[0]["subject"] == "Hi again" and emails[0]["opens"] == 2 and emails[0]["unique_opens"] == 2
+    email, events = store.email_detail("e1")
+    assert email["id"] == "e1" and len(events) == 3
+
+
+def test_links_are_replaced_on_reregister(store):
+    store.register_email({"id": "e2", "sent_at": NOW}, links=["https://a.example/", "https://b.example/"])
+    store.register_email({"id": "e2", "sent_at": NOW}, links=["https://c.example/"])
+    assert store.email_links("e2") == ["https://c.example/"]
+    assert store.email_links("missing") == []
+
+
+def test_campaigns_and_resend_events(store):
+    store.create_campaign({"id": "c1", "subject": "News", "created_at": NOW, "total": 2},
+                          [{"id": f"c1-{i}", "recipient": f"u{i}@x.example", "campaign_id": "c1", "status": "queued"}
+                           for i in range(2)],
+                          {"c1-0": ["https://d.example/"]})
+    store.mark_emails([("sent", "r1", NOW, "c1-0")])
+    progress = store.campaign_progress("c1")
+    assert progress["total"] == 2 and progress["counts"] == {"queued": 1, "sent": 1}
+    assert store.email_links("c1-0") == ["https://d.example/"] and store.campaign_progress("c2") is None
+    store.record_resend_events([("r1", "hard_bounced", None, "", "", NOW), ("unknown", "delivered", None, "", "", NOW)])
+    assert len(store.email_detail("c1-0")[1]) == 1
+
+
+def test_suppressions(store):
+    # No emails row needed: the bounce may be for mail sent without a tracking id
+    store.suppress([("u0@x.example", "hard_bounced", NOW), ("u1@x.example", "complained", NOW)])
+    store.suppress([("u0@x.example", "complained", NOW)])
+    assert sorted(store.suppressed_recipients()) == ["u0@x.example", "u1@x.example"]
+
+
+def test_idempotency(store):
+    assert store.claim_request("k1", "f1", 1000.0, 60, 10) is None
+    assert store.claim_request("k1", "f1", 1001.0, 60, 10)["status"] == 0
+    store.finish_request("k1", 200, '{"ok": true}')
+    assert store.claim_request("k1", "f2", 1020.0, 60, 10) == {"fingerprint": "f1", "status": 200,
+                                                               "response": '{"ok": true}', "created_at": 1000.0}
+    assert store.claim_request("k1", "f1", 1061.0, 60, 10) is None  # expired
+    assert store.claim_request("k1", "f1", 1072.0, 60, 10) is None  # abandoned in flight
+    store.release_request("k1")
+    store.claim_request("k2", "f", 1000.0, 60, 10)
+    store.purge_requests(1050.0)
+    assert store.claim_request("k2", "f", 1001.0, 60, 10) is None
+
+
+def test_prospects(store):
+    found = [("Biz", "biz.example", "", "", "Austin", "TX", "plumbing", 4.5, 10, "plumber austin", NOW, NOW)]
+    prospects = store.save_search(found + found, "plumber austin", "plumbing", "Austin, TX", NOW)
+    assert len(prospects) == 2 and prospects[0]["id"] == prospects[1]["id"]
+    pid = prospects[0]["id"]
+    store.update_prospect(pid, prospect_status="hot", sent_date=NOW, updated_at=NOW)
+    assert store.get_prospect(pid)["prospect_status"] == "hot"
+    assert [p["id"] for p in store.list_prospects("hot")] == [pid]
+    summary = store.prospect_summary()
+    assert summary["total"] == 1 and summary["sent"] == 1 and summary["by_niche"] == {"plumbing": 1}
+    assert store.prospect_contacts([pid])[pid]["response_date"] is None
+    with pytest.raises(ValueError):
+        store.update_prospect(pid, id=1)
+
+
+def test_reports_and_pitches(store):
+    pid = add_prospect(store)
+    store.save_pop_audit(pid, {"pop_audit_date": NOW, "pop_score": 70, "pop_report_data": "{}"}, (NOW, "etag", "{}"))
+    view = store.report_view(pid)
+    assert view["view_date"] == NOW and view["etag"] == "etag" and view["has_report"]
+    assert store.report_blob(pid) == "{}"
+    store.save_pitches([(pid, "h1", "Subject", "Body", 12)], "model", NOW)
+    assert store.cached_pitches(["h1", "h2"])["h1"]["subject"] == "Subject"
+    assert store.get_prospect(pid)["pitch_body"] == "Body"
+
+
+def test_imports(store):
+    imported, skipped = store.import_prospects([{"id": 500, "website": "imported.example"},
+                                                {"id": 501, "website": "imported.example"}])
+    assert imported + skipped == 2 and store.count_prospects() >= 1
+    assert store.import_searches([{"id": 900, "query": "q"}]) == 1
+
+
+def test_sequences_and_leases(store):
+    pid = add_prospect(store)
+    store.create_sequence({"id": "s1", "name": "Bump", "steps": "[]", "created_at": NOW})
+    assert store.enroll([("s1", "a@b.c", pid, "{}", 100.0, NOW), ("s1", "a@b.c", pid, "{}", 100.0, NOW),
+                         ("s1", "d@e.f", None, "{}", 300.0, NOW)]) == 2
+    due, next_due = store.due_enrollments(200.0, 10)
+    assert [e["recipient"] for e in due] == ["a@b.c"] and next_due == 100.0
+    store.advance_enrollments([(1, "active", 400.0, "s1-1-0", NOW, due[0]["id"])],
+                              [{"id": "s1-1-0", "recipient": "a@b.c", "campaign_id": "s1", "status": "queued"}],
+                              {"s1-1-0": ["https://e.example/"]})
+    store.record_events([("s1-1-0", "open", None, "", "", NOW), ("s1-1-0", "click", "https://e.example/", "", "", NOW)])
+    assert store.engagement(["s1-1-0", "none"]) == {"s1-1-0": {"opens": 1, "clicks": 1, "bounced": 0}}
+    progress = store.sequence_progress("s1")
+    assert progress["counts"] == {"active": 2} and progress["next_due"] == 300.0
+    assert store.take_lease("seq", "w1", 1000.0, 60) and not store.take_lease("seq", "w2", 1030.0, 60)
+    assert store.take_lease("seq", "w1", 1050.0, 60) and store.take_lease("seq", "w2", 1111.0, 60)
+
+
+def test_funnel(store):
+    pid = add_prospect(store)
+    store.update_prospect(pid, sent_date=NOW, updated_at=NOW)
+    store.save_pop_audit(pid, {"pop_audit_date": NOW, "pop_score": 70, "pop_report_data": "{}"}, (NOW, "etag", "{}"))
+    store.register_email({"id": "f1", "recipient": "a@b.c", "prospect_id": pid, "sent_at": NOW})
+    assert store.refresh_funnel() == store.count_prospects()  # first run: full build
+    totals, groups, refreshed = store.funnel(by=("niche",))
+    assert totals["searched"] == 1 and totals["pitched"] == 1 and totals["opened"] == 0
+    assert groups[0]["niche"] == "plumbing" and refreshed
+    store.record_events([("f1", "open", None, "", "", NOW)])
+    store.update_prospect(pid, response_date=NOW, updated_at=storage._utcnow())
+    assert store.refresh_funnel() == 1
+    totals, groups, _ = store.funnel(by=("niche", "city"), niche="plumbing")
+    assert [(g["city"], g["audited"], g["opened"], g["responded"]) for g in groups] == [("Austin", 1, 1, 1)]
+    store.update_prospect(pid, response_date=None, updated_at=storage._utcnow())
+    store.refresh_funnel()
+    assert store.funnel(niche="plumbing")[0]["responded"] == 0
+    store.reset_funnel()
+    assert store.refresh_funnel() == store.count_prospects() and store.funnel()[0]["opened"] == 1
+
+
+def test_health(store):
+    add_prospect(store)
+    store.check_writable()
+    tables = {t: e for db in store.table_estimates().values() for t, e in db["tables"].items()}
+    assert tables["prospects"]["rows"] is None or tables["prospects"]["rows"] >= 1
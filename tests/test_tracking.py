@@ -0,0 +1,40 @@
+"""Unsigned /t/click links from emails sent before signed tracking tokens."""
+from urllib.parse import quote
+
+import pytest
+
+
+@pytest.fixture
+def legacy(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "LEGACY_TRACKING", True)
+    monkeypatch.setattr(app_module, "LEGACY_CLICK_HOSTS", ("seodesignlab.com",))
+    app_module.store.register_email({"id": "legacy-1", "sent_at": "2026-01-01 00:00:00"},
+                                    links=["https://stored.example/offer"])
+
+
+def click(client, email_id, url):
+    return client.get(f"/t/click?id={email_id}&url={quote(url, safe='')}")
+
+
+@pytest.mark.parametrize("url", ["https://stored.example/offer", "https://seodesignlab.com/audit",
+                                 "https://www.seodesignlab.com/audit?x=1"])
+def test_legacy_click_redirects(client, legacy, url):
+    resp = click(client, "legacy-1", url)
+    assert resp.status_code == 302 and resp.headers["Location"] == url
+
+
+def test_legacy_click_to_allowed_host_without_stored_links(client, legacy):
+    # Emails sent before links were stored have no rows in `links`
+    assert click(client, "sent-long-ago", "https://seodesignlab.com/").status_code == 302
+
+
+@pytest.mark.parametrize("url", ["https://evil.example/", "https://seodesignlab.com.evil.example/",
+                                 "https://evil.example\\@seodesignlab.com/", "javascript://seodesignlab.com/%0aalert(1)",
+                                 "https://stored.example/other"])
+def test_legacy_click_rejects_other_targets(client, legacy, url):
+    assert click(client, "legacy-1", url).status_code == 404
+
+
+def test_legacy_click_off_by_default(client, app_module):
+    assert not app_module.LEGACY_TRACKING
+    assert click(client, "legacy-1", "https://seodesignlab.com/").status_code == 404
@@ -0,0 +1,73 @@
+"""Resend webhooks: hard bounces and complaints suppress the address in every worker, and /send honors it."""
+import base64
+import json
+import time
+import uuid
+
+import pytest
+
+import webhooks
+
+SECRET = "whsec_" + base64.b64encode(b"test-webhook-secret").decode()
+
+
+@pytest.fixture
+def post_event(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "RESEND_WEBHOOK_SECRET", SECRET)
+
+    def post(event):
+        body = json.dumps(event).encode()
+        msg_id, timestamp = f"msg_{uuid.uuid4().hex}", str(int(time.time()))
+        return client.post("/webhooks/resend", data=body, content_type="application/json", headers={
+            "svix-id": msg_id, "svix-timestamp": timestamp,
+            "svix-signature": webhooks.sign(SECRET, msg_id, timestamp, body)})
+    return post
+
+
+def test_hard_bounce_for_untracked_email_is_stored(post_event, app_module):
+    # A /send without tracking_id leaves no emails row for this resend id
+    resp = post_event({"type": "email.bounced", "created_at": "2026-01-01T00:00:00Z", "data": {
+        "email_id": "re_untracked", "to": ["Gone <GONE@x.example>"], "bounce": {"type": "Permanent"}}})
+    assert resp.status_code == 200
+    assert "gone@x.example" in app_module.store.suppressed_recipients()
+    # Another worker, or this one after a restart, loads it from the table
+    other = webhooks.Suppressions(app_module.store.suppressed_recipients)
+    assert other.suppressed(["gone@x.example"]) == ["gone@x.example"]
+
+
+def test_transient_bounce_does_not_suppress(post_event, app_module):
+    resp = post_event({"type": "email.bounced", "data": {
+        "email_id": "re_soft", "to": ["soft@x.example"], "bounce": {"type": "Transient"}}})
+    assert resp.status_code == 200
+    assert "soft@x.example" not in app_module.store.suppressed_recipients()
+
+
+def send(client, **fields):
+    return client.post("/send", json={"subject": "Hi", "body": "Hello", **fields}, headers={"X-API-Key": "test-key"})
+
+
+@pytest.mark.parametrize("fields", [
+    {"to": "Someone <someone@x.example>, Blocked <BLOCKED@x.example>"},
+    {"to": ["someone@x.example", "Blocked <blocked@x.example>"]},
+    {"to": "someone@x.example", "cc": ["blocked@x.example"]},
+    {"to": ["someone@x.example"], "bcc": "other@x.example, blocked@x.example"},
+], ids=["to string", "to list", "cc list", "bcc string"])
+def test_send_refuses_suppressed_recipient(client, app_module, fields):
+    app_module.store.suppress([("blocked@x.example", "hard_bounced", "2026-01-01")])
+    app_module.suppressions.add(["blocked@x.example"])
+    resp = send(client, **fields)
+    assert resp.status_code == 422 and resp.get_json()["suppressed"] == ["blocked@x.example"]
+
+
+def test_send_answers_json_when_suppressions_cannot_load(client, app_module, monkeypatch):
+    def unavailable():
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(app_module, "suppressions", webhooks.Suppressions(unavailable))
+    resp = send(client, to=["someone@x.example"])
+    assert resp.status_code == 503 and "error" in resp.get_json()
+
+
+def test_addresses_ignores_non_strings():
+    assert webhooks.addresses(["A <a@x.example>", None, 3, "b@x.example, c@x.example"]) == [
+        "a@x.example", "b@x.example", "c@x.example"]
+    assert webhooks.addresses(None) == [] and webhooks.addresses({"to": "a@x.example"}) == []
@@ -0,0 +1,156 @@
+"""Signed tracking tokens and the per-email link cache.
+
+Tracked URLs carry a compact token instead of a raw email id and target:
+
+    /t/o/<email_id>.<sig>        open pixel
+    /t/c/<email_id>.<n>.<sig>    click on the email's link number n (hex)
+
+``sig`` is the first 12 base64url characters (72 bits) of an HMAC-SHA256
+over the email id (and link number), keyed with the tracker secret. Opens
+and clicks are signed under different prefixes, so one can't be passed off
+as the other. Checking a token needs no database, so forged and unsigned
+hits are dropped before any work is done. A click's target comes from the
+email's row in the ``links`` table (tracking.db), which each worker keeps
+in a LinkCache; the redirect never goes anywhere that wasn't registered
+for that email.
+
+rewrite_html() is what /send uses to put those URLs into an email: one
+regex pass over the markup (no DOM), swapping each http(s) ``<a href>``
+for its click URL and adding the open pixel before ``</body>``.
+"""
+import re
+import hmac
+import html
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+SIG_CHARS = 12
+
+
+class Signer:
+    def __init__(self, secret):
+        self._key = secret.encode("utf-8")
+
+    def _sig(self, message):
+        digest = hmac.new(self._key, message.encode("utf-8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest)[:SIG_CHARS].decode("ascii")
+
+    def open_token(self, email_id):
+        return f"{quote(email_id, safe='')}.{self._sig('o:' + email_id)}"
+
+    def click_token(self, email_id, n):
+        return f"{quote(email_id, safe='')}.{n:x}.{self._sig(f'c:{email_id}.{n}')}"
+
+    def verify_open(self, token):
+        """Email id of a valid open token, else None. `token` is already URL-decoded."""
+        email_id, _, sig = token.rpartition(".")
+        if email_id and hmac.compare_digest(sig, self._sig("o:" + email_id)):
+            return email_id
+        return None
+
+    def verify_click(self, token):
+        """(email id, link number) of a valid click token, else None."""
+        parts = token.rsplit(".", 2)
+        if len(parts) != 3 or not parts[0]:
+            return None
+        email_id, n, sig = parts
+        try:
+            n = int(n, 16)
+        except ValueError:
+            return None
+        if n < 0 or not hmac.compare_digest(sig, self._sig(f"c:{email_id}.{n}")):
+            return None
+        return email_id, n
+
+
+def path_token(path_info, prefix):
+    """Token from a WSGI PATH_INFO (latin-1 decoded per PEP 3333) back as text."""
+    token = path_info[len(prefix):]
+    try:
+        return token.encode("latin-1").decode("utf-8")
+    except UnicodeError:
+        return token
+
+
+class LinkCache:
+    """LRU of email id -> link targets. `load(email_id)` fills misses; empty results aren't cached."""
+
+    def __init__(self, load, size=10000):
+        self._load = load
+        self._links = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, email_id):
+        with self._lock:
+            links = self._links.get(email_id)
+            if links is not None:
+                self._links.move_to_end(email_id)
+                self.hits += 1
+                return links
+            self.misses += 1
+        links = self._load(email_id)
+        if links:
+            self.put(email_id, links)
+        return links
+
+    def put(self, email_id, links):
+        with self._lock:
+            self._links[email_id] = links
+            self._links.move_to_end(email_id)
+            while len(self._links) > self.size:
+                self._links.popitem(last=False)
+
+
+# Comments are matched (and passed through) so links inside them aren't rewritten;
+# quoted attribute values may contain ">".
+HTML_TOKEN = re.compile(r"""<!--.*?-->|<a\s(?:[^>"']+|"[^"]*"|'[^']*')*>""", re.IGNORECASE | re.DOTALL)
+HREF = re.compile(r"""(\shref\s*=\s*)(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+TRACKED_PIXEL = re.compile(r"/t/(?:o/|open\?)")  # the caller already added an open pixel
+TRACKED = ("/t/c/", "/t/click?")  # hrefs the caller already tracked
+PIXEL_TAG = '<img src="{}" width="1" height="1" alt="" style="display:none;border:0">'
+
+
+def rewrite_html(markup, click_url, pixel_url=None):
+    """Swap each http(s) link in `markup` for click_url(n) and add the open pixel.
+
+    click_url(n) and pixel_url must be attribute-safe text (signed tokens are). Returns (new markup,
+    targets) where targets[n] is the URL behind click_url(n); repeated URLs share one n.
+    Other schemes (mailto:, tel:, #anchors) are left alone.
+    """
+    targets, index = [], {}
+
+    def tag(m):
+        text = m.group(0)
+        if text[1] == "!":
+            return text
+        attr = HREF.search(text)
+        if not attr:
+            return text
+        url = attr.group(2) or attr.group(3) or attr.group(4) or ""
+        if "&" in url:
+            url = url.replace("&amp;", "&")
+            if "&" in url and ";" in url:
+                url = html.unescape(url)
+        url = url.strip()
+        if not url[:8].lower().startswith(("http://", "https://")) or TRACKED[0] in url or TRACKED[1] in url:
+            return text
+        n = index.get(url)
+        if n is None:
+            n = index[url] = len(targets)
+            targets.append(url)
+        return f'{text[:attr.start()]}{attr.group(1)}"{click_url(n)}"{text[attr.end():]}'
+
+    out = HTML_TOKEN.sub(tag, markup)
+    if pixel_url and not TRACKED_PIXEL.search(markup):
+        # </body> is near the end, so only the tail is searched
+        tail = max(0, len(out) - 4096)
+        end = out[tail:].lower().rfind("</body")
+        end = tail + end if end >= 0 else len(out)
+        out = f"{out[:end]}{PIXEL_TAG.format(pixel_url)}{out[end:]}"
+    return out, targets
@@ -0,0 +1,156 @@
+"""Resend webhook verification and parsing, and the send suppression list.
+
+Resend signs webhooks the Svix way. The ``svix-signature`` header carries
+one or more ``v1,<base64 HMAC-SHA256>`` entries over
+``"<svix-id>.<svix-timestamp>.<raw body>"``, keyed with the base64 part of
+the endpoint's ``whsec_...`` secret. verify() checks the signature and
+rejects timestamps outside the tolerance, which stops replays of old
+deliveries. Resend retries until it gets a 2xx, so the same ``svix-id``
+can arrive more than once; RecentIds drops repeats seen by this worker.
+
+event_row() turns an event into an events-table row keyed by Resend's
+email id. The write (storage.record_resend_events) maps that id to our
+email id through the index on emails.resend_id. Event types:
+
+    delivered, opened, clicked (url = link), delayed, complained,
+    bounced (transient or undetermined), hard_bounced (permanent)
+
+Resend's ``opened`` and ``clicked`` are kept apart from the tracker's own
+``open`` and ``click`` so analytics don't count them twice.
+Recipients of ``hard_bounced`` and ``complained`` emails are stored in the
+suppressions table, by address, whether or not we tracked the email. The
+Suppressions list, which /send and /send_batch consult, is loaded from it.
+"""
+import time
+import hmac
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+EVENT_TYPES = {
+    "email.delivered": "delivered",
+    "email.opened": "opened",
+    "email.clicked": "clicked",
+    "email.delivery_delayed": "delayed",
+    "email.complained": "complained",
+    "email.bounced": "bounced",
+}
+SUPPRESSING = ("hard_bounced", "complained")
+
+
+class SignatureError(Exception):
+    pass
+
+
+def _key(secret):
+    return base64.b64decode(secret.split("_", 1)[1] if secret.startswith("whsec_") else secret)
+
+
+def sign(secret, msg_id, timestamp, body):
+    """svix-signature header value for `body` (bytes), as Resend would send it."""
+    content = f"{msg_id}.{timestamp}.".encode() + body
+    return "v1," + base64.b64encode(hmac.new(_key(secret), content, hashlib.sha256).digest()).decode()
+
+
+def verify(secret, headers, body, tolerance=300, now=None):
+    """Raise SignatureError unless `body` (bytes) carries a valid, fresh signature."""
+    msg_id, timestamp = headers.get("svix-id", ""), headers.get("svix-timestamp", "")
+    signatures = headers.get("svix-signature", "")
+    if not msg_id or not timestamp or not signatures:
+        raise SignatureError("missing svix headers")
+    try:
+        age = abs((now or time.time()) - int(timestamp))
+    except ValueError:
+        raise SignatureError("bad timestamp")
+    if age > tolerance:
+        raise SignatureError("timestamp outside tolerance")
+    expected = sign(secret, msg_id, timestamp, body)
+    if not any(hmac.compare_digest(expected, s) for s in signatures.split(" ")):
+        raise SignatureError("signature mismatch")
+
+
+def event_row(event):
+    """(resend_id, event_type, url, ip, user_agent, timestamp) for an event we keep, else None."""
+    kind = EVENT_TYPES.get(event.get("type"))
+    data = event.get("data") or {}
+    resend_id = data.get("email_id")
+    if not kind or not resend_id:
+        return None
+    url, ip, user_agent = None, "", ""
+    if kind == "bounced" and (data.get("bounce") or {}).get("type") == "Permanent":
+        kind = "hard_bounced"
+    elif kind == "clicked":
+        click = data.get("click") or {}
+        url, ip, user_agent = click.get("link"), click.get("ipAddress", ""), click.get("userAgent", "")
+    return resend_id, kind, url, ip, user_agent, event.get("created_at", "")
+
+
+def addresses(recipient):
+    """Normalised addresses from a recipient field ("a@x.com, B <b@y.com>" or a list of them)."""
+    if isinstance(recipient, (list, tuple)):
+        return [a for r in recipient for a in addresses(r)]
+    out = []
+    for part in recipient.split(",") if isinstance(recipient, str) else ():
+        part = part.strip()
+        if "<" in part and part.endswith(">"):
+            part = part[part.rindex("<") + 1:-1]
+        if part:
+            out.append(part.lower())
+    return out
+
+
+class RecentIds:
+    """Bounded set of recently seen webhook ids; add() is False for a repeat."""
+
+    def __init__(self, size=10000):
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = size
+
+    def add(self, msg_id):
+        with self._lock:
+            if msg_id in self._ids:
+                return False
+            self._ids[msg_id] = None
+            if len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+            return True
+
+    def discard(self, msg_id):
+        with self._lock:
+            self._ids.pop(msg_id, None)
+
+
+class Suppressions:
+    """Addresses not to send to. Reloaded with `load()` once `refresh` seconds old,
+    so bounces stored by other workers show up here within that time."""
+
+    def __init__(self, load, refresh=60):
+        self._load = load
+        self.refresh = refresh
+        self._addresses = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh:
+                    self._addresses = frozenset(a for r in self._load() for a in addresses(r))
+                    self._loaded_at = time.monotonic()
+        return self._addresses
+
+    def suppressed(self, recipients):
+        """The given addresses (strings or lists, as in a send request) that are suppressed."""
+        current = self._current()
+        return [a for r in recipients for a in addresses(r) if a in current]
+
+    def add(self, recipients):
+        """Suppress in this worker now, not at the next reload; the caller has stored them."""
+        new = {a for r in recipients for a in addresses(r)}
+        with self._lock:
+            self._addresses = self._addresses | new
+
+    def __len__(self):
+        return len(self._current())